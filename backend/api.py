@@ -1,12 +1,28 @@
 # api.py
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Form, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+from python_multipart.multipart import MultipartParser, parse_options_header
 import uvicorn
 import os
+import time
+import datetime
 from typing import Dict, Any, Optional
 import tempfile
 import json
+import uuid
+import hashlib
+
+from backend import metrics
+from backend.chat_archive import read_archived_history
+from backend.invalidation import invalidation_bus
+from backend.logging_setup import bind_log_context, get_logger, log_context
+from backend.llm_scheduler import BACKGROUND, INTERACTIVE, LLMOverloaded, llm_scheduler, scheduling_context
+from backend.singleflight import KeyedLocks, SingleFlight
+
+logger = get_logger(__name__)
 
 # 导入你的LLM模块 - 确保llm3.py在同一目录下
 try:
@@ -14,7 +30,11 @@ try:
     # 添加 llm 和 user_vector_store_exists 到主导入列表
     from backend.llm3_new import (
         TenantChatbot, 
+        create_user,
         create_user_vectorstore, 
+        get_contract_document,
+        get_tenant_profile,
+        tenant_has_contract,
         log_maintenance_request,
         log_user_feedback,
         get_db_connection,
@@ -25,9 +45,8 @@ try:
         get_db_conn
     )
     # --- 结束修复 3 ---
-    print("✅ Successfully imported all modules from llm3.py")
 except ImportError as e:
-    print(f"❌ Import error: {e}")
+    logger.error("Import error: %s", e)
     # 如果导入失败，尝试相对导入
     try:
         from .llm3 import (
@@ -39,9 +58,9 @@ except ImportError as e:
             user_vector_store_exists, # <-- 同样添加在这里
             llm                       # <-- 同样添加在这里
         )
-        print("✅ Successfully imported using relative import")
+        logger.info("Imported llm3 using relative import")
     except ImportError:
-        print("❌ Relative import also failed")
+        logger.error("Relative import also failed")
         raise
 
 # 初始化FastAPI应用
@@ -60,8 +79,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局变量存储聊天机器人实例
+# 全局变量存储聊天机器人实例（每个 worker 一份，可以随时从共享存储重建）
 chatbot_instances = {}
+invalidation_bus.subscribe(lambda tenant_id, kind: chatbot_instances.pop(tenant_id, None))
+
+# /chat 的按租户串行化和相同消息合并
+tenant_chat_locks = KeyedLocks()
+chat_inflight = SingleFlight()
+upload_inflight = SingleFlight()
+
+# 上传大小上限；超出时在读请求体之前（Content-Length）或边收边落盘的过程中返回 413
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+# multipart 边界和表单字段的余量
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+# /upload 自己解析 multipart 流，OpenAPI 里的表单结构在这里声明
+UPLOAD_REQUEST_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file", "tenant_id"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "tenant_id": {"type": "string"},
+            },
+        }}},
+    },
+}
+
+# /chat_history 每页最多返回的消息数
+MAX_HISTORY_PAGE = 500
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    # 关联 ID：优先沿用上游（负载均衡 / 前端）传来的 X-Request-ID
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    try:
+        with log_context(request_id=request_id):
+            response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        # 用路由模板而不是原始路径作为 label，避免 /chat_history/{tenant_id} 造成高基数
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        metrics.HTTP_REQUEST_LATENCY.labels(
+            method=request.method, endpoint=endpoint, status=str(status)
+        ).observe(time.perf_counter() - start)
 
 # ==================== 🎯 API端点 ====================
 
@@ -70,32 +140,27 @@ async def root():
     """健康检查端点"""
     return {"message": "Tenant Chatbot API is running!", "status": "healthy"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 抓取端点"""
+    return Response(content=metrics.render_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/user")
 async def get_user(email: str):
     """
     根据邮箱 (tenant_id) 获取用户信息
     """
     try:
-        conn = get_db_connection()
-        if not conn:
+        # 每次登录都要查：走进程内的租户缓存，注册 / 上传时失效
+        profile = await run_in_threadpool(get_tenant_profile, email)
+        if profile is None:
             raise HTTPException(status_code=500, detail="Database connection failed")
 
-        with conn.cursor() as cur:
-            # 使用 users 表，而非 tenants
-            cur.execute("""
-                SELECT tenant_id, user_name, tenant_id AS email
-                FROM users
-                WHERE tenant_id = %s
-            """, (email,))
-            user_data = cur.fetchone()
-
-        conn.close()
-
-        if user_data:
+        if profile["registered"]:
             return {
-                "user_id": user_data[0],
-                "name": user_data[1],
-                "email": user_data[2]
+                "user_id": profile["tenant_id"],
+                "name": profile["user_name"],
+                "email": profile["tenant_id"]
             }
         else:
             raise HTTPException(status_code=404, detail="User not found")
@@ -103,7 +168,7 @@ async def get_user(email: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in /user endpoint: {e}")
+        logger.error("Error in /user endpoint: %s", e)
         raise HTTPException(status_code=500, detail=f"Error fetching user: {str(e)}")
 
 @app.post("/register")
@@ -111,137 +176,347 @@ async def register_user(tenant_id: str = Form(...), user_name: str = Form(...)):
     """
     注册新用户（写入 users 表）
     """
-    conn = None
+    # 本请求内的所有日志都带上 tenant_id（每个请求在独立的 context 里运行）
+    bind_log_context(tenant_id=tenant_id)
     try:
-        conn = get_db_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-
-        with conn.cursor() as cur:
-            # 检查用户是否已存在
-            cur.execute("SELECT tenant_id FROM users WHERE tenant_id = %s", (tenant_id,))
-            if cur.fetchone():
-                return {"success": False, "message": "User already exists"}
-
-            # 插入用户
-            cur.execute("""
-                INSERT INTO users (tenant_id, user_name)
-                VALUES (%s, %s)
-            """, (tenant_id, user_name))
-            conn.commit()
+        # INSERT ... ON CONFLICT DO NOTHING：一次往返，并发注册也只有一个成功
+        if not await run_in_threadpool(create_user, tenant_id, user_name):
+            return {"success": False, "message": "User already exists"}
 
         return {"success": True, "message": "User registered successfully"}
 
     except Exception as e:
-        print(f"❌ Error in /register endpoint: {e}")
-        if conn:
-            conn.rollback()
+        logger.error("Error in /register endpoint: %s", e)
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
-    finally:
-        if conn:
-            conn.close()
-
-@app.post("/upload")
-async def upload_contract(
-    file: UploadFile = File(...),
-    tenant_id: str = Form(...)
-):
+@app.post("/upload", openapi_extra=UPLOAD_REQUEST_SCHEMA)
+async def upload_contract(request: Request):
     """
     上传并处理合同PDF文件 - 修复Guest用户支持
+
+    表单字段：``file``（PDF）和 ``tenant_id``。请求体边收边落盘，超过上限立即 413。
     """
     temp_path = None
     try:
-        print(f"📄 === 开始处理上传 ===")
-        print(f"📄 租户: {tenant_id}")
-        print(f"📄 文件名: {file.filename}")
-        print(f"📄 文件类型: {file.content_type}")
-        
-        if not file.filename.lower().endswith('.pdf'):
-            print("❌ 文件类型错误: 不是PDF")
-            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+        # 边收边写临时文件 + 增量哈希：不经过 Starlette 的 spool 文件，只落盘一次
+        upload = await _receive_upload(request)
+        temp_path = upload.path
+
+        tenant_id = upload.fields.get("tenant_id")
+        if not tenant_id:
+            raise HTTPException(status_code=422, detail="tenant_id is required")
+        bind_log_context(tenant_id=tenant_id)
+        if upload.filename is None:
+            raise HTTPException(status_code=422, detail="file is required")
+
+        content_sha256, size_bytes = upload.sha256, upload.size
+        logger.info("Upload received", extra={
+            "upload_filename": upload.filename, "content_type": upload.content_type,
+        })
         
-        content = await file.read()
-        print(f"📄 文件大小: {len(content)} bytes")
-        
-        if len(content) == 0:
-            print("❌ 文件内容为空")
+        if size_bytes == 0:
+            logger.warning("Upload rejected: empty file")
             raise HTTPException(status_code=400, detail="File is empty")
+
+        # 同一份 PDF 重复上传（Streamlit rerun / 重新选择文件）：直接返回已存的摘要
+        current = await run_in_threadpool(get_contract_document, tenant_id)
+        deduplicated = bool(
+            current
+            and current["content_sha256"] == content_sha256
+            and current["summary"] is not None
+            and user_vector_store_exists(tenant_id)
+        )
+        metrics.record_cache("upload_dedupe", deduplicated)
+        if deduplicated:
+            logger.info("Upload deduplicated", extra={"size_bytes": size_bytes, "sha256": content_sha256[:12]})
+            return {
+                "success": True,
+                "message": "Contract already processed",
+                "summary": current["summary"],
+                "deduplicated": True,
+            }
         
-        # --- 修复 6 ---
-        # 修正了上一版本中意外引入的中文句号 (。) 语法错误
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-        # --- 结束修复 6 ---
-            temp_file.write(content)
-            temp_path = temp_file.name
-        
-        print(f"📁 临时文件路径: {temp_path}")
-        
-        print("🔄 开始处理PDF和创建向量库...")
-        summary_data = create_user_vectorstore(tenant_id, temp_path)
+        upload_key = (tenant_id, content_sha256)
+        if upload_key not in upload_inflight:
+            # 本请求负责处理：临时文件交给任务删除，客户端断开时任务仍可读取
+            pdf_path, temp_path = temp_path, None
+
+            async def process():
+                try:
+                    # 合同解析属于后台任务：优先级低于 /chat，队列较满时先拒绝
+                    with llm_scheduler.admission(BACKGROUND), scheduling_context(tenant_id, BACKGROUND):
+                        return await run_in_threadpool(create_user_vectorstore, tenant_id, pdf_path, content_sha256)
+                finally:
+                    _remove_temp_file(pdf_path)
+        else:
+            process = None
+
+        # 同一文件的并发上传（双击）只处理一次
+        summary_data, shared = await upload_inflight.do(upload_key, process)
+        metrics.record_cache("upload_inflight", shared)
         
         if summary_data is None:
-            print("❌ PDF处理返回None")
+            logger.error("PDF processing returned None")
             raise HTTPException(status_code=500, detail="Failed to process PDF")
         
         if hasattr(summary_data, 'dict'):
             summary_data = summary_data.dict()
         
-        print(f"✅ PDF处理成功!")
-        print(f"📊 摘要数据: {summary_data}")
+        logger.info("Upload processed", extra={"size_bytes": size_bytes})
         
         return {
             "success": True,
             "message": "Contract processed successfully",
-            "summary": summary_data
+            "summary": summary_data,
+            "deduplicated": False,
         }
         
+    except HTTPException:
+        raise
+    except LLMOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
-        print(f"❌ 上传处理失败: {e}")
-        import traceback
-        print(f"🔍 完整错误: {traceback.format_exc()}")
+        logger.exception("Upload failed")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
     finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-                print(f"🧹 已清理临时文件: {temp_path}")
-            except Exception as e:
-                print(f"⚠️ 清理临时文件失败: {e}")
+        if temp_path:
+            _remove_temp_file(temp_path)
 
-@app.post("/chat")
-async def chat_with_bot(
-    tenant_id: str = Form(...),
-    message: str = Form(...)
-):
+class _UploadSpool:
+    """
+    Incremental parser for the ``/upload`` multipart body.
+
+    The ``file`` part is hashed and written straight to a temp PDF as it arrives
+    (buffered up to ``UPLOAD_CHUNK_BYTES``); other parts are kept as text fields.
+    Problems found mid-stream (not a PDF, over the cap) are stored in ``error`` so
+    the caller can stop reading the body right away.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.path: Optional[str] = None
+        self.size = 0
+        self.error: Optional[HTTPException] = None
+        self._digest = hashlib.sha256()
+        self._file = None
+        self._pending = bytearray()
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part: Optional[str] = None  # "file" / 表单字段名 / None（忽略）
+        self._value = bytearray()
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def feed(self, chunk: bytes) -> None:
+        self._parser.write(chunk)
+
+    def finish(self) -> None:
+        self._parser.finalize()
+
+    @property
+    def pending_bytes(self) -> int:
+        return len(self._pending)
+
+    def take_pending(self) -> bytes:
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
+
+    def write(self, data: bytes) -> None:
+        if data:
+            self._file.write(data)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+    def discard(self) -> None:
+        self.close()
+        if self.path:
+            _remove_temp_file(self.path)
+            self.path = None
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._part = None
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if b"filename" not in options:
+            self._part = name
+            return
+        if name != "file" or self.filename is not None:
+            return
+        self.filename = options[b"filename"].decode("utf-8", errors="replace")
+        self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+        if not self.filename.lower().endswith(".pdf"):
+            logger.warning("Upload rejected: not a PDF")
+            self.error = HTTPException(status_code=400, detail="Only PDF files are allowed")
+            return
+        self._file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+        self.path = self._file.name
+        self._part = "file"
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part == "file":
+            self.size += end - start
+            if self.size > MAX_UPLOAD_BYTES:
+                self.error = self.error or _too_large()
+                return
+            self._digest.update(data[start:end])
+            self._pending += data[start:end]
+        elif self._part is not None:
+            self._value += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._part not in (None, "file"):
+            self.fields[self._part] = self._value.decode("utf-8", errors="replace")
+        self._part = None
+
+async def _receive_upload(request: Request) -> _UploadSpool:
+    """
+    Stream the ``/upload`` body into an ``_UploadSpool``, enforcing ``MAX_UPLOAD_BYTES``.
+
+    The cap is checked against the declared ``Content-Length`` before reading and
+    against the bytes actually received while streaming, so chunked uploads stop at
+    the cap too. On any error the partial temp file is removed.
+    """
+    body_cap = MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > body_cap:
+        raise _too_large()
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    upload = _UploadSpool(params[b"boundary"])
+    received = 0
     try:
-        print(f"💬 Chat request from {tenant_id}: {message}")
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_cap:
+                raise _too_large()
+            upload.feed(chunk)
+            if upload.error is not None:
+                raise upload.error
+            if upload.pending_bytes >= UPLOAD_CHUNK_BYTES:
+                await run_in_threadpool(upload.write, upload.take_pending())
+        upload.finish()
+        if upload.path:
+            await run_in_threadpool(upload.write, upload.take_pending())
+        upload.close()
+    except BaseException:
+        upload.discard()
+        raise
+    return upload
+
+def _remove_temp_file(path: str) -> None:
+    if os.path.exists(path):
+        try:
+            os.unlink(path)
+        except Exception as e:
+            logger.warning("Failed to remove temp file: %s", e)
+
+def _too_large() -> HTTPException:
+    logger.warning("Upload rejected: too large", extra={"max_upload_bytes": MAX_UPLOAD_BYTES})
+    return HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+
+def _overloaded(exc: LLMOverloaded) -> HTTPException:
+    logger.warning("LLM queue full, rejecting request", extra={
+        "priority": exc.priority, "pending": exc.pending, "retry_after": exc.retry_after,
+    })
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
-        # 保存用户信息
-        save_user_message(tenant_id, message)
 
-        # 如果没有 bot 实例则创建
-        if tenant_id not in chatbot_instances:
-            chatbot_instances[tenant_id] = TenantChatbot(llm, tenant_id)
-            print(f"🆕 Created new chatbot instance for {tenant_id}")
+def _run_chat_turn(tenant_id: str, message: str) -> Dict[str, Any]:
+    """一轮完整的对话（阻塞调用，在线程池里执行）"""
+    # 保存用户信息
+    save_user_message(tenant_id, message)
 
-        chatbot = chatbot_instances[tenant_id]
+    # 如果没有 bot 实例则创建
+    cached = tenant_id in chatbot_instances
+    metrics.record_cache("chatbot_instances", cached)
+    if not cached:
+        chatbot_instances[tenant_id] = TenantChatbot(llm, tenant_id)
 
-        # 生成回复
+    chatbot = chatbot_instances[tenant_id]
+
+    # 生成回复（本轮的 LLM 调用按 interactive 优先级调度）
+    with scheduling_context(tenant_id, INTERACTIVE):
         response = chatbot.process_query(message, tenant_id)
-        print("🤖 Bot response:", response)
+    logger.debug("Bot response", extra={"reply": response})
 
-        # 保存回复
-        save_assistant_message(tenant_id, response)
+    # 保存回复
+    save_assistant_message(tenant_id, response)
+
+    return {
+        "reply": response,
+        "tenant_id": tenant_id,
+        "has_contract": tenant_has_contract(tenant_id)
+    }
 
-        return {
-            "reply": response,
-            "tenant_id": tenant_id,
-            "has_contract": user_vector_store_exists(tenant_id)
-        }
 
+@app.post("/chat")
+async def chat_with_bot(
+    tenant_id: str = Form(...),
+    message: str = Form(...)
+):
+    bind_log_context(tenant_id=tenant_id)
+    try:
+        logger.info("Chat request", extra={"message_chars": len(message)})
+
+        async def run_turn():
+            # 同一租户的请求串行执行：历史按顺序读写，bot 实例只创建一次；
+            # 不同租户互不等待，阻塞的 LLM / DB 调用放到线程池，不占用事件循环。
+            # LLM 队列已满时直接 503，不再写入历史、不再排队
+            with llm_scheduler.admission(INTERACTIVE):
+                async with tenant_chat_locks.hold(tenant_id):
+                    return await run_in_threadpool(_run_chat_turn, tenant_id, message)
+
+        # 同一租户正在处理的相同消息（例如重复点击发送）直接共享那一次的结果
+        result, shared = await chat_inflight.do((tenant_id, message.strip()), run_turn)
+        metrics.record_cache("chat_inflight", shared)
+        if shared:
+            logger.info("Coalesced duplicate chat request")
+        return dict(result)
+
+    except LLMOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
-        print("❌ Error in /chat:", e)
+        metrics.record_error("api_chat")
+        logger.exception("Error in /chat")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -254,8 +529,9 @@ async def submit_maintenance_request(
     """
     提交维修请求
     """
+    bind_log_context(tenant_id=tenant_id)
     try:
-        print(f"🛠️ Maintenance request from {tenant_id}: {location} - {description}")
+        logger.info("Maintenance request", extra={"location": location})
         request_id = log_maintenance_request(tenant_id, location, description)
         
         if request_id:
@@ -270,7 +546,7 @@ async def submit_maintenance_request(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in /maintenance endpoint: {e}")
+        logger.exception("Error in /maintenance endpoint")
         raise HTTPException(status_code=500, detail=f"Maintenance request failed: {str(e)}")
 
 @app.post("/feedback")
@@ -284,8 +560,9 @@ async def submit_feedback(
     """
     提交用户反馈
     """
+    bind_log_context(tenant_id=tenant_id)
     try:
-        print(f"⭐ Feedback from {tenant_id}: rating={rating}")
+        logger.info("Feedback received", extra={"rating": rating})
         success = log_user_feedback(tenant_id, query, response, rating, comment)
         
         if success:
@@ -294,40 +571,91 @@ async def submit_feedback(
             return {"success": False, "message": "Failed to submit feedback"}
             
     except Exception as e:
-        print(f"❌ Error in /feedback endpoint: {e}")
+        logger.exception("Error in /feedback endpoint")
         raise HTTPException(status_code=500, detail=f"Feedback submission failed: {str(e)}")
 
 @app.get("/chat_history/{tenant_id}")
-async def chat_history(tenant_id: str):
+async def chat_history(
+    tenant_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_PAGE),
+    before: Optional[str] = None,
+):
+    """
+    完整历史（不带参数，兼容旧前端），或分页：``limit`` 条早于 ``before`` 游标的最新消息，
+    按时间正序返回；``next_before`` 用来加载更早的一页，没有更多时为 None。
+    """
+    bind_log_context(tenant_id=tenant_id)
+    cursor = _parse_history_cursor(before)
     try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT message_type, message_content, created_at
-            FROM chat_history
-            WHERE tenant_id = %s
-            ORDER BY created_at ASC
-        """, (tenant_id,))
-
-        rows = cur.fetchall()
-
-        cur.close()
+        rows, next_before = await run_in_threadpool(_chat_history_page, tenant_id, limit, cursor)
+    except Exception as e:
+        logger.error("Error loading chat history: %s", e)
+        return {"history": [], "next_before": None}
+
+    history = []
+    for message_type, message_content, ts, message_id in rows:
+        history.append({
+            "id": message_id,
+            "role": "assistant" if message_type == "ai" else "user",
+            "content": message_content,
+            "timestamp": ts.isoformat() if ts else None
+        })
+    return {"history": history, "next_before": next_before}
+
+def _parse_history_cursor(before: Optional[str]):
+    if not before:
+        return None
+    try:
+        ts, message_id = before.rsplit(",", 1)
+        return datetime.datetime.fromisoformat(ts), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
+def _chat_history_page(tenant_id: str, limit: Optional[int], before):
+    """``(rows, next_before)``; rows are ``(message_type, content, created_at, id)``, oldest first."""
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            if limit is None:
+                cur.execute("""
+                    SELECT message_type, message_content, created_at, id
+                    FROM chat_history
+                    WHERE tenant_id = %s
+                    ORDER BY created_at ASC, id ASC
+                """, (tenant_id,))
+            elif before is None:
+                cur.execute("""
+                    SELECT message_type, message_content, created_at, id
+                    FROM chat_history
+                    WHERE tenant_id = %s
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, (tenant_id, limit + 1))
+            else:
+                # (created_at, id) 行比较：走 (tenant_id, created_at) 索引，并裁剪掉更新的分区
+                cur.execute("""
+                    SELECT message_type, message_content, created_at, id
+                    FROM chat_history
+                    WHERE tenant_id = %s AND created_at <= %s AND (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, (tenant_id, before[0], before[0], before[1], limit + 1))
+            rows = cur.fetchall()
+    finally:
         conn.close()
 
-        history = []
-        for message_type, message_content, ts in rows:
-            history.append({
-                "role": "assistant" if message_type == "ai" else "user",
-                "content": message_content,
-                "timestamp": ts.isoformat() if ts else None
-            })
+    # 超过保留期的月份已经从 Postgres 归档成 Parquet，都比库里的消息更早
+    if limit is None:
+        return read_archived_history(tenant_id) + rows, None
 
-        return {"history": history}
-
-    except Exception as e:
-        print(f"❌ Error loading chat history: {e}")
-        return {"history": []}
+    rows.reverse()
+    if len(rows) <= limit:
+        archive_before = (rows[0][2], rows[0][3]) if rows else before
+        rows = read_archived_history(tenant_id, before=archive_before, limit=limit + 1 - len(rows)) + rows
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[-limit:]
+    return rows, f"{rows[0][2].isoformat()},{rows[0][3]}"
 
 # ==================== 🎯 错误处理 ====================
 
@@ -335,15 +663,14 @@ async def chat_history(tenant_id: str):
 async def http_exception_handler(request, exc):
     return JSONResponse(
         status_code=exc.status_code,
-        content={"success": False, "error": exc.detail}
+        content={"success": False, "error": exc.detail},
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
-    print(f"🚨 Unhandled exception: {exc}")
-    # 打印更详细的错误
-    import traceback
-    print(f"🔍 完整错误: {traceback.format_exc()}")
+    metrics.record_error("unhandled")
+    logger.error("Unhandled exception: %s", exc, exc_info=exc)
     return JSONResponse(
         status_code=500,
         content={"success": False, "error": "Internal server error"}
@@ -0,0 +1,282 @@
+# backend/bulk_ingest.py
+"""
+Bulk contract onboarding: ingest many tenants' PDFs in one run.
+
+    python -m backend.bulk_ingest --dir contracts/            # <tenant_id>.pdf per tenant
+    python -m backend.bulk_ingest --manifest building_a.csv   # tenant_id,pdf_path columns (or .jsonl)
+
+Pipeline:
+
+1. PDF parsing + chunking runs in a process pool (``--workers``), outside the GIL.
+2. Chunks from several tenants are embedded together, ``--embed-batch`` texts per
+   ``embed_documents`` call, instead of one call per tenant.
+3. Each tenant's store is written with the pre-computed vectors and the contract
+   summary is extracted (``index_contract``) on ``--llm-concurrency`` threads.
+4. The run then waits for the background FAQ answers (``backend/contract_faq.py``,
+   about a dozen LLM calls per tenant) and reports that time as part of the run.
+   ``--skip-faqs`` leaves them out; those tenants' FAQ questions go through RAG.
+
+Every finished or failed tenant is appended to the ``--checkpoint`` file. Re-running the
+same command skips tenants already done with the same file contents (sha256) and retries
+the failed ones, so an interrupted run resumes where it stopped.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from backend.contract_chunking import split_contract_pdf
+from backend.logging_setup import get_logger, log_context
+
+logger = get_logger(__name__)
+
+DEFAULT_CHECKPOINT = "bulk_ingest.checkpoint.jsonl"
+EMBED_BATCH_TEXTS = int(os.getenv("BULK_INGEST_EMBED_BATCH", "512"))
+# 每个解析进程最多排队的 PDF 数，控制已解析未嵌入的 chunk 占用的内存
+PARSE_QUEUE_PER_WORKER = 4
+
+Job = Tuple[str, str]  # (tenant_id, pdf_path)
+
+
+# === Inputs ===
+def jobs_from_dir(directory: str) -> List[Job]:
+    """``<tenant_id>.pdf`` files, e.g. ``alice@example.com.pdf``."""
+    return [
+        (name[:-4], os.path.join(directory, name))
+        for name in sorted(os.listdir(directory))
+        if name.lower().endswith(".pdf")
+    ]
+
+
+def jobs_from_manifest(path: str) -> List[Job]:
+    """CSV with ``tenant_id,pdf_path`` columns or JSONL objects; relative paths are relative to the manifest."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [(row["tenant_id"].strip(), os.path.join(base, row["pdf_path"].strip())) for row in rows]
+
+
+# === Checkpoint ===
+class Checkpoint:
+    """Append-only JSONL of per-tenant outcomes; the last record for a tenant wins."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 上次中断时写了一半的行
+                    if record.get("status") == "done":
+                        self.done[record["tenant_id"]] = record["sha256"]
+                    else:
+                        self.done.pop(record.get("tenant_id"), None)
+
+    def is_done(self, tenant_id: str, sha256: str) -> bool:
+        return self.done.get(tenant_id) == sha256
+
+    def record(self, tenant_id: str, sha256: Optional[str], status: str, **fields) -> None:
+        line = json.dumps({"tenant_id": tenant_id, "sha256": sha256, "status": status, "at": time.time(), **fields})
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if status == "done":
+                self.done[tenant_id] = sha256
+
+
+# === Worker process ===
+def _parse(tenant_id: str, pdf_path: str) -> Tuple[str, List[Document]]:
+    return tenant_id, split_contract_pdf(pdf_path)
+
+
+# === Run ===
+class BulkIngest:
+    def __init__(self, checkpoint: Checkpoint, workers: int, embed_batch: int, llm_concurrency: int,
+                 generate_faqs: bool = True):
+        # 延迟导入：解析进程（spawn）只导入本模块，不初始化 OpenAI / 数据库
+        from backend import llm3_new
+
+        self.llm3 = llm3_new
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.embed_batch = embed_batch
+        self.llm_concurrency = llm_concurrency
+        self.generate_faqs = generate_faqs
+        self.report = {"tenants": 0, "skipped": 0, "ingested": 0, "failed": 0, "chunks": 0, "embed_calls": 0,
+                       "faq_seconds": 0.0}
+        self.failures: List[Tuple[str, str]] = []
+        self._hashes: Dict[str, str] = {}
+        self._pending: List[Tuple[str, List[Document]]] = []
+        self._pending_chunks = 0
+        self._indexing: List[Future] = []
+        self._lock = threading.Lock()
+
+    def run(self, jobs: List[Job]) -> dict:
+        started = time.perf_counter()
+        self.report["tenants"] = len(jobs)
+        todo = []
+        for tenant_id, path in jobs:
+            try:
+                sha = self.llm3.hash_file(path)
+            except OSError as e:
+                self._fail(tenant_id, None, f"unreadable: {e}")
+                continue
+            if self.checkpoint.is_done(tenant_id, sha):
+                self.report["skipped"] += 1
+                continue
+            self._hashes[tenant_id] = sha
+            todo.append((tenant_id, path))
+        print(f"🔎 {len(jobs)} contracts: {self.report['skipped']} already ingested, {len(todo)} to go")
+
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as parse_pool, \
+                ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix="bulk-index") as index_pool:
+            self._index_pool = index_pool
+            queue = iter(todo)
+            parsing: Dict[Future, str] = {}
+            while True:
+                while len(parsing) < self.workers * PARSE_QUEUE_PER_WORKER:
+                    job = next(queue, None)
+                    if job is None:
+                        break
+                    parsing[parse_pool.submit(_parse, *job)] = job[0]
+                if not parsing:
+                    break
+                finished, _ = wait(parsing, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    tenant_id = parsing.pop(future)
+                    try:
+                        self._add(*future.result())
+                    except Exception as e:
+                        self._fail(tenant_id, self._hashes.get(tenant_id), f"parse: {e}")
+                self._progress(len(todo))
+            self._flush()
+            wait(self._indexing)
+
+        if self.generate_faqs and self.report["ingested"]:
+            # FAQ 任务在单独的后台线程池里排队；不等它们，进程退出时会卡在线程池 join 上
+            print(f"⏳ Generating FAQ answers for {self.report['ingested']} contracts …")
+            faq_started = time.perf_counter()
+            self.llm3.contract_faq.wait_idle()
+            self.report["faq_seconds"] = round(time.perf_counter() - faq_started, 2)
+
+        seconds = time.perf_counter() - started
+        self.report["seconds"] = round(seconds, 2)
+        self.report["contracts_per_s"] = round(self.report["ingested"] / seconds, 2) if seconds else 0.0
+        self.report["chunks_per_s"] = round(self.report["chunks"] / seconds, 1) if seconds else 0.0
+        self._print_report()
+        return self.report
+
+    def _add(self, tenant_id: str, splits: List[Document]) -> None:
+        self._pending.append((tenant_id, splits))
+        self._pending_chunks += len(splits)
+        if self._pending_chunks >= self.embed_batch:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Embed every buffered tenant's chunks in one call, then index each tenant."""
+        batch, self._pending, self._pending_chunks = self._pending, [], 0
+        if not batch:
+            return
+        texts = [d.page_content for _, splits in batch for d in splits]
+        try:
+            vectors = self.llm3.embeddings.embed_documents(texts) if texts else []
+            self.report["embed_calls"] += 1
+        except Exception as e:
+            for tenant_id, _ in batch:
+                self._fail(tenant_id, self._hashes.get(tenant_id), f"embed: {e}")
+            return
+        offset = 0
+        for tenant_id, splits in batch:
+            tenant_vectors = vectors[offset:offset + len(splits)]
+            offset += len(splits)
+            self._indexing.append(self._index_pool.submit(self._index, tenant_id, splits, tenant_vectors))
+        # 抽取（LLM）比嵌入慢时在这里等一等，避免已嵌入的向量在内存里越积越多
+        while sum(not f.done() for f in self._indexing) > self.llm_concurrency * 2:
+            wait(self._indexing, return_when=FIRST_COMPLETED)
+        self._indexing = [f for f in self._indexing if not f.done()]
+
+    def _index(self, tenant_id: str, splits: List[Document], vectors: List[List[float]]) -> None:
+        from backend.llm_scheduler import BACKGROUND, scheduling_context
+
+        sha = self._hashes.get(tenant_id)
+        try:
+            with log_context(tenant_id=tenant_id), scheduling_context(tenant_id, BACKGROUND):
+                summary = self.llm3.index_contract(tenant_id, splits, sha, vectors, self.generate_faqs)
+        except Exception as e:
+            logger.exception("Bulk ingest failed", extra={"tenant_id": tenant_id})
+            self._fail(tenant_id, sha, f"index: {e}")
+            return
+        self.checkpoint.record(tenant_id, sha, "done", chunks=len(splits), summary_fields=len(summary or {}))
+        with self._lock:
+            self.report["ingested"] += 1
+            self.report["chunks"] += len(splits)
+
+    def _fail(self, tenant_id: str, sha: Optional[str], error: str) -> None:
+        self.checkpoint.record(tenant_id, sha, "failed", error=error[:500])
+        with self._lock:
+            self.report["failed"] += 1
+            self.failures.append((tenant_id, error))
+
+    def _progress(self, total: int) -> None:
+        done = self.report["ingested"] + self.report["failed"]
+        if done and done % 50 == 0:
+            print(f"… {done}/{total} contracts processed")
+
+    def _print_report(self) -> None:
+        r = self.report
+        print(
+            f"✅ Bulk ingest finished: {r['ingested']} ingested, {r['skipped']} skipped, {r['failed']} failed "
+            f"of {r['tenants']} in {r['seconds']}s ({r['contracts_per_s']} contracts/s, "
+            f"{r['chunks_per_s']} chunks/s, {r['embed_calls']} embedding calls)"
+        )
+        if self.generate_faqs:
+            print(f"   of which {r['faq_seconds']}s waiting for FAQ answers (--skip-faqs to leave them out)")
+        for tenant_id, error in self.failures:
+            print(f"❌ {tenant_id}: {error}")
+        if self.failures:
+            print(f"Re-run the same command to retry the {len(self.failures)} failed contract(s).")
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory of <tenant_id>.pdf files")
+    source.add_argument("--manifest", help="CSV (tenant_id,pdf_path) or JSONL manifest")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF parsing processes")
+    parser.add_argument("--embed-batch", type=int, default=EMBED_BATCH_TEXTS, help="Texts per embedding call")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="Tenants indexed / summarised at once")
+    parser.add_argument("--skip-faqs", action="store_true",
+                        help="Don't pre-generate FAQ answers (about 12 LLM calls per tenant)")
+    args = parser.parse_args()
+
+    jobs = jobs_from_dir(args.dir) if args.dir else jobs_from_manifest(args.manifest)
+    runner = BulkIngest(Checkpoint(args.checkpoint), args.workers, args.embed_batch, args.llm_concurrency,
+                        generate_faqs=not args.skip_faqs)
+    report = runner.run(jobs)
+    raise SystemExit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
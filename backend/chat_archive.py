@@ -0,0 +1,316 @@
+# backend/chat_archive.py
+"""
+Monthly partitions, retention and Parquet archival for ``chat_history``.
+
+- ``chat_history`` is RANGE-partitioned on ``created_at``: one partition per month
+  (``chat_history_pYYYYMM``) plus a DEFAULT partition that should stay empty.
+- ``ensure_partitions`` creates this month's partition and the next
+  ``CHAT_PARTITION_MONTHS_AHEAD``; it runs at API start-up and in ``maintain``.
+- ``archive_expired_partitions`` writes every partition older than
+  ``CHAT_RETENTION_MONTHS`` to ``CHAT_ARCHIVE_DIR/month=YYYY-MM/chat_history.parquet``
+  (zstd, sorted by tenant so row-group statistics skip other tenants), checks the row
+  count, then detaches and drops the partition.
+- ``read_archived_history`` lets ``/chat_history`` keep serving archived months.
+
+    python -m backend.chat_archive migrate    # one-off: convert the old unpartitioned table
+    python -m backend.chat_archive maintain   # daily cron: create partitions + archive expired ones
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import re
+from typing import Any, Iterator, List, Optional, Tuple
+
+from backend.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "chat_history_archive"))
+RETENTION_MONTHS = int(os.getenv("CHAT_RETENTION_MONTHS", "12"))
+MONTHS_AHEAD = int(os.getenv("CHAT_PARTITION_MONTHS_AHEAD", "3"))
+# 记忆窗口只看最近这么多天的消息，查询只会命中最近的几个分区
+MEMORY_LOOKBACK_DAYS = int(os.getenv("CHAT_MEMORY_LOOKBACK_DAYS", "90"))
+
+ARCHIVE_FILENAME = "chat_history.parquet"
+ARCHIVE_BATCH_ROWS = 50_000
+PARTITION_NAME = re.compile(r"^chat_history_p(\d{4})(\d{2})$")
+COLUMNS = ("id", "tenant_id", "message_type", "message_content", "created_at")
+
+CHAT_HISTORY_DDL = """
+CREATE TABLE IF NOT EXISTS chat_history (
+    id SERIAL,
+    tenant_id TEXT NOT NULL,
+    message_type TEXT CHECK (message_type IN ('human','ai')),
+    message_content TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+"""
+CHAT_HISTORY_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS chat_history_tenant_created_idx ON chat_history (tenant_id, created_at);"
+)
+DEFAULT_PARTITION_DDL = "CREATE TABLE IF NOT EXISTS chat_history_default PARTITION OF chat_history DEFAULT;"
+
+
+# === Months ===
+def _month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def _add_months(month: datetime.date, n: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _utc_today() -> datetime.date:
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"chat_history_p{month:%Y%m}"
+
+
+def memory_lookback_cutoff() -> datetime.datetime:
+    """Lower ``created_at`` bound for memory-window queries (lets Postgres prune old partitions)."""
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return now - datetime.timedelta(days=MEMORY_LOOKBACK_DAYS)
+
+
+# === Partitions ===
+def _create_partition(cur, month: datetime.date) -> None:
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF chat_history "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}');"
+    )
+
+
+def ensure_partitions(conn, months_ahead: int = MONTHS_AHEAD, today: Optional[datetime.date] = None) -> None:
+    """Create the current month's partition and the next ``months_ahead`` (idempotent)."""
+    first = _month_start(today or _utc_today())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(DEFAULT_PARTITION_DDL)
+            for n in range(months_ahead + 1):
+                _create_partition(cur, _add_months(first, n))
+        conn.commit()
+    except Exception as e:
+        # 旧的未分区表（需要先 migrate），或另一个 worker 同时在建
+        conn.rollback()
+        logger.warning("Could not create chat_history partitions (run `python -m backend.chat_archive migrate` "
+                       "if the table is not partitioned yet): %s", e)
+
+
+def list_partitions(conn) -> List[Tuple[str, datetime.date]]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'chat_history'::regclass;
+            """
+        )
+        names = [row[0] for row in cur.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime.date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def migrate_to_partitioned(conn, keep_old: bool = False) -> int:
+    """Convert an unpartitioned ``chat_history`` in one transaction. Returns the rows copied."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('chat_history');")
+        row = cur.fetchone()
+        if row and row[0] == "p":
+            logger.info("chat_history is already partitioned")
+            return 0
+
+        if row:
+            cur.execute("LOCK TABLE chat_history IN ACCESS EXCLUSIVE MODE;")
+            cur.execute("ALTER TABLE chat_history RENAME TO chat_history_unpartitioned;")
+            # 新表会再建同名的序列和索引，旧的先让开
+            cur.execute("ALTER SEQUENCE IF EXISTS chat_history_id_seq RENAME TO chat_history_unpartitioned_id_seq;")
+            cur.execute("ALTER INDEX IF EXISTS chat_history_pkey RENAME TO chat_history_unpartitioned_pkey;")
+            cur.execute("ALTER INDEX IF EXISTS chat_history_tenant_created_idx "
+                        "RENAME TO chat_history_unpartitioned_tenant_created_idx;")
+            cur.execute("SELECT MIN(created_at) FROM chat_history_unpartitioned;")
+            oldest = cur.fetchone()[0]
+        else:
+            oldest = None
+
+        cur.execute(CHAT_HISTORY_DDL)
+        cur.execute(CHAT_HISTORY_INDEX_DDL)
+        cur.execute(DEFAULT_PARTITION_DDL)
+        month = _month_start(oldest.date() if oldest else _utc_today())
+        last = _add_months(_month_start(_utc_today()), MONTHS_AHEAD)
+        while month <= last:
+            _create_partition(cur, month)
+            month = _add_months(month, 1)
+
+        copied = 0
+        if row:
+            cur.execute(
+                """
+                INSERT INTO chat_history (id, tenant_id, message_type, message_content, created_at)
+                SELECT id, tenant_id, message_type, message_content, COALESCE(created_at, NOW())
+                FROM chat_history_unpartitioned;
+                """
+            )
+            copied = cur.rowcount
+            cur.execute("SELECT setval('chat_history_id_seq', COALESCE((SELECT MAX(id) FROM chat_history), 0) + 1, false);")
+            if not keep_old:
+                cur.execute("DROP TABLE chat_history_unpartitioned;")
+    conn.commit()
+    logger.info("chat_history migrated to monthly partitions", extra={"rows": copied, "kept_old_table": keep_old})
+    return copied
+
+
+# === Archival ===
+def archive_path(month: datetime.date, archive_dir: str = ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, f"month={month:%Y-%m}", ARCHIVE_FILENAME)
+
+
+def _iter_batches(conn, partition: str) -> Iterator[List[Tuple[Any, ...]]]:
+    # 服务端游标：一个月的数据不必一次读进内存
+    with conn.cursor(name=f"archive_{partition}") as cur:
+        cur.itersize = ARCHIVE_BATCH_ROWS
+        cur.execute(f"SELECT {', '.join(COLUMNS)} FROM {partition} ORDER BY tenant_id, created_at, id;")
+        while True:
+            rows = cur.fetchmany(ARCHIVE_BATCH_ROWS)
+            if not rows:
+                return
+            yield rows
+
+
+def _write_parquet(conn, partition: str, path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("tenant_id", pa.string()),
+        ("message_type", pa.string()),
+        ("message_content", pa.string()),
+        ("created_at", pa.timestamp("us")),
+    ])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 以 "." 开头：写到一半（或进程崩溃留下）的文件不会被 read_archived_history 当成数据读
+    staging = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp-{os.getpid()}")
+    rows_written = 0
+    try:
+        with pq.ParquetWriter(staging, schema, compression="zstd") as writer:
+            for rows in _iter_batches(conn, partition):
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)],
+                                                        schema=schema))
+                rows_written += len(rows)
+        os.replace(staging, path)
+    except BaseException:
+        if os.path.exists(staging):
+            os.unlink(staging)
+        raise
+    return rows_written
+
+
+def archive_partition(conn, partition: str, month: datetime.date, archive_dir: str = ARCHIVE_DIR) -> int:
+    """Write one partition to Parquet, verify it, then detach and drop it. Returns the rows archived."""
+    import pyarrow.parquet as pq
+
+    path = archive_path(month, archive_dir)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {partition};")
+        expected = cur.fetchone()[0]
+    written = _write_parquet(conn, partition, path)
+    conn.commit()  # 结束服务端游标所在的事务
+    if written != expected or pq.read_metadata(path).num_rows != expected:
+        raise RuntimeError(f"Archive of {partition} has {written} rows, expected {expected}; partition kept")
+
+    with conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE chat_history DETACH PARTITION {partition};")
+        cur.execute(f"DROP TABLE {partition};")
+    conn.commit()
+    logger.info("Archived chat_history partition", extra={"partition": partition, "rows": written, "path": path})
+    return written
+
+
+def archive_expired_partitions(conn, retention_months: int = RETENTION_MONTHS, archive_dir: str = ARCHIVE_DIR,
+                               today: Optional[datetime.date] = None) -> List[str]:
+    """Archive every monthly partition that ended more than ``retention_months`` ago."""
+    cutoff = _add_months(_month_start(today or _utc_today()), -retention_months)
+    archived = []
+    for partition, month in list_partitions(conn):
+        if _add_months(month, 1) <= cutoff:
+            archive_partition(conn, partition, month, archive_dir)
+            archived.append(partition)
+    return archived
+
+
+def read_archived_history(
+    tenant_id: str,
+    archive_dir: str = ARCHIVE_DIR,
+    before: Optional[Tuple[datetime.datetime, int]] = None,
+    limit: Optional[int] = None,
+) -> List[Tuple[str, str, datetime.datetime, int]]:
+    """
+    ``(message_type, message_content, created_at, id)`` rows of a tenant from the archive,
+    oldest first. With ``before=(created_at, id)`` / ``limit`` only the newest ``limit``
+    rows older than that cursor are returned (``/chat_history`` paging).
+    """
+    if not os.path.isdir(archive_dir) or not any(n.startswith("month=") for n in os.listdir(archive_dir)):
+        return []
+    import pyarrow.dataset as ds
+
+    condition = ds.field("tenant_id") == tenant_id
+    if before is not None:
+        ts, message_id = before
+        condition = condition & (
+            (ds.field("created_at") < ts) | ((ds.field("created_at") == ts) & (ds.field("id") < message_id))
+        )
+    # 跳过暂存文件和其他非 Parquet 文件，否则一个残留文件就让所有租户的归档读取失败
+    dataset = ds.dataset(archive_dir, format="parquet", partitioning="hive",
+                         ignore_prefixes=[".", "_"], exclude_invalid_files=True)
+    table = dataset.to_table(
+        columns=["message_type", "message_content", "created_at", "id"],
+        filter=condition,
+    ).sort_by([("created_at", "ascending"), ("id", "ascending")])
+    if limit is not None and table.num_rows > limit:
+        table = table.slice(table.num_rows - limit)
+    return list(zip(
+        table.column("message_type").to_pylist(),
+        table.column("message_content").to_pylist(),
+        table.column("created_at").to_pylist(),
+        table.column("id").to_pylist(),
+    ))
+
+
+def main() -> None:
+    import psycopg2
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "maintain"])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    parser.add_argument("--keep-old", action="store_true", help="migrate: keep chat_history_unpartitioned")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        if args.command == "migrate":
+            migrate_to_partitioned(conn, keep_old=args.keep_old)
+        else:
+            ensure_partitions(conn)
+            archived = archive_expired_partitions(conn, args.retention_months, args.archive_dir)
+            logger.info("Chat history maintenance done", extra={"archived_partitions": archived})
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
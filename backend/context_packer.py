@@ -0,0 +1,214 @@
+# backend/context_packer.py
+"""
+Token-budgeted context packing for the RAG prompt.
+
+The retriever returns overlapping chunks (chunk_overlap=200), so joining every
+``page_content`` repeats text and the prompt size is unbounded. ``pack_context``
+merges overlapping / adjacent chunks, drops near-duplicates and fills a token
+budget in relevance order.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 不可用时退化为字符估算
+    tiktoken = None
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# 合并时认为两段文本"相邻"的最大间隔（字符数，通常只是被 splitter 去掉的空白）
+ADJACENT_GAP_CHARS = 5
+# 无 start_index 元数据时，文本重叠至少要这么长才合并
+MIN_TEXT_OVERLAP_CHARS = 40
+# 近似重复判定：词级 shingle 的 Jaccard 相似度阈值
+NEAR_DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken, or estimate ~4 chars/token if unavailable."""
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    return max(1, len(text) // 4)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    enc = _get_encoding()
+    if enc is not None:
+        return enc.decode(enc.encode(text)[:max_tokens])
+    return text[: max_tokens * 4]
+
+
+class _Chunk:
+    __slots__ = ("text", "rank", "source", "start")
+
+    def __init__(self, text: str, rank: int, source: Any, start: Optional[int]):
+        self.text = text
+        self.rank = rank
+        self.source = source
+        self.start = start
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+
+def _merge_by_offset(a: _Chunk, b: _Chunk) -> Optional[str]:
+    """Merge two chunks of the same source using their ``start_index`` offsets."""
+    first, second = (a, b) if a.start <= b.start else (b, a)
+    if second.end <= first.end:
+        return first.text
+    gap = second.start - first.end
+    if gap > ADJACENT_GAP_CHARS:
+        return None
+    if gap > 0:
+        return first.text + "\n" + second.text
+    return first.text + second.text[first.end - second.start:]
+
+
+def _merge_by_text(a: str, b: str) -> Optional[str]:
+    """Merge two strings if one contains the other or they overlap at the edges."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    for left, right in ((a, b), (b, a)):
+        head = right[:MIN_TEXT_OVERLAP_CHARS]
+        if len(head) < MIN_TEXT_OVERLAP_CHARS:
+            continue
+        idx = left.find(head)
+        while idx != -1:
+            tail = left[idx:]
+            if right.startswith(tail):
+                return left + right[len(tail):]
+            idx = left.find(head, idx + 1)
+    return None
+
+
+def _try_merge(a: _Chunk, b: _Chunk) -> Optional[str]:
+    if a.source != b.source:
+        return None
+    if a.start is not None and b.start is not None:
+        return _merge_by_offset(a, b)
+    return _merge_by_text(a.text, b.text)
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack_context(
+    docs: List[Any],
+    token_budget: int,
+    separator: str = CONTEXT_SEPARATOR,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Pack retrieved documents (in relevance order) into a single context string.
+
+    Returns ``(context_text, stats)`` where ``stats`` records the naive token
+    count, the packed token count and how many tokens were saved.
+    """
+    raw_texts = [d.page_content for d in docs if getattr(d, "page_content", "")]
+    raw_tokens = count_tokens(separator.join(raw_texts))
+
+    chunks: List[_Chunk] = []
+    for rank, d in enumerate(docs):
+        text = getattr(d, "page_content", "") or ""
+        if not text.strip():
+            continue
+        meta = getattr(d, "metadata", None) or {}
+        source = (meta.get("source"), meta.get("page"))
+        start = meta.get("start_index")
+        chunks.append(_Chunk(text, rank, source, start if isinstance(start, int) else None))
+    chunks_in = len(chunks)
+
+    # 1) 合并重叠 / 相邻的片段（保留最高的相关性排名）
+    merged = 0
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(chunks)):
+            for j in range(i + 1, len(chunks)):
+                text = _try_merge(chunks[i], chunks[j])
+                if text is None:
+                    continue
+                a, b = chunks[i], chunks[j]
+                starts = [s for s in (a.start, b.start) if s is not None]
+                a.text = text
+                a.rank = min(a.rank, b.rank)
+                a.start = min(starts) if len(starts) == 2 else None
+                del chunks[j]
+                merged += 1
+                changed = True
+                break
+            if changed:
+                break
+
+    chunks.sort(key=lambda c: c.rank)
+
+    # 2) 去掉近似重复，3) 按相关性顺序填充 token 预算
+    selected: List[str] = []
+    selected_shingles: List[set] = []
+    duplicates = 0
+    over_budget = 0
+    sep_tokens = count_tokens(separator)
+    used = 0
+    for chunk in chunks:
+        sh = _shingles(chunk.text)
+        if any(_jaccard(sh, other) >= NEAR_DUPLICATE_THRESHOLD for other in selected_shingles):
+            duplicates += 1
+            continue
+        cost = count_tokens(chunk.text) + (sep_tokens if selected else 0)
+        if used + cost > token_budget:
+            if not selected and token_budget > 0:
+                # 最相关的片段单独就超预算时截断而不是丢弃
+                selected.append(_truncate_to_tokens(chunk.text, token_budget))
+                selected_shingles.append(sh)
+                used = token_budget
+            else:
+                over_budget += 1
+            continue
+        selected.append(chunk.text)
+        selected_shingles.append(sh)
+        used += cost
+
+    context_text = separator.join(selected)
+    packed_tokens = count_tokens(context_text)
+    stats = {
+        "chunks_in": chunks_in,
+        "chunks_out": len(selected),
+        "merged": merged,
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "raw_tokens": raw_tokens,
+        "packed_tokens": packed_tokens,
+        "tokens_saved": max(0, raw_tokens - packed_tokens),
+    }
+    return context_text, stats
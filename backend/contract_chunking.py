@@ -0,0 +1,33 @@
+# backend/contract_chunking.py
+"""
+Contract PDF -> chunks for the vector store.
+
+Kept free of API / database imports so ``backend.bulk_ingest`` worker processes can
+parse PDFs without loading ``llm3_new`` (OpenAI clients, DB tables, invalidation bus).
+"""
+from __future__ import annotations
+
+import os
+from typing import List
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+from backend.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = int(os.getenv("CONTRACT_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CONTRACT_CHUNK_OVERLAP", "200"))
+
+
+def split_contract_pdf(pdf_file_path: str) -> List[Document]:
+    docs = PyPDFLoader(pdf_file_path).load()
+    if not docs:
+        logger.warning("No content read from PDF")
+    # add_start_index 让 context packer 可以按偏移量合并重叠片段
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+    return text_splitter.split_documents(docs)
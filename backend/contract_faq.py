@@ -0,0 +1,338 @@
+# backend/contract_faq.py
+"""
+Precomputed answers to common contract questions, generated at ingestion time.
+
+Most contract questions fall into a dozen topics (deposit refund, early termination,
+pets, aircon servicing, subletting ...). Answering them with RAG costs a query
+embedding, a vector search and a GPT call on every ask, for an answer that only
+changes when the contract does.
+
+- After an upload is indexed, ``schedule_generation`` queues a background job that
+  answers every FAQ against the tenant's contract (same retrieval + prompt as RAG,
+  background priority) and stores the answers in ``contract_faq_answers``, keyed by
+  the contract's ``content_sha256``.
+- ``match`` maps an incoming question to an FAQ id; ``answer`` serves the stored reply
+  (per-tenant in-memory cache, ``CONTRACT_FAQ_TTL_S``). An answer is only served
+  while its ``content_sha256`` is the tenant's current document, so a re-upload
+  never serves the old contract's answers; ``discard`` also deletes them.
+- No stored answer yet (job still running, FAQ disabled) → ``None``, and the caller
+  falls through to RAG.
+
+The FAQ set is ``DEFAULT_FAQS`` unless ``CONTRACT_FAQ_FILE`` points to a JSON list of
+``{"id", "question", "patterns"}`` objects (``patterns`` are regexes matched against
+the lower-cased question).
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import psycopg2
+
+from backend import metrics
+from backend.llm_hedging import llm_deadline
+from backend.llm_scheduler import BACKGROUND, scheduling_context
+from backend.logging_setup import get_logger, log_context
+from backend.tenant_cache import TenantCache
+
+logger = get_logger(__name__)
+
+CONTRACT_FAQ_ENABLED = os.getenv("CONTRACT_FAQ_ENABLED", "true").lower() != "false"
+CONTRACT_FAQ_FILE = os.getenv("CONTRACT_FAQ_FILE") or None
+CONTRACT_FAQ_WORKERS = int(os.getenv("CONTRACT_FAQ_WORKERS", "1"))
+CONTRACT_FAQ_TTL_S = float(os.getenv("CONTRACT_FAQ_TTL_S", "300"))
+
+FAQ_ANSWERS_DDL = """
+CREATE TABLE IF NOT EXISTS contract_faq_answers (
+    tenant_id TEXT NOT NULL,
+    faq_id TEXT NOT NULL,
+    content_sha256 TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, faq_id)
+);
+"""
+
+# 顺序即优先级；patterns 只认这个话题的"典型问法"，细节问题（"提前退租押金怎么办"）仍走 RAG
+DEFAULT_FAQS = (
+    {
+        "id": "deposit_refund",
+        "question": "When and how will the landlord refund my security deposit, and what can be deducted from it?",
+        "patterns": [
+            r"\b(?:refund\w*|return\w*|get back|give back)\b.*\bdeposit\b",
+            r"\bdeposit\b.*\b(?:refund\w*|returned|back)\b",
+        ],
+    },
+    {
+        "id": "early_termination",
+        "question": "Can I terminate the lease early, and what notice or penalty applies?",
+        "patterns": [
+            r"\b(?:can|may|could|how (?:do|can|could) )\s?i\b.*\b(?:terminat\w*|break|end|get out of)\b.*\bearly\b",
+            r"\bdiplomatic clause\b",
+        ],
+    },
+    {
+        "id": "pets",
+        "question": "Am I allowed to keep pets in the premises?",
+        "patterns": [r"\b(?:pets?|dogs?|cats?|puppy|kitten)\b"],
+    },
+    {
+        "id": "aircon_servicing",
+        "question": "Who must service the air-conditioners, and how often?",
+        "patterns": [
+            r"\b(?:servic\w*|clean\w*)\b.*\b(?:air[- ]?con\w*|air[- ]condition\w*|hvac)\b",
+            r"\b(?:air[- ]?con\w*|air[- ]condition\w*|hvac)\b.*\b(?:servic\w*|clean\w*)\b",
+        ],
+    },
+    {
+        "id": "subletting",
+        "question": "Can I sublet the premises or a room to someone else?",
+        "patterns": [r"\bsub-?(?:let|lease)\w*"],
+    },
+    {
+        "id": "short_term_letting",
+        "question": "Does the lease allow short-term letting, such as to tourists or on Airbnb?",
+        "patterns": [r"\bshort[- ]term (?:let|rent|stay)\w*", r"\bairbnb\b", r"\btourists?\b"],
+    },
+    {
+        "id": "rent_increase",
+        "question": "Can the landlord increase the rent during the lease?",
+        # 续租时的涨幅是另一条条款，交给 RAG
+        "patterns": [
+            r"^(?!.*\brenew).*\b(?:rais\w*|increas\w*|hik\w*)\b.*\brent\b",
+            r"^(?!.*\brenew).*\brent\b.*\b(?:increas\w*|rais\w*|go(?:es)? up|hike)\b",
+        ],
+    },
+    {
+        "id": "renewal",
+        "question": "How do I renew the lease, and how long before it ends must I give notice?",
+        "patterns": [
+            r"\b(?:renew|extend)\w*\b.*\b(?:lease|tenancy|contract|agreement)\b",
+            r"\boption to (?:renew|extend)\b",
+        ],
+    },
+    {
+        "id": "utilities",
+        "question": "Which utilities and bills does the tenant have to pay for?",
+        "patterns": [r"\b(?:utilit\w*|electricity|internet|wi-?fi|(?:water|gas|sp|pub) bills?)\b"],
+    },
+    {
+        "id": "late_payment",
+        "question": "What happens if I pay the rent late, and is there a late fee?",
+        "patterns": [
+            r"\blate (?:fee|payment|charge|interest)s?\b",
+            r"\b(?:rent|payment) is (?:late|overdue)\b",
+            r"\bpay\w* (?:the |my )?rent late\b",
+        ],
+    },
+    {
+        "id": "landlord_entry",
+        "question": "When can the landlord enter the premises, and how much notice must be given?",
+        "patterns": [r"\blandlord\b.*\b(?:enter\w*|entry|access|inspect\w*)\b"],
+    },
+    {
+        "id": "move_out",
+        "question": "What must I do before handing back the premises at the end of the lease, such as cleaning?",
+        "patterns": [
+            r"\bmov\w* out\b",
+            r"\bhand\w* (?:back|over) (?:the )?(?:keys|premises|apartment|unit|flat)\b",
+            r"\bprofessional(?:ly)? clean\w*",
+        ],
+    },
+)
+
+
+def load_faqs(path: Optional[str] = CONTRACT_FAQ_FILE) -> List[Dict[str, Any]]:
+    """The FAQ set with each entry's patterns compiled into ``pattern``."""
+    raw = DEFAULT_FAQS
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    faqs, seen = [], set()
+    for item in raw:
+        if not item.get("id") or not item.get("question") or not item.get("patterns") or item["id"] in seen:
+            raise ValueError(f"Invalid FAQ entry: {item!r}")
+        seen.add(item["id"])
+        faqs.append({
+            "id": item["id"],
+            "question": item["question"],
+            "pattern": re.compile("|".join(f"(?:{p})" for p in item["patterns"])),
+        })
+    return faqs
+
+
+def match_faq(query: str, faqs: List[Dict[str, Any]]) -> Optional[str]:
+    """Id of the first FAQ the question matches, or None."""
+    q = " ".join(query.lower().split())
+    for faq in faqs:
+        if faq["pattern"].search(q):
+            return faq["id"]
+    return None
+
+
+class ContractFaq:
+    """Generates each tenant's FAQ answers in the background and serves them from a per-tenant cache."""
+
+    def __init__(self, db_url: str, answer_fn: Callable[[str, str], str],
+                 faqs: Optional[List[Dict[str, Any]]] = None, enabled: bool = CONTRACT_FAQ_ENABLED,
+                 workers: int = CONTRACT_FAQ_WORKERS, ttl_s: float = CONTRACT_FAQ_TTL_S,
+                 on_generated: Optional[Callable[[str], None]] = None):
+        self.db_url = db_url
+        self.enabled = enabled
+        self.faqs = faqs if faqs is not None else load_faqs()
+        self._answer_fn = answer_fn  # (tenant_id, question) -> 和 RAG 同样的回答
+        self._on_generated = on_generated
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="contract-faq")
+        self._pending: Set[Tuple[str, str]] = set()
+        self._inflight = 0
+        self._idle = threading.Condition()
+        self._answers: TenantCache[Dict[str, str]] = TenantCache("contract_faq", self._load, ttl_s)
+
+    # === Read path (/chat) ===
+    def match(self, query: str) -> Optional[str]:
+        return match_faq(query, self.faqs) if self.enabled else None
+
+    def answer(self, tenant_id: str, faq_id: str) -> Optional[str]:
+        """Stored answer for this tenant's current contract, or None."""
+        answers = self._answers.get(tenant_id)
+        return answers.get(faq_id) if answers else None
+
+    def invalidate(self, tenant_id: str) -> None:
+        self._answers.invalidate(tenant_id)
+
+    # === Background generation (after upload) ===
+    def schedule_generation(self, tenant_id: str, content_sha256: str) -> None:
+        if not self.enabled or not self.faqs:
+            return
+        key = (tenant_id, content_sha256)
+        with self._idle:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            self._inflight += 1
+        self._executor.submit(self._run_generation, tenant_id, content_sha256)
+
+    def _run_generation(self, tenant_id: str, content_sha256: str) -> None:
+        try:
+            with log_context(tenant_id=tenant_id):
+                result = self.generate(tenant_id, content_sha256)
+            metrics.CONTRACT_FAQ_JOBS.labels(result=result).inc()
+        except Exception:
+            metrics.CONTRACT_FAQ_JOBS.labels(result="failed").inc()
+            logger.exception("Contract FAQ generation failed", extra={"tenant_id": tenant_id})
+        finally:
+            with self._idle:
+                self._pending.discard((tenant_id, content_sha256))
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    def generate(self, tenant_id: str, content_sha256: str) -> str:
+        """Answer every FAQ for this contract. Returns ``generated``, or ``stale`` if it was replaced meanwhile."""
+        started = time.perf_counter()
+        for faq in self.faqs:
+            with scheduling_context(tenant_id, BACKGROUND), llm_deadline("faq"):
+                answer = self._answer_fn(tenant_id, faq["question"])
+            if not self._save(tenant_id, content_sha256, faq, answer):
+                # 合同已被重新上传：剩下的问题不用再问，新合同有自己的任务
+                logger.info("Contract replaced during FAQ generation", extra={"faq_id": faq["id"]})
+                return "stale"
+        if self._on_generated:
+            self._on_generated(tenant_id)
+        logger.info("Contract FAQ answers stored", extra={
+            "faqs": len(self.faqs), "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        return "generated"
+
+    def wait_idle(self) -> None:
+        """Block until queued generation jobs have run (benchmarks / shutdown)."""
+        with self._idle:
+            self._idle.wait_for(lambda: self._inflight == 0)
+
+    # === SQL ===
+    def _connect(self):
+        metrics.record_db_connection("contract_faq")
+        return psycopg2.connect(self.db_url)
+
+    def _load(self, tenant_id: str) -> Optional[Dict[str, str]]:
+        conn = None
+        try:
+            conn = self._connect()
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT f.faq_id, f.question, f.answer
+                    FROM contract_faq_answers f
+                    JOIN contract_documents d
+                      ON d.tenant_id = f.tenant_id AND d.content_sha256 = f.content_sha256
+                    WHERE f.tenant_id = %s;
+                    """,
+                    (tenant_id,),
+                )
+                rows = cur.fetchall()
+        except Exception as e:
+            metrics.record_error("db")
+            logger.warning("Contract FAQ lookup failed: %s", e)
+            return None
+        finally:
+            if conn:
+                conn.close()
+        # CONTRACT_FAQ_FILE 改了问题措辞时，旧答案不再作数
+        questions = {faq["id"]: faq["question"] for faq in self.faqs}
+        return {faq_id: answer for faq_id, question, answer in rows if questions.get(faq_id) == question}
+
+    def _save(self, tenant_id: str, content_sha256: str, faq: Dict[str, Any], answer: str) -> bool:
+        """Store one answer if ``content_sha256`` is still the tenant's document; False if it is not."""
+        conn = None
+        try:
+            conn = self._connect()
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO contract_faq_answers (tenant_id, faq_id, content_sha256, question, answer, created_at)
+                    SELECT %s, %s, %s, %s, %s, NOW()
+                    WHERE EXISTS (
+                        SELECT 1 FROM contract_documents WHERE tenant_id = %s AND content_sha256 = %s
+                    )
+                    ON CONFLICT (tenant_id, faq_id) DO UPDATE
+                    SET content_sha256 = EXCLUDED.content_sha256,
+                        question = EXCLUDED.question,
+                        answer = EXCLUDED.answer,
+                        created_at = NOW();
+                    """,
+                    (tenant_id, faq["id"], content_sha256, faq["question"], answer, tenant_id, content_sha256),
+                )
+                saved = cur.rowcount > 0
+            conn.commit()
+            return saved
+        except Exception:
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    def discard(self, tenant_id: str) -> None:
+        """Delete a tenant's stored answers (the contract is being replaced)."""
+        self.invalidate(tenant_id)
+        conn = None
+        try:
+            conn = self._connect()
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM contract_faq_answers WHERE tenant_id = %s;", (tenant_id,))
+            conn.commit()
+        except Exception as e:
+            # 不影响上传：旧答案的 content_sha256 对不上新文档，本来就不会再被使用
+            metrics.record_error("db")
+            logger.warning("Failed to delete contract FAQ answers: %s", e)
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
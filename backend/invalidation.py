@@ -0,0 +1,228 @@
+# backend/invalidation.py
+"""
+Cross-worker cache invalidation for per-tenant state.
+
+Every worker keeps some per-tenant state in memory (open Chroma clients, chatbot
+instances, caches). When one worker changes a tenant's shared state (e.g. a
+re-upload rebuilds the vector store), it calls ``publish(tenant_id, kind)`` and
+every worker — itself included — runs its subscribers for that tenant, which drop
+whatever they cached so it is rebuilt from shared storage on next use.
+
+The publishing worker runs its own subscribers before ``publish`` returns, so it
+never serves its own stale cache; other workers catch up when the message is
+delivered (normally milliseconds; the caches' TTLs only cover lost messages).
+
+INVALIDATION_BUS selects the transport:
+    local     in-process only; correct for a single worker (default)
+    postgres  LISTEN/NOTIFY on INVALIDATION_URL (default DATABASE_URL). Needs a
+              session connection: use Supabase's direct / session-pooler URL,
+              not the transaction pooler.
+    redis     PUBLISH/SUBSCRIBE on INVALIDATION_URL (redis://[:password@]host:port),
+              any Redis-compatible server (Redis, Valkey, KeyDB,
+              ``benchmarks/fake_redis.py``)
+"""
+from __future__ import annotations
+
+import json
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+from backend import metrics
+from backend.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+CHANNEL = os.getenv("INVALIDATION_CHANNEL", "tenant_invalidation")
+RECONNECT_DELAY_S = 2.0
+
+Subscriber = Callable[[str, str], None]
+
+
+class InvalidationBus:
+    """In-process bus; the base class for the networked ones."""
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._subscribers: List[Subscriber] = []
+
+    def subscribe(self, callback: Subscriber) -> None:
+        """``callback(tenant_id, kind)`` runs on every invalidation (possibly on a background thread)."""
+        self._subscribers.append(callback)
+
+    def publish(self, tenant_id: str, kind: str) -> None:
+        # 本 worker 同步失效，返回时本地缓存已经干净；再广播给其他 worker
+        self._dispatch(tenant_id, kind)
+        self._broadcast(tenant_id, kind)
+
+    def _broadcast(self, tenant_id: str, kind: str) -> None:
+        pass  # 单进程：没有其他 worker
+
+    def _dispatch(self, tenant_id: str, kind: str) -> None:
+        metrics.TENANT_INVALIDATIONS.labels(kind=kind).inc()
+        logger.debug("Tenant invalidated", extra={"tenant_id": tenant_id, "kind": kind})
+        for callback in list(self._subscribers):
+            try:
+                callback(tenant_id, kind)
+            except Exception:
+                logger.exception("Invalidation subscriber failed", extra={"tenant_id": tenant_id, "kind": kind})
+
+    def _encode(self, tenant_id: str, kind: str) -> str:
+        return json.dumps({"tenant_id": tenant_id, "kind": kind, "origin": self.worker_id})
+
+    def _on_payload(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed invalidation payload", extra={"payload": payload[:200]})
+            return
+        if event.get("origin") == self.worker_id:
+            return  # 自己发的，publish 时已经处理过
+        self._dispatch(event.get("tenant_id", ""), event.get("kind", ""))
+
+    def _start_listener(self, target: Callable[[], None]) -> None:
+        thread = threading.Thread(target=self._listen_forever, args=(target,), name="invalidation", daemon=True)
+        thread.start()
+
+    def _listen_forever(self, listen_once: Callable[[], None]) -> None:
+        while True:
+            try:
+                listen_once()
+            except Exception as e:
+                logger.warning("Invalidation listener disconnected, reconnecting: %s", e)
+            time.sleep(RECONNECT_DELAY_S)
+
+
+class PostgresNotifyBus(InvalidationBus):
+    def __init__(self, dsn: str, channel: str = CHANNEL):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._start_listener(self._listen_once)
+
+    def _broadcast(self, tenant_id: str, kind: str) -> None:
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s)", (self.channel, self._encode(tenant_id, kind)))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _listen_once(self) -> None:
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{self.channel}"')
+            logger.info("Listening for invalidations", extra={"bus": "postgres", "channel": self.channel})
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._on_payload(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+class RedisBus(InvalidationBus):
+    """Minimal RESP client for PUBLISH / SUBSCRIBE, so no extra dependency is needed."""
+
+    def __init__(self, url: str, channel: str = CHANNEL):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel
+        self._pub_sock: Optional[socket.socket] = None
+        self._pub_lock = threading.Lock()
+        self._start_listener(self._listen_once)
+
+    # === RESP ===
+    @staticmethod
+    def _command(*parts: str) -> bytes:
+        out = [f"*{len(parts)}\r\n".encode()]
+        for part in parts:
+            data = part.encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    @classmethod
+    def _read(cls, f):
+        line = f.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind in (b"+", b":"):
+            return rest.decode()
+        if kind == b"-":
+            raise ConnectionError(rest.decode())
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else f.read(n + 2)[:-2].decode("utf-8")
+        if kind == b"*":
+            return [cls._read(f) for _ in range(int(rest))]
+        raise ConnectionError(f"unexpected RESP reply {line!r}")
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=10)
+        f = sock.makefile("rb")
+        if self.password:
+            sock.sendall(self._command("AUTH", self.password))
+            self._read(f)
+        return sock, f
+
+    def _broadcast(self, tenant_id: str, kind: str) -> None:
+        payload = self._encode(tenant_id, kind)
+        with self._pub_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._pub_sock is None:
+                        self._pub_sock, self._pub_file = self._connect()
+                    self._pub_sock.sendall(self._command("PUBLISH", self.channel, payload))
+                    self._read(self._pub_file)
+                    return
+                except (OSError, ConnectionError):
+                    self._pub_sock = None
+                    if attempt == 2:
+                        raise
+
+    def _listen_once(self) -> None:
+        sock, f = self._connect()
+        try:
+            sock.settimeout(None)
+            sock.sendall(self._command("SUBSCRIBE", self.channel))
+            logger.info("Listening for invalidations", extra={"bus": "redis", "channel": self.channel})
+            while True:
+                reply = self._read(f)
+                if isinstance(reply, list) and len(reply) == 3 and reply[0] == "message":
+                    self._on_payload(reply[2])
+        finally:
+            sock.close()
+
+
+def get_invalidation_bus() -> InvalidationBus:
+    kind = os.getenv("INVALIDATION_BUS", "local").lower()
+    url = os.getenv("INVALIDATION_URL")
+    if kind == "postgres":
+        return PostgresNotifyBus(url or os.getenv("DATABASE_URL"))
+    if kind == "redis":
+        return RedisBus(url or "redis://127.0.0.1:6379")
+    if kind == "local":
+        return InvalidationBus()
+    raise ValueError(f"Unknown INVALIDATION_BUS: {kind}")
+
+
+invalidation_bus = get_invalidation_bus()
@@ -0,0 +1,162 @@
+# backend/lease_facts.py
+"""
+Structured lease facts answered from the stored contract summary instead of RAG.
+
+"When does my lease end?" or "What is my monthly rent?" used to go through query
+embedding, vector search and a GPT call, although the upload already extracted the
+answer: ``_save_summary_to_db`` writes ``monthly_rent`` / ``lease_end_date`` /
+``rent_due_day`` to ``users`` and ``contract_documents.summary`` keeps the rest.
+
+- ``match_fact_question`` recognises a small set of questions about the tenant's own
+  lease ("my lease", "my rent" / "the rent"); anything else returns ``None``.
+- ``LeaseFactsCache`` holds each tenant's facts in memory (``LEASE_FACTS_TTL_S``), and is
+  cleared through the invalidation bus when a new contract summary is saved.
+- ``answer_fact`` formats the reply, or returns ``None`` when the field was never
+  extracted, so the caller falls through to RAG.
+"""
+from __future__ import annotations
+
+import calendar
+import datetime
+import os
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from backend.rent_calculator import format_money
+from backend.tenant_cache import TenantCache
+
+LEASE_FACTS_TTL_S = float(os.getenv("LEASE_FACTS_TTL_S", "300"))
+
+_LEASE = r"(?:lease|tenancy|contract|agreement|rental agreement)"
+# 房租问题常说 "the rent" 或直接 "rent"，在这个租户自己的会话里都指同一份合同
+_RENT = r"(?:(?:my|the) )?(?:monthly )?rent"
+# 顺序即优先级；只认"我的"租约事实，条款类问题（能不能、如果……）留给 RAG
+FACT_PATTERNS = (
+    ("lease_remaining", re.compile(
+        r"\bhow (?:long|many (?:months|days)) (?:is |are )?(?:left|remaining) (?:on|in|of) my " + _LEASE
+        + r"|\bhow long until my " + _LEASE + r" (?:ends|expires|is up)")),
+    ("lease_end_date", re.compile(
+        r"\bwhen (?:does|will|is) my " + _LEASE + r" (?:end|expire|finish|ending|up|over)"
+        + r"|\bmy " + _LEASE + r" (?:end|expiry) date|\bend date of my " + _LEASE)),
+    ("lease_start_date", re.compile(
+        r"\bwhen (?:did|does|will) my " + _LEASE + r" (?:start|begin|commence)"
+        + r"|\bmy " + _LEASE + r" start date|\bstart date of my " + _LEASE)),
+    ("rent_due_day", re.compile(
+        r"\bwhen is " + _RENT + r" due|\bwhen (?:do|should|must) i (?:need to |have to )?pay " + _RENT
+        + r"|\bwhat (?:day|date) is " + _RENT + r" due|\bwhat(?:'s| is) " + _RENT + r" due (?:date|day)"
+        + r"|\bmy rent due (?:date|day)")),
+    ("monthly_rent", re.compile(
+        r"\b(?:what(?:'s| is)|how much is) " + _RENT
+        + r"\b(?! due)(?:\s+(?:amount|now|(?:each|every|per|a) month))?\s*\??$"
+        + r"|\bhow much rent do i pay (?:each|every|per|a) month")),
+    ("security_deposit", re.compile(
+        r"\b(?:what(?:'s| is)|how much (?:is|was)) my (?:security )?deposit(?:\s+amount)?\s*\??$"
+        + r"|\bhow much (?:security )?deposit did i pay")),
+    ("landlord_name", re.compile(r"\bwho is my landlord\b|\bwhat(?:'s| is) my landlord'?s name")),
+)
+
+
+def match_fact_question(query: str) -> Optional[str]:
+    """Name of the fact a question asks for, or None."""
+    q = " ".join(query.lower().split())
+    for fact, pattern in FACT_PATTERNS:
+        if pattern.search(q):
+            return fact
+    return None
+
+
+def _as_date(value: Any) -> Optional[datetime.date]:
+    if value is None or isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value).split("T")[0].strip())
+    except ValueError:
+        return None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def normalise_facts(user_row: Optional[Tuple[Any, Any, Any]], summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """``users`` columns first (what reminders use), the extracted summary for the rest."""
+    summary = summary or {}
+    monthly_rent, lease_end_date, rent_due_day = user_row or (None, None, None)
+    start = _as_date(summary.get("lease_start_date"))
+    return {
+        "monthly_rent": _as_float(monthly_rent) if monthly_rent is not None else _as_float(summary.get("monthly_rent")),
+        "lease_end_date": _as_date(lease_end_date) or _as_date(summary.get("lease_end_date")),
+        "lease_start_date": start,
+        "rent_due_day": int(rent_due_day) if rent_due_day is not None else (start.day if start else None),
+        "security_deposit": _as_float(summary.get("security_deposit")),
+        "landlord_name": summary.get("landlord_name") or None,
+    }
+
+
+def _ordinal(day: int) -> str:
+    suffix = "th" if 11 <= day % 100 <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
+    return f"{day}{suffix}"
+
+
+def _long_date(value: datetime.date) -> str:
+    return f"{value.day} {calendar.month_name[value.month]} {value.year}"
+
+
+def next_due_date(today: datetime.date, rent_due_day: int) -> datetime.date:
+    """Next rent due date on or after ``today`` (a due day of 31 falls on shorter months' last day)."""
+    year, month = today.year, today.month
+    while True:
+        due = datetime.date(year, month, min(rent_due_day, calendar.monthrange(year, month)[1]))
+        if due >= today:
+            return due
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def answer_fact(fact: str, facts: Dict[str, Any], today: Optional[datetime.date] = None) -> Optional[str]:
+    """Reply built from the stored facts, or None if the needed field is missing."""
+    today = today or datetime.date.today()
+    source = "\n_(From the summary of your uploaded contract.)_"
+    if fact in ("lease_end_date", "lease_remaining"):
+        end = facts.get("lease_end_date")
+        if end is None:
+            return None
+        days = (end - today).days
+        if days < 0:
+            return f"📅 Your lease ended on **{_long_date(end)}**, {-days} days ago.{source}"
+        if fact == "lease_remaining":
+            months, rest = divmod(days, 30)
+            left = f"about {months} month{'s' if months != 1 else ''} and {rest} days" if months else f"{days} days"
+            return f"📅 Your lease ends on **{_long_date(end)}**: {left} from today.{source}"
+        return f"📅 Your lease ends on **{_long_date(end)}** ({days} days from today).{source}"
+    if fact == "lease_start_date":
+        start = facts.get("lease_start_date")
+        return f"📅 Your lease started on **{_long_date(start)}**.{source}" if start else None
+    if fact == "rent_due_day":
+        day = facts.get("rent_due_day")
+        if not day:
+            return None
+        due = next_due_date(today, day)
+        return f"📅 Your rent is due on the **{_ordinal(day)}** of each month; the next due date is {_long_date(due)}.{source}"
+    if fact == "monthly_rent":
+        rent = facts.get("monthly_rent")
+        if rent is None:
+            return None
+        due = f", due on the {_ordinal(facts['rent_due_day'])} of each month" if facts.get("rent_due_day") else ""
+        return f"💰 Your monthly rent is **{format_money(rent)}**{due}.{source}"
+    if fact == "security_deposit":
+        deposit = facts.get("security_deposit")
+        return f"💰 Your security deposit is **{format_money(deposit)}**.{source}" if deposit is not None else None
+    if fact == "landlord_name":
+        name = facts.get("landlord_name")
+        return f"🏠 Your landlord is **{name}**.{source}" if name else None
+    return None
+
+
+class LeaseFactsCache(TenantCache[Dict[str, Any]]):
+    """Per-tenant facts in memory for ``ttl_s``; ``invalidate`` drops a tenant after a new upload."""
+
+    def __init__(self, loader: Callable[[str], Optional[Dict[str, Any]]], ttl_s: float = LEASE_FACTS_TTL_S):
+        super().__init__("lease_facts", loader, ttl_s)
@@ -1,24 +1,23 @@
 # llm_final_v2_fixed.py
 from __future__ import annotations
 
-from chromadb.config import Settings
 import requests
 import os
 import re
 import hashlib
-import shutil
+import json
+import threading
 from typing import List, Any, Dict, Optional
 
 # LangChain / OpenAI
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.chains import RetrievalQA, ConversationChain, create_extraction_chain
+from langchain.chains.conversation.prompt import PROMPT as CONVERSATION_PROMPT
 from langchain.agents import initialize_agent, AgentType
 from langchain.prompts import ChatPromptTemplate
 from langchain.tools import Tool
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langchain.memory import ConversationBufferWindowMemory
 
@@ -28,7 +27,28 @@ import psycopg2.extras
 from pydantic import BaseModel, Field
 import datetime
 
-print("✅ Libraries imported.")
+from backend.chat_archive import (
+    CHAT_HISTORY_DDL,
+    CHAT_HISTORY_INDEX_DDL,
+    ensure_partitions as ensure_chat_partitions,
+    memory_lookback_cutoff,
+)
+from backend.context_packer import pack_context
+from backend.contract_chunking import split_contract_pdf
+from backend.contract_faq import FAQ_ANSWERS_DDL, ContractFaq, match_faq
+from backend.invalidation import invalidation_bus
+from backend.lease_facts import LeaseFactsCache, answer_fact, match_fact_question, normalise_facts
+from backend.vectorstore_backends import get_vectorstore_backend
+from backend import metrics
+from backend.llm_hedging import hedged_chat_model, llm_deadline
+from backend.llm_scheduler import ScheduledEmbeddings, scheduled_chat_model
+from backend.logging_setup import get_logger
+from backend.reminder_scheduler import REMINDER_LOG_DDL
+from backend.tenant_cache import TenantCache
+from backend.rent_calculator import answer_calc_request, parse_calc_request
+from backend.summary_memory import SUMMARY_TABLE_DDL, RollingSummaryMemory
+
+logger = get_logger(__name__)
 
 # === API Key & Database Config ===
 # ( ... 内部代码保持不变 ... )
@@ -38,49 +58,64 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "OPENAI").upper()
 VECTORSTORE_BACKEND = os.getenv("VECTORSTORE_BACKEND", "CHROMA").upper()
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "backend/vector_stores")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# 可指向兼容 OpenAI 的代理 / 本地假服务器（benchmarks/fake_openai_server.py）
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_REQUEST_TIMEOUT_S = float(os.getenv("LLM_REQUEST_TIMEOUT_S", "60"))
+RAG_RETRIEVER_K = int(os.getenv("RAG_RETRIEVER_K", "6"))
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+# /user、/chat 每次都要的租户信息（是否注册、是否有合同）在内存里缓存多久
+TENANT_PROFILE_TTL_S = float(os.getenv("TENANT_PROFILE_TTL_S", "300"))
 EMAIL_SENDER = os.getenv("EMAIL_SENDER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_RECEIVER = os.getenv("EMAIL_RECEIVER")
-print(f"🔐 OPENAI_API_KEY set: {bool(OPENAI_API_KEY)}")
-print(f"🧠 EMBEDDINGS_BACKEND = {EMBEDDINGS_BACKEND}")
-print(f"💾 VECTORSTORE_BACKEND = {VECTORSTORE_BACKEND}")
-print(f"🐘 DATABASE_URL set: {bool(DATABASE_URL)}")
-print(f"📧 EMAIL_SENDER set: {bool(EMAIL_SENDER)}")
+logger.info("Configuration loaded", extra={
+    "openai_api_key_set": bool(OPENAI_API_KEY),
+    "embeddings_backend": EMBEDDINGS_BACKEND,
+    "vectorstore_backend": VECTORSTORE_BACKEND,
+    "database_url_set": bool(DATABASE_URL),
+    "email_sender_set": bool(EMAIL_SENDER),
+})
 
 def get_db_conn():
+    metrics.record_db_connection("get_db_conn")
     return psycopg2.connect(DATABASE_URL, sslmode="require")
 
 
 def save_user_message(tenant_id: str, content: str):
     try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO chat_history (tenant_id, message_type, message_content)
-            VALUES (%s, %s, %s)
-        """, (tenant_id, "user", content))
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("💾 User message saved")
+        with metrics.track_stage("db_write"):
+            conn = get_db_conn()
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO chat_history (tenant_id, message_type, message_content)
+                VALUES (%s, %s, %s)
+            """, (tenant_id, "user", content))
+            conn.commit()
+            cur.close()
+            conn.close()
+        logger.debug("User message saved")
     except Exception as e:
-        print("⚠️ Failed to save user message:", e)
+        metrics.record_error("db")
+        logger.warning("Failed to save user message: %s", e)
 
 def save_assistant_message(tenant_id: str, content: str):
     try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO chat_history (tenant_id, message_type, message_content)
-            VALUES (%s, %s, %s)
-        """, (tenant_id, "assistant", content))
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("💾 Assistant reply saved")
+        with metrics.track_stage("db_write"):
+            conn = get_db_conn()
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO chat_history (tenant_id, message_type, message_content)
+                VALUES (%s, %s, %s)
+            """, (tenant_id, "assistant", content))
+            conn.commit()
+            cur.close()
+            conn.close()
+        logger.debug("Assistant reply saved")
     except Exception as e:
-        print("⚠️ Failed to save assistant message:", e)
+        metrics.record_error("db")
+        logger.warning("Failed to save assistant message: %s", e)
 
 
 # --- Global, Stateless Objects ---
@@ -88,24 +123,54 @@ def save_assistant_message(tenant_id: str, content: str):
 if EMBEDDINGS_BACKEND == "OPENAI":
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set.")
-    embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=EMBEDDING_MODEL)
+    # OpenAI 限流与 chat 共用，所以 embeddings 也走调度器；LOCAL 在本机 CPU 上跑，不需要
+    embeddings = ScheduledEmbeddings(OpenAIEmbeddings(
+        api_key=OPENAI_API_KEY, model=EMBEDDING_MODEL, base_url=OPENAI_BASE_URL,
+    ))
+elif EMBEDDINGS_BACKEND == "LOCAL":
+    # ONNX sentence-transformer on CPU, loaded once per process, works offline.
+    # NOTE: vector dimensions differ from OpenAI, existing stores must be re-ingested.
+    from backend.local_embeddings import get_local_embeddings
+    embeddings = get_local_embeddings()
 else:
     raise NotImplementedError(f"Unsupported EMBEDDINGS_BACKEND: {EMBEDDINGS_BACKEND}")
-print("✅ Embeddings ready:", type(embeddings).__name__)
+logger.info("Embeddings ready", extra={"embeddings": type(embeddings).__name__})
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 EXTRACT_MODEL = os.getenv("EXTRACT_MODEL", "gpt-4o-mini")
-llm = ChatOpenAI(model=CHAT_MODEL, temperature=0.2, api_key=OPENAI_API_KEY)
-extraction_llm = ChatOpenAI(model=EXTRACT_MODEL, temperature=0.0, api_key=OPENAI_API_KEY)
-print(f"✅ LLMs ready: {CHAT_MODEL} (chat) & {EXTRACT_MODEL} (extraction)")
+FALLBACK_CHAT_MODEL = os.getenv("FALLBACK_CHAT_MODEL")
+# 所有 completion 都先拿 llm_scheduler 的 slot（并发上限 + 按租户公平排队）；
+# chat 模型在此之上加路由时限、慢请求 hedge，以及超时后改问 FALLBACK_CHAT_MODEL
+ScheduledChatOpenAI = scheduled_chat_model(ChatOpenAI)
+HedgedChatOpenAI = hedged_chat_model(ScheduledChatOpenAI)
+fallback_llm = ScheduledChatOpenAI(
+    model=FALLBACK_CHAT_MODEL, temperature=0.2, api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL, timeout=LLM_REQUEST_TIMEOUT_S,
+    callbacks=[metrics.TokenUsageCallback(FALLBACK_CHAT_MODEL)],
+) if FALLBACK_CHAT_MODEL else None
+llm = HedgedChatOpenAI(
+    model=CHAT_MODEL, temperature=0.2, api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL, timeout=LLM_REQUEST_TIMEOUT_S, fallback=fallback_llm,
+    callbacks=[metrics.TokenUsageCallback(CHAT_MODEL)],
+)
+extraction_llm = HedgedChatOpenAI(
+    model=EXTRACT_MODEL, temperature=0.0, api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL, timeout=LLM_REQUEST_TIMEOUT_S,
+    callbacks=[metrics.TokenUsageCallback(EXTRACT_MODEL)],
+)
+logger.info("LLMs ready", extra={
+    "chat_model": CHAT_MODEL, "extract_model": EXTRACT_MODEL, "fallback_model": FALLBACK_CHAT_MODEL,
+})
 
 # === Database Functions [S5] ===
 def get_db_connection():
     # ( ... 内部代码保持不变 ... )
     try:
+        metrics.record_db_connection("get_db_connection")
         conn = psycopg2.connect(DATABASE_URL)
         return conn
     except Exception as e:
-        print(f"❌ Could not connect to database: {e}")
+        metrics.record_error("db")
+        logger.error("Could not connect to database: %s", e)
         return None
 
 def log_maintenance_request(
@@ -126,10 +191,10 @@ def log_maintenance_request(
             cur.execute(sql, (tenant_id, location, description, "Pending", priority))
             request_id = cur.fetchone()[0]
             conn.commit()
-        print(f"✅ Successfully logged maintenance request ID: {request_id} (Tenant: {tenant_id})")
+        logger.info("Logged maintenance request", extra={"maintenance_request_id": request_id})
         return f"REQ-{request_id}"
     except Exception as e:
-        print(f"❌ Database write failed: {e}")
+        logger.error("Maintenance request write failed: %s", e)
         if conn:
             conn.rollback()
         return None
@@ -164,62 +229,74 @@ def check_maintenance_status(tenant_id: str) -> str:
             )
         return "\n".join(lines)
     except Exception as e:
-        print(f"❌ Database query failed: {e}")
+        logger.error("Maintenance status query failed: %s", e)
         return "Sorry, an error occurred while checking your maintenance records."
     finally:
         if conn:
             conn.close()
 
 # === User Account Functions ===
-def register_user(tenant_id: str, user_name: str) -> bool:
-    # ( ... 内部代码保持不变 ... )
-    sql = "INSERT INTO users (tenant_id, user_name) VALUES (%s, %s);"
-    conn = None
+def create_user(tenant_id: str, user_name: str) -> bool:
+    """Insert the user in one round trip. False if the tenant_id is taken; raises on DB errors."""
+    # 先 SELECT 再 INSERT 要两次往返，并发注册时还可能撞上唯一约束
+    sql = """
+    INSERT INTO users (tenant_id, user_name) VALUES (%s, %s)
+    ON CONFLICT (tenant_id) DO NOTHING;
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("Failed to get database connection")
     try:
-        conn = get_db_connection()
-        if conn is None:
-            raise Exception("Failed to get database connection")
         with conn.cursor() as cur:
             cur.execute(sql, (tenant_id, user_name))
-            conn.commit()
-        print(f"✅ Successfully registered new user: {tenant_id}")
-        return True
-    except psycopg2.errors.UniqueViolation:
-        print(f"⚠️ Registration failed: {tenant_id} already exists.")
-        if conn:
-            conn.rollback()
-        return False
+            created = cur.rowcount > 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if created:
+        logger.info("Registered new user", extra={"tenant_id": tenant_id})
+        publish_tenant_invalidation(tenant_id, "profile")  # 缓存里可能是"未注册"
+    else:
+        logger.warning("Registration failed: user already exists", extra={"tenant_id": tenant_id})
+    return created
+
+def register_user(tenant_id: str, user_name: str) -> bool:
+    try:
+        return create_user(tenant_id, user_name)
     except Exception as e:
-        print(f"❌ Unknown error during registration: {e}")
-        if conn:
-            conn.rollback()
+        logger.error("Unknown error during registration: %s", e, extra={"tenant_id": tenant_id})
         return False
-    finally:
-        if conn:
-            conn.close()
 
-def check_user_login(tenant_id: str) -> bool:
-    # ( ... 内部代码保持不变 ... )
-    sql = "SELECT EXISTS (SELECT 1 FROM users WHERE tenant_id = %s);"
+def get_stored_monthly_rent(tenant_id: str) -> Optional[float]:
+    """``users.monthly_rent`` (filled in from the uploaded contract), or None."""
     conn = None
     try:
         conn = get_db_connection()
         if conn is None:
             raise Exception("Failed to get database connection")
         with conn.cursor() as cur:
-            cur.execute(sql, (tenant_id,))
-            exists = cur.fetchone()[0]
-        return bool(exists)
+            cur.execute("SELECT monthly_rent FROM users WHERE tenant_id = %s;", (tenant_id,))
+            row = cur.fetchone()
+        return float(row[0]) if row and row[0] is not None else None
     except Exception as e:
-        print(f"❌ Error checking user login: {e}")
-        return False
+        metrics.record_error("db")
+        logger.warning("Monthly rent lookup failed: %s", e)
+        return None
     finally:
         if conn:
             conn.close()
 
+def check_user_login(tenant_id: str) -> bool:
+    profile = tenant_profiles.get(tenant_id)
+    return bool(profile and profile["registered"])
+
 # --- [EMAIL/FEEDBACK FUNCTION] ---
 
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
+RESEND_API_URL = os.getenv("RESEND_API_URL", "https://api.resend.com/emails")
 EMAIL_RECEIVER = os.getenv("EMAIL_RECEIVER")
 
 def _send_feedback_email_alert(tenant_id: str, query: str, response: str, comment: str):
@@ -228,12 +305,12 @@ def _send_feedback_email_alert(tenant_id: str, query: str, response: str, commen
     This avoids SMTP and works 100% on Render.
     """
     if not RESEND_API_KEY or not EMAIL_RECEIVER:
-        print("⚠️ Resend email skipped: missing RESEND_API_KEY or EMAIL_RECEIVER.")
+        logger.warning("Resend email skipped: missing RESEND_API_KEY or EMAIL_RECEIVER")
         return
 
-    print(f"🌀 Sending feedback email via Resend to {EMAIL_RECEIVER}...")
+    logger.info("Sending feedback email via Resend")
 
-    url = "https://api.resend.com/emails"
+    url = RESEND_API_URL
 
     email_text = f"""
 Tenant: {tenant_id} submitted negative feedback.
@@ -267,13 +344,13 @@ Please follow up as soon as possible.
 
     try:
         r = requests.post(url, json=payload, headers=headers)
-        print("📨 Resend API status:", r.status_code, r.text)
-
         if r.status_code not in (200, 202):
-            print(f"❌ Resend API Error: {r.text}")
+            logger.error("Resend API error", extra={"status_code": r.status_code, "body": r.text})
+        else:
+            logger.info("Feedback email sent", extra={"status_code": r.status_code})
 
     except Exception as e:
-        print(f"❌ Resend Email Exception: {e}")
+        logger.error("Resend email exception: %s", e)
 
 def log_user_feedback(
     tenant_id: str, query: str, response: str, rating: int, comment: str | None = None
@@ -292,7 +369,7 @@ def log_user_feedback(
         with conn.cursor() as cur:
             cur.execute(sql_feedback, (tenant_id, query, response, rating, comment))
             conn.commit()
-        print(f"✅ Successfully logged feedback (Tenant: {tenant_id}, Rating: {rating})")
+        logger.info("Logged feedback", extra={"rating": rating})
         db_success = True
 
         if rating == -1 and comment:
@@ -307,9 +384,9 @@ def log_user_feedback(
             with conn.cursor() as cur:
                 cur.execute(sql_chat_history, (tenant_id, ai_ack_message))
                 conn.commit()
-            print(f"✅ Inserted AI acknowledgment message into {tenant_id}'s chat history.")
+            logger.info("Inserted feedback acknowledgment into chat history")
     except Exception as e:
-        print(f"❌ Feedback database write failed: {e}")
+        logger.error("Feedback database write failed: %s", e)
         if conn:
             conn.rollback()
     finally:
@@ -322,17 +399,32 @@ def log_user_feedback(
     return db_success
 
 # === Vector Store Functions [S6] ===
-VECTOR_STORE_DIR_BASE = "backend/vector_stores"
+VECTOR_STORE_DIR_BASE = VECTOR_STORE_DIR
 os.makedirs(VECTOR_STORE_DIR_BASE, exist_ok=True)
 
+# CHROMA (one directory per tenant) or CHROMA_SHARED (one sharded collection set)
+vector_backend = get_vectorstore_backend(VECTORSTORE_BACKEND, embeddings, VECTOR_STORE_DIR_BASE)
+logger.info("Vector store backend ready", extra={"vector_backend": type(vector_backend).__name__})
+
+# 其他 worker 重建了某个租户的向量库时，丢掉本进程里对它的缓存（注册、摘要、FAQ 等其他事件与向量库无关）
+invalidation_bus.subscribe(lambda tenant_id, kind: kind == "vectorstore" and vector_backend.invalidate(tenant_id))
+
+
+def publish_tenant_invalidation(tenant_id: str, kind: str) -> None:
+    """Tell every worker (this one included) that a tenant's shared state changed."""
+    try:
+        invalidation_bus.publish(tenant_id, kind)
+    except Exception as e:
+        # 通知失败不影响本次请求：数据已经写进共享存储，其他 worker 最多读到旧缓存
+        logger.warning("Failed to publish invalidation: %s", e, extra={"tenant_id": tenant_id, "kind": kind})
+
 def get_user_vector_store_path(tenant_id: str) -> str:
     # ( ... 内部代码保持不变 ... )
     hashed_id = hashlib.sha256(tenant_id.encode("utf-8")).hexdigest()
     return os.path.join(VECTOR_STORE_DIR_BASE, hashed_id)
 
 def user_vector_store_exists(tenant_id: str) -> bool:
-    # ( ... 内部代码保持不变 ... )
-    return os.path.exists(get_user_vector_store_path(tenant_id))
+    return vector_backend.exists(tenant_id)
 
 class ContractSummary(BaseModel):
     # ( ... 内部代码保持不变 ... )
@@ -344,64 +436,75 @@ class ContractSummary(BaseModel):
     landlord_name: Optional[str] = Field(description="The full name of the Landlord")
 
 # --- [PROACTIVE] Merged _save_summary_to_db into create_user_vectorstore ---
-def create_user_vectorstore(tenant_id: str, pdf_file_path: str) -> Dict[str, Any] | None:
+def create_user_vectorstore(
+    tenant_id: str, pdf_file_path: str, content_sha256: Optional[str] = None
+) -> Dict[str, Any] | None:
     # ( ... 内部代码保持不变 ... )
-    persist_directory = get_user_vector_store_path(tenant_id)
-    if user_vector_store_exists(tenant_id):
-        print(f"⚠️ Found old vector store for {tenant_id}, deleting...")
-        shutil.rmtree(persist_directory)
-
-    print(f"⚙️ Creating vector store for {tenant_id} (Hashed: {persist_directory}) from {pdf_file_path}...")
+    logger.info("Creating vector store", extra={"tenant_id": tenant_id, "vector_backend": vector_backend.name})
+    if content_sha256 is None:
+        content_sha256 = hash_file(pdf_file_path)
     try:
-        loader = PyPDFLoader(pdf_file_path)
-        docs = loader.load()
-        if not docs:
-            print("⚠️ No content read from PDF.")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        splits = text_splitter.split_documents(docs)
-
-        client_settings = Settings(
-             anonymized_telemetry=False,
-             allow_reset=True,
-            )
-        os.makedirs(persist_directory, exist_ok=True)
-        vectorstore = Chroma.from_documents(
-            documents=splits,
-            embedding=embeddings,
-            persist_directory=persist_directory,
-            client_settings=client_settings
-        )
-        print(f"✅ Successfully created and persisted vector store for {tenant_id}.")
+        splits = split_contract_pdf(pdf_file_path)
+        return index_contract(tenant_id, splits, content_sha256)
 
-        # Contract Summary Extraction
-        print(f"🌀 Extracting contract summary for {tenant_id}...")
-        extraction_chain = create_extraction_chain(
-            schema=ContractSummary.model_json_schema(), llm=extraction_llm
-        )
-        extraction_input = {"input": splits[:10]}
+    except Exception as e:
+        logger.exception("Failed to create vector store or extract summary", extra={"tenant_id": tenant_id})
+        return None
+
+def index_contract(
+    tenant_id: str,
+    splits: List[Document],
+    content_sha256: str,
+    vectors: Optional[List[List[float]]] = None,
+    generate_faqs: bool = True,
+) -> Dict[str, Any]:
+    """
+    Replace the tenant's vector store with ``splits`` and extract the contract summary.
+
+    ``vectors`` may be pre-computed (bulk ingest embeds many tenants per call).
+    ``generate_faqs=False`` skips queueing the background FAQ answers. Raises on
+    failure; ``create_user_vectorstore`` is the non-raising wrapper used by /upload.
+    """
+    # build() replaces any previous store for this tenant
+    vector_backend.build(tenant_id, splits, vectors)
+    logger.info("Vector store persisted", extra={"tenant_id": tenant_id, "chunks": len(splits)})
+    # 先登记新文档（摘要为空），抽取失败时重传同一文件会重新处理而不是命中旧摘要
+    _save_contract_document(tenant_id, content_sha256, None, len(splits))
+    contract_faq.discard(tenant_id)  # 旧合同的预生成答案作废
+    publish_tenant_invalidation(tenant_id, "vectorstore")
+    # 常见问题的答案在后台预先生成（background 优先级），不拖慢这次上传；/upload 和批量导入都走这里
+    if generate_faqs:
+        contract_faq.schedule_generation(tenant_id, content_sha256)
+
+    # Contract Summary Extraction
+    logger.debug("Extracting contract summary")
+    extraction_chain = create_extraction_chain(
+        schema=ContractSummary.model_json_schema(), llm=extraction_llm
+    )
+    extraction_input = {"input": splits[:10]}
+    with llm_deadline("extraction"):
         result = extraction_chain.invoke(extraction_input)
 
-        summary_data = {} 
-        if isinstance(result, dict):
-            payload = result.get("text") or result.get("output") or result.get("data")
-            if payload and isinstance(payload, list) and len(payload) > 0 and isinstance(payload[0], dict):
-                summary_data = payload[0]
-                print(f"✅ Successfully extracted summary: {summary_data}")
-                
-                # --- [PROACTIVE] Calling _save_summary_to_db logic here ---
-                _save_summary_to_db(tenant_id, summary_data)
-                # --- [END PROACTIVE] ---
-                
-            else:
-                print("⚠️ Extraction chain ran successfully, but returned no valid data.")
-        else:
-            print("⚠️ Extraction chain returned an unknown structure.")
+    summary_data = {} 
+    if isinstance(result, dict):
+        payload = result.get("text") or result.get("output") or result.get("data")
+        if payload and isinstance(payload, list) and len(payload) > 0 and isinstance(payload[0], dict):
+            summary_data = payload[0]
+            logger.info("Extracted contract summary", extra={"fields": sorted(summary_data)})
+            logger.debug("Contract summary", extra={"summary": summary_data})
             
-        return summary_data 
-
-    except Exception as e:
-        print(f"❌ Failed to create vector store or extract summary for {tenant_id}: {e}")
-        return None
+            # --- [PROACTIVE] Calling _save_summary_to_db logic here ---
+            _save_summary_to_db(tenant_id, summary_data)
+            # --- [END PROACTIVE] ---
+            _save_contract_document(tenant_id, content_sha256, summary_data, len(splits))
+            publish_tenant_invalidation(tenant_id, "summary")
+            
+        else:
+            logger.warning("Extraction chain returned no valid data")
+    else:
+        logger.warning("Extraction chain returned an unknown structure")
+        
+    return summary_data 
 
 # --- [PROACTIVE] New: Helper function to save the summary ---
 def _save_summary_to_db(tenant_id: str, summary_data: dict):
@@ -439,15 +542,168 @@ def _save_summary_to_db(tenant_id: str, summary_data: dict):
             cur.execute(sql, (rent, end_date, rent_due_day, tenant_id))
             conn.commit()
         conn.close()
-        print(f"✅ Successfully saved contract summary (rent, dates) to users table.")
+        logger.info("Saved contract summary to users table")
 
     except Exception as e:
-        print(f"⚠️ Warning: Successfully extracted summary, but failed to save to users table: {e}")
+        logger.warning("Extracted summary but failed to save it to users table: %s", e)
 # --- [END PROACTIVE] ---
 
+
+# === Contract Documents (upload dedupe) ===
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_contract_document(tenant_id: str) -> Optional[Dict[str, Any]]:
+    """The tenant's currently indexed document: ``{"content_sha256", "summary", "chunks"}`` or None."""
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT content_sha256, summary, chunks FROM contract_documents WHERE tenant_id = %s;",
+                (tenant_id,),
+            )
+            row = cur.fetchone()
+    except Exception as e:
+        metrics.record_error("db")
+        logger.warning("Contract document lookup failed: %s", e)
+        return None
+    finally:
+        conn.close()
+    if not row:
+        return None
+    summary = row[1]
+    if isinstance(summary, str):
+        summary = json.loads(summary)
+    return {"content_sha256": row[0], "summary": summary, "chunks": row[2]}
+
+
+def _save_contract_document(
+    tenant_id: str, content_sha256: str, summary: Optional[Dict[str, Any]], chunks: int
+) -> None:
+    """Record the document now in the tenant's vector store (one row per tenant)."""
+    conn = get_db_connection()
+    if conn is None:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO contract_documents (tenant_id, content_sha256, summary, chunks, uploaded_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (tenant_id) DO UPDATE
+                SET content_sha256 = EXCLUDED.content_sha256,
+                    summary = EXCLUDED.summary,
+                    chunks = EXCLUDED.chunks,
+                    uploaded_at = NOW();
+                """,
+                (tenant_id, content_sha256, json.dumps(summary) if summary is not None else None, chunks),
+            )
+        conn.commit()
+    except Exception as e:
+        metrics.record_error("db")
+        logger.warning("Failed to save contract document record: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+# === Lease Facts (answered without RAG) ===
+def load_lease_facts(tenant_id: str) -> Optional[Dict[str, Any]]:
+    """Stored summary fields for ``lease_facts``; None if the lookup failed."""
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT u.monthly_rent, u.lease_end_date, u.rent_due_day, d.summary
+                FROM users u
+                LEFT JOIN contract_documents d ON d.tenant_id = u.tenant_id
+                WHERE u.tenant_id = %s;
+                """,
+                (tenant_id,),
+            )
+            row = cur.fetchone()
+    except Exception as e:
+        metrics.record_error("db")
+        logger.warning("Lease facts lookup failed: %s", e)
+        return None
+    finally:
+        conn.close()
+    summary = row[3] if row else None
+    if isinstance(summary, str):
+        summary = json.loads(summary)
+    return normalise_facts(row[:3] if row else None, summary)
+
+
+lease_facts_cache = LeaseFactsCache(load_lease_facts)
+# 新合同的摘要写好后（"summary"）或向量库重建时丢掉缓存的事实
+invalidation_bus.subscribe(lambda tenant_id, kind: lease_facts_cache.invalidate(tenant_id))
+
+# === Tenant Profiles (cached per worker) ===
+def load_tenant_profile(tenant_id: str) -> Optional[Dict[str, Any]]:
+    """User row + current contract in one round trip; None if the lookup failed."""
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            # 游客也能上传合同，所以不从 users 出发 JOIN
+            cur.execute(
+                """
+                SELECT
+                    EXISTS (SELECT 1 FROM users WHERE tenant_id = %s),
+                    (SELECT user_name FROM users WHERE tenant_id = %s),
+                    (SELECT content_sha256 FROM contract_documents WHERE tenant_id = %s);
+                """,
+                (tenant_id, tenant_id, tenant_id),
+            )
+            registered, user_name, content_sha256 = cur.fetchone()
+    except Exception as e:
+        metrics.record_error("db")
+        logger.warning("Tenant profile lookup failed: %s", e)
+        return None
+    finally:
+        conn.close()
+    # contract_documents 之前建的向量库没有文档记录，这时才去问向量库（每个 TTL 一次）
+    has_contract = content_sha256 is not None or vector_backend.exists(tenant_id)
+    return {
+        "tenant_id": tenant_id,
+        "registered": bool(registered),
+        "user_name": user_name,
+        "has_contract": has_contract,
+        "store_version": content_sha256,
+    }
+
+
+tenant_profiles: TenantCache[Dict[str, Any]] = TenantCache("tenant_profile", load_tenant_profile, TENANT_PROFILE_TTL_S)
+# 注册（"profile"）、上传（"vectorstore"）、摘要保存（"summary"）后丢掉缓存
+invalidation_bus.subscribe(lambda tenant_id, kind: kind != "faq" and tenant_profiles.invalidate(tenant_id))
+
+
+def get_tenant_profile(tenant_id: str) -> Optional[Dict[str, Any]]:
+    """``{"tenant_id", "registered", "user_name", "has_contract", "store_version"}``, or None if the DB failed."""
+    return tenant_profiles.get(tenant_id)
+
+
+def tenant_has_contract(tenant_id: str) -> bool:
+    """Cached ``user_vector_store_exists`` for the per-message paths (/chat, RAG)."""
+    profile = tenant_profiles.get(tenant_id)
+    return profile["has_contract"] if profile else user_vector_store_exists(tenant_id)
+
 # === Agent & Tools ===
 # ( ... 内部代码保持不变 ... )
 def calculate_rent_tool(query: str) -> str:
+    request = parse_calc_request(query)
+    if request and request["monthly_rent"] is not None:
+        return answer_calc_request(request)
     nums = [int(x) for x in re.findall(r"\d+", query)]
     if len(nums) >= 2:
         monthly, months = nums[0], nums[1]
@@ -460,14 +716,13 @@ calculate_rent = Tool.from_function(
     name="calculate_rent",
     description="Calculate total rent given monthly rent and number of months from natural language.",
 )
-print("🧰 Tool ready: calculate_rent")
 
 
 # --- [FIX] 新增：全局数据库初始化函数 ---
 def initialize_database_tables():
     """
     (V-Final-Fix)
-    创建所有 4 张表（若不存在）。
+    创建所有表（若不存在）。
     这解决了 "register_user" 
     在 "TenantChatbot" 
     (和 "Psycopg2ChatHistory") 
@@ -484,15 +739,9 @@ def initialize_database_tables():
             lease_end_date DATE
         );
         """,
-        """
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id SERIAL PRIMARY KEY,
-            tenant_id TEXT NOT NULL,
-            message_type TEXT CHECK (message_type IN ('human','ai')),
-            message_content TEXT,
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-        """,
+        # chat_history 按月分区（见 backend/chat_archive.py）
+        CHAT_HISTORY_DDL,
+        CHAT_HISTORY_INDEX_DDL,
         """
         CREATE TABLE IF NOT EXISTS maintenance_requests (
             request_id SERIAL PRIMARY KEY,
@@ -505,6 +754,15 @@ def initialize_database_tables():
         );
         """,
         """
+        CREATE TABLE IF NOT EXISTS contract_documents (
+            tenant_id TEXT PRIMARY KEY,
+            content_sha256 TEXT NOT NULL,
+            summary JSONB,
+            chunks INT,
+            uploaded_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        """
         CREATE TABLE IF NOT EXISTS user_feedback (
             id SERIAL PRIMARY KEY,
             tenant_id TEXT NOT NULL,
@@ -514,7 +772,10 @@ def initialize_database_tables():
             comment TEXT,
             created_at TIMESTAMP DEFAULT NOW()
         );
-        """
+        """,
+        SUMMARY_TABLE_DDL,
+        REMINDER_LOG_DDL,
+        FAQ_ANSWERS_DDL,
     ]
     conn = None
     try:
@@ -525,9 +786,10 @@ def initialize_database_tables():
             for stmt in ddl_sql:
                 cur.execute(stmt)
             conn.commit()
-        print("✅ (Fix) 表结构检查/创建完成。")
+        ensure_chat_partitions(conn)
+        logger.info("Database tables checked/created")
     except Exception as e:
-        print(f"❌ (Fix) 建表检查失败: {e}")
+        logger.error("Database table init failed: %s", e)
         if conn:
             conn.rollback()
     finally:
@@ -551,26 +813,30 @@ class Psycopg2ChatHistory(BaseChatMessageHistory):
     @property
     def messages(self) -> List[BaseMessage]:
         # ( ... 内部代码保持不变 ... )
+        # created_at 下界让 Postgres 只扫最近几个月的分区
         sql = """
         SELECT message_type, message_content 
         FROM chat_history 
-        WHERE tenant_id = %s 
+        WHERE tenant_id = %s AND created_at >= %s
         ORDER BY created_at ASC;
         """
         messages: List[BaseMessage] = []
         conn = None
         try:
-            conn = psycopg2.connect(self.db_url)
-            with conn.cursor() as cur:
-                cur.execute(sql, (self.tenant_id,))
-                rows = cur.fetchall()
+            with metrics.track_stage("history_load"):
+                metrics.record_db_connection("chat_history")
+                conn = psycopg2.connect(self.db_url)
+                with conn.cursor() as cur:
+                    cur.execute(sql, (self.tenant_id, memory_lookback_cutoff()))
+                    rows = cur.fetchall()
             for msg_type, msg_content in rows:
                 if msg_type == "human":
                     messages.append(HumanMessage(content=msg_content))
                 elif msg_type == "ai":
                     messages.append(AIMessage(content=msg_content))
         except Exception as e:
-            print(f"❌ Chat history (read) failed: {e}")
+            metrics.record_error("db")
+            logger.error("Chat history (read) failed: %s", e)
         finally:
             if conn:
                 conn.close()
@@ -590,12 +856,15 @@ class Psycopg2ChatHistory(BaseChatMessageHistory):
             return
         conn = None
         try:
-            conn = psycopg2.connect(self.db_url)
-            with conn.cursor() as cur:
-                cur.execute(sql, (self.tenant_id, msg_type, message.content))
-                conn.commit()
+            with metrics.track_stage("db_write"):
+                metrics.record_db_connection("chat_history")
+                conn = psycopg2.connect(self.db_url)
+                with conn.cursor() as cur:
+                    cur.execute(sql, (self.tenant_id, msg_type, message.content))
+                    conn.commit()
         except Exception as e:
-            print(f"❌ Chat history (write) failed: {e}")
+            metrics.record_error("db")
+            logger.error("Chat history (write) failed: %s", e)
             if conn:
                 conn.rollback()
         finally:
@@ -607,12 +876,16 @@ class Psycopg2ChatHistory(BaseChatMessageHistory):
         sql = "DELETE FROM chat_history WHERE tenant_id = %s;"
         conn = None
         try:
+            metrics.record_db_connection("chat_history")
             conn = psycopg2.connect(self.db_url)
             with conn.cursor() as cur:
                 cur.execute(sql, (self.tenant_id,))
+                # 摘要是由这些消息生成的，一起删掉
+                cur.execute("DELETE FROM chat_summaries WHERE tenant_id = %s;", (self.tenant_id,))
                 conn.commit()
         except Exception as e:
-            print(f"❌ Chat history (clear) failed: {e}")
+            metrics.record_error("db")
+            logger.error("Chat history (clear) failed: %s", e)
             if conn:
                 conn.rollback()
         finally:
@@ -620,124 +893,239 @@ class Psycopg2ChatHistory(BaseChatMessageHistory):
                 conn.close()
 
 # === The Main Chatbot ===
-class TenantChatbot:
-    # ( ... 内部代码保持不变 ... )
-    def __init__(self, llm_instance, tenant_id: str):
-        print(f"🌀 Initializing TenantChatbot instance for tenant {tenant_id}...")
-        self.llm = llm_instance
-        self.tenant_id = tenant_id
-
-        self.history = Psycopg2ChatHistory(tenant_id=tenant_id, db_url=DATABASE_URL)
-        self.memory = ConversationBufferWindowMemory(
-            chat_memory=self.history, k=10, return_messages=True
+# 以下对象与租户无关，每个进程只构建一次，所有 TenantChatbot 共享（flyweight）；
+# 租户相关的只有聊天记录，在每次调用时绑定
+
+# RAG Answer Format
+CONTRACT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are a professional Singapore tenancy-law assistant. "
+            "Answer based ONLY on the contract text. Do not assume anything not provided."
+        ),
+        (
+            "human",
+            "Contract Text:\n{context}\n\n"
+            "Question:\n{user_query}\n\n"
+            "Answer Format:\n"
+            "1) Clear short answer\n"
+            "2) Clause reference (e.g., Clause 7.2)\n"
+            "3) Quote the exact supporting sentence"
         )
+    ]
+)
+
+# ✅ Contract Trigger Keywords (Upgraded)
+CONTRACT_KEYWORDS = (
+    "clause","tenant","landlord","terminate","termination","repair","maintenance","fix",
+    "replace","deposit","refund","renewal",
+    "aircon","air conditioner","ac","hvac",
+    "breach","notice","early termination","rent increase",
+    "sublet","utilities","agreement","contract","lease","rental",
+    "payment","late fee","pets","responsibilities","obligations",
+    "rights","liabilities","dispute","jurisdiction","responsible"
+)
+
+# ✅ Avoid 'rent' mis-triggering calculation
+CALC_KEYWORDS = ("calculate", "how much", "total cost", "estimate")
+
+MAINTENANCE_KEYWORDS = ("maintenance", "fix", "broken", "repair", "leak", "report repair")
+STATUS_KEYWORDS = ("status", "progress", "check repair", "repair progress", "repair status")
 
-        self.conversation = ConversationChain(llm=self.llm, memory=self.memory)
-        self.tools = [calculate_rent]
+CHAT_TOOLS = (calculate_rent,)
+
+
+def answer_from_contract(llm_instance, tenant_id: str, query: str) -> str:
+    """RAG over the tenant's contract; raises on failure. Used by /chat and FAQ pre-generation."""
+    with metrics.track_stage("retrieval"):
+        docs = vector_backend.search(tenant_id, query, k=RAG_RETRIEVER_K)
+
+    # ✅ Merge overlapping chunks, drop near-duplicates, fill the token budget
+    with metrics.track_stage("context_pack"):
+        context_text, pack_stats = pack_context(docs, RAG_CONTEXT_TOKEN_BUDGET)
+    metrics.RAG_TOKENS_SAVED.inc(pack_stats["tokens_saved"])
+    logger.debug("Context packed", extra=pack_stats)
+
+    prompt = CONTRACT_PROMPT.format(
+        context=context_text,
+        user_query=query
+    )
+
+    with metrics.track_stage("llm_call"):
+        response = llm_instance.invoke(prompt)
+    return response.content
+
+
+# 常见合同问题：上传后在后台预先回答，/chat 命中时直接返回
+contract_faq = ContractFaq(
+    DATABASE_URL,
+    lambda tenant_id, question: answer_from_contract(llm, tenant_id, question),
+    on_generated=lambda tenant_id: publish_tenant_invalidation(tenant_id, "faq"),
+)
+invalidation_bus.subscribe(lambda tenant_id, kind: contract_faq.invalidate(tenant_id))
+
+
+def route_query(q: str) -> str:
+    """Pick the handler for a lower-cased query; the order is the routing priority."""
+    # === 1) Maintenance Request ===
+    if any(k in q for k in MAINTENANCE_KEYWORDS) and not any(k in q for k in STATUS_KEYWORDS):
+        return "maintenance"
+    # === 2) Maintenance Status Check ===
+    if any(k in q for k in STATUS_KEYWORDS):
+        return "status"
+    # === 3) Rent arithmetic the parser understands → answered without the LLM ===
+    # （命中 FAQ 话题的是合同条款问题，哪怕带着数字也不当算术题）
+    if parse_calc_request(q) is not None and match_faq(q, contract_faq.faqs) is None:
+        return "calc"
+    # === 4) "When does my lease end?" → stored contract summary, RAG if the field is missing ===
+    if match_fact_question(q) is not None:
+        return "facts"
+    # === 5) Common contract question → answer pre-generated at upload, RAG if not there yet ===
+    if contract_faq.match(q) is not None:
+        return "faq"
+    # === 6) Contract / Legal Questions → RAG Priority ===
+    if any(k in q for k in CONTRACT_KEYWORDS):
+        return "rag"
+    # === 7) Other Rent Calculation → ReAct agent ===
+    if any(k in q for k in CALC_KEYWORDS):
+        return "calc_agent"
+    # === 8) General Chat ===
+    return "general_chat"
+
+
+class _SharedChains:
+    """Chains and agent for one LLM, built once and used by every tenant (no memory attached)."""
+
+    def __init__(self, llm_instance):
+        # ConversationChain 的默认 prompt；history 由调用方按租户传入
+        self.conversation = CONVERSATION_PROMPT | llm_instance
         self.agent = initialize_agent(
-            tools=self.tools,
-            llm=self.llm,
+            tools=list(CHAT_TOOLS),
+            llm=llm_instance,
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-            memory=self.memory,
             verbose=False,
         )
 
-        # RAG Answer Format
-        self.contract_prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are a professional Singapore tenancy-law assistant. "
-                    "Answer based ONLY on the contract text. Do not assume anything not provided."
-                ),
-                (
-                    "human",
-                    "Contract Text:\n{context}\n\n"
-                    "Question:\n{user_query}\n\n"
-                    "Answer Format:\n"
-                    "1) Clear short answer\n"
-                    "2) Clause reference (e.g., Clause 7.2)\n"
-                    "3) Quote the exact supporting sentence"
-                )
-            ]
-        )
 
-        # ✅ Contract Trigger Keywords (Upgraded)
-        self.contract_keywords = [
-            "clause","tenant","landlord","terminate","termination","repair","maintenance","fix",
-            "replace","deposit","refund","renewal",
-            "aircon","air conditioner","ac","hvac",
-            "breach","notice","early termination","rent increase",
-            "sublet","utilities","agreement","contract","lease","rental",
-            "payment","late fee","pets","responsibilities","obligations",
-            "rights","liabilities","dispute","jurisdiction","responsible"
-        ]
+# General chat 的 prompt 只带滚动摘要 + 最近几条消息，摘要在后台更新
+chat_summary_memory = RollingSummaryMemory(DATABASE_URL, llm)
 
-        # ✅ Avoid 'rent' mis-triggering calculation
-        self.calc_keywords = ["calculate", "how much", "total cost", "estimate"]
+_shared_chains: Dict[int, _SharedChains] = {}
+_shared_chains_lock = threading.Lock()
 
-        self.maintenance_keywords = ["maintenance", "fix", "broken", "repair", "leak", "report repair"]
-        self.status_keywords = ["status", "progress", "check repair", "repair progress", "repair status"]
 
-        print(f"✅ TenantChatbot instance for tenant {tenant_id} created (using persistent memory).")
+def get_shared_chains(llm_instance) -> _SharedChains:
+    key = id(llm_instance)
+    chains = _shared_chains.get(key)
+    if chains is None:
+        with _shared_chains_lock:
+            chains = _shared_chains.get(key)
+            if chains is None:
+                chains = _shared_chains[key] = _SharedChains(llm_instance)
+    return chains
 
-    def process_query(self, query: str, tenant_id: str) -> str:
-        q = query.lower()
 
-        # === 1) Maintenance Request ===
-        if any(k in q for k in self.maintenance_keywords) and not any(k in q for k in self.status_keywords):
+class TenantChatbot:
+    def __init__(self, llm_instance, tenant_id: str):
+        self.llm = llm_instance
+        self.tenant_id = tenant_id
+        self.chains = get_shared_chains(llm_instance)
+
+    def _memory(self, tenant_id: str) -> ConversationBufferWindowMemory:
+        history = Psycopg2ChatHistory(tenant_id=tenant_id, db_url=DATABASE_URL)
+        return ConversationBufferWindowMemory(chat_memory=history, k=10, return_messages=True)
+
+    def _route(self, q: str) -> str:
+        return route_query(q)
+
+    def process_query(self, query: str, tenant_id: str) -> str:
+        with metrics.track_stage("routing"):
+            route = self._route(query.lower())
+        if route == "facts":
+            with metrics.track_route(route):
+                reply = self._answer_fact(query, tenant_id)
+            if reply is not None:
+                return reply
+            route = "rag"  # 摘要里没有这个字段
+        if route == "faq":
+            with metrics.track_route(route):
+                reply = self._answer_faq(query, tenant_id)
+            if reply is not None:
+                return reply
+            route = "rag"  # 答案还没生成（或已随重新上传作废）
+        with metrics.track_route(route), llm_deadline(route):
+            return self._handle(route, query, tenant_id)
+
+    def _answer_fact(self, query: str, tenant_id: str) -> Optional[str]:
+        facts = lease_facts_cache.get(tenant_id)
+        if not facts:
+            return None
+        return answer_fact(match_fact_question(query), facts)
+
+    def _answer_faq(self, query: str, tenant_id: str) -> Optional[str]:
+        answer = contract_faq.answer(tenant_id, contract_faq.match(query))
+        if answer is None:
+            return None
+        return f"{answer}\n_(Prepared from your uploaded contract when it was indexed.)_"
+
+    def _handle(self, route: str, query: str, tenant_id: str) -> str:
+        if route == "maintenance":
             return "MAINTENANCE_REQUEST_TRIGGERED"
 
-        # === 2) Maintenance Status Check ===
-        if any(k in q for k in self.status_keywords):
+        if route == "status":
             return check_maintenance_status(tenant_id)
 
-        # === 3) Contract / Legal Questions → RAG Priority ===
-        if any(k in q for k in self.contract_keywords):
-            persist_directory = get_user_vector_store_path(tenant_id)
-
-            if not user_vector_store_exists(tenant_id):
+        if route == "rag":
+            if not tenant_has_contract(tenant_id):
                 return "I don't have your lease file yet. Please upload the contract PDF first."
 
             try:
-                vectorstore = Chroma(
-                    persist_directory=persist_directory,
-                    embedding_function=embeddings
-                )
-                retriever = vectorstore.as_retriever()
-                docs = retriever.get_relevant_documents(query)
-
-                # ✅ Correctly extract document text, not the Document object
-                context_text = "\n\n---\n\n".join([d.page_content for d in docs])
-
-                prompt = self.contract_prompt.format(
-                    context=context_text,
-                    user_query=query
-                )
-
-                response = self.llm.invoke(prompt)
-                return response.content
+                return answer_from_contract(self.llm, tenant_id, query)
 
             except Exception as e:
-                print(f"❌ RAG query failed: {e}")
+                metrics.record_error("rag")
+                logger.exception("RAG query failed")
                 return "Sorry, I encountered a problem looking up your lease terms. Please try again later."
 
-        # === 4) Rent Calculation ===
-        if any(k in q for k in self.calc_keywords):
+        if route == "calc":
+            request = parse_calc_request(query)
+            rent_source = ""
+            if request["monthly_rent"] is None:
+                with metrics.track_stage("rent_lookup"):
+                    request["monthly_rent"] = get_stored_monthly_rent(tenant_id)
+                if request["monthly_rent"] is None:
+                    return (
+                        "I don't have your monthly rent on file yet. Please upload your contract, "
+                        "or include the amount (e.g., '$2500 for 15 months')."
+                    )
+                rent_source = "your rent on file"
+            # 纯算术，不调用 LLM；这一轮由 /chat 自己存进 chat_history
+            return answer_calc_request(request, rent_source)
+
+        if route == "calc_agent":
             try:
-                response = self.agent.invoke({"input": query})
+                with metrics.track_stage("llm_call"):
+                    response = self.chains.agent.invoke({"input": query})
+                # 与原先挂 memory 的 agent 一样，把这一轮写进租户的聊天记录
+                self._memory(tenant_id).save_context({"input": query}, {"output": response["output"]})
+                chat_summary_memory.schedule_update(tenant_id)
                 return response["output"]
             except Exception as e:
+                metrics.record_error("calc_agent")
                 return f"Calculation failed: {e}"
 
-        # === 5) General Chat ===
         try:
-            response = self.conversation.invoke({"input": query})
-            return response["response"]
+            history = chat_summary_memory.render(tenant_id)
+            with metrics.track_stage("llm_call"):
+                response = self.chains.conversation.invoke({"input": query, "history": history})
+            self._memory(tenant_id).save_context({"input": query}, {"response": response.content})
+            chat_summary_memory.schedule_update(tenant_id)
+            return response.content
         except Exception as e:
+            metrics.record_error("general_chat")
             return f"Conversation failed: {e}"
 
-print("🏗️ TenantChatbot class ready.")
 
 
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
@@ -747,12 +1135,11 @@ def _send_proactive_reminder_email(tenant_email: str, user_name: str, message_co
     Send rent reminder email using Resend API (recommended for Render).
     """
     if not RESEND_API_KEY:
-        print("⚠️ Resend key missing, skipping proactive reminder email.")
+        logger.warning("Resend key missing, skipping proactive reminder email")
         return False
 
-    print(f"🌀 Sending proactive reminder email to tenant {tenant_email} via Resend...")
 
-    url = "https://api.resend.com/emails"
+    url = RESEND_API_URL
 
     email_text = f"""
 Hello {user_name},
@@ -778,17 +1165,17 @@ Thank you and have a great day!
 
     try:
         r = requests.post(url, json=payload, headers=headers)
-        print("[Resend proactive] STATUS:", r.status_code, r.text)
-
         if r.status_code not in (200, 202):
-            print(f"❌ Proactive Resend email failed: {r.text}")
+            logger.error("Proactive reminder email failed", extra={
+                "tenant_id": tenant_email, "status_code": r.status_code, "body": r.text,
+            })
             return False
 
-        print("✅ Proactive reminder email sent successfully.")
+        logger.info("Proactive reminder email sent", extra={"tenant_id": tenant_email})
         return True
 
     except Exception as e:
-        print(f"❌ Proactive reminder email error: {e}")
+        logger.error("Proactive reminder email error: %s", e, extra={"tenant_id": tenant_email})
         return False
     
 def run_proactive_reminders(days_in_advance: int = 5):
@@ -797,7 +1184,7 @@ def run_proactive_reminders(days_in_advance: int = 5):
     (Main function run by scheduler)
     Checks all tenants and *sends email* reminders for upcoming rent payments.
     """
-    print(f"🤖 Running proactive reminders... Looking for rent due {days_in_advance} days from now.")
+    logger.info("Running proactive reminders", extra={"days_in_advance": days_in_advance})
     
     today = datetime.date.today()
     target_date = today + datetime.timedelta(days=days_in_advance)
@@ -811,7 +1198,7 @@ def run_proactive_reminders(days_in_advance: int = 5):
     
     conn = get_db_connection()
     if conn is None:
-        print("❌ Reminder failed: Could not connect to database.")
+        logger.error("Reminder failed: could not connect to database")
         return
         
     try:
@@ -819,11 +1206,11 @@ def run_proactive_reminders(days_in_advance: int = 5):
             cur.execute(find_sql, (target_day_of_month,))
             tenants_to_remind = cur.fetchall()
     except Exception as e:
-        print(f"❌ Reminder failed: Error querying users table: {e}")
+        logger.error("Reminder failed: error querying users table: %s", e)
         conn.close()
         return
         
-    print(f"ℹ️ Found {len(tenants_to_remind)} tenants who need to pay rent on {target_date} (Day {target_day_of_month}).")
+    logger.info("Found tenants to remind", extra={"tenants": len(tenants_to_remind), "target_date": target_date.isoformat()})
     
     sent_count = 0
     for tenant in tenants_to_remind:
@@ -841,7 +1228,7 @@ def run_proactive_reminders(days_in_advance: int = 5):
             sent_count += 1
         
     conn.close()
-    print(f"✅ Reminder check complete. Successfully sent {sent_count} emails.")
+    logger.info("Reminder check complete", extra={"emails_sent": sent_count})
 
 
 # --- [FIX] 在脚本加载时立即运行数据库初始化 ---
@@ -854,15 +1241,13 @@ if __name__ == "__main__":
     Allows this file to be run directly (e.g., `python llm3_new.py`)
     to manually trigger the reminder check.
     """
-    print("==========================================")
-    print("   Running proactive reminder check as a standalone script...   ")
-    print("==========================================")
+    logger.info("Running proactive reminder check as a standalone script")
     
     load_dotenv() 
     
     db_url = os.getenv("DATABASE_URL")
     if not db_url:
-        print("❌ Error: DATABASE_URL not set in .env file. Cannot run reminders.")
+        logger.error("DATABASE_URL not set in .env file, cannot run reminders")
     else:
         run_proactive_reminders(days_in_advance=5)
 # --- [END PROACTIVE-EMAIL-MOD] ---
@@ -0,0 +1,219 @@
+# backend/llm_hedging.py
+"""
+Per-route deadlines, hedged requests and model fallback for chat completions.
+
+``hedged_chat_model(cls)`` subclasses a LangChain chat model so that each call:
+
+1. starts the primary request,
+2. if it has not answered after the model's recent p``LLM_HEDGE_PERCENTILE``
+   latency, sends one identical hedge request and takes whichever answers first —
+   unless the hedge budget (``LLM_HEDGE_BUDGET`` of recent calls, process-wide) is
+   spent or ``llm_scheduler`` has no free slot, since under overload a hedge only
+   doubles the load,
+3. gives up on both at the route deadline (or when the primary fails) and, if a
+   ``fallback`` model is configured, asks it instead (``LLM_FALLBACK_TIMEOUT_S``),
+4. otherwise raises ``LLMDeadlineExceeded``.
+
+The deadline comes from ``llm_deadline(route)``, set around a whole route in
+``TenantChatbot.process_query``; an agent that makes several calls shares one
+budget. Abandoned requests finish in the background and are bounded by the
+client's own ``timeout``.
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Optional
+
+from backend import metrics
+from backend.llm_scheduler import llm_scheduler
+
+# 每个路由的总时限（秒），可用 LLM_DEADLINE_<ROUTE>_S 覆盖
+ROUTE_DEADLINES_S = {
+    "rag": 20.0,
+    "calc_agent": 30.0,
+    "general_chat": 15.0,
+    "extraction": 60.0,
+}
+DEFAULT_DEADLINE_S = float(os.getenv("LLM_DEFAULT_DEADLINE_S", "30"))
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))  # 0 表示不发 hedge
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_S", "3.0"))
+HEDGE_MIN_DELAY_S = float(os.getenv("LLM_HEDGE_MIN_DELAY_S", "0.5"))
+# 最多给滚动窗口内这个比例的调用发 hedge（至少允许 LLM_HEDGE_BUDGET_MIN 个）
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+HEDGE_BUDGET_WINDOW_S = float(os.getenv("LLM_HEDGE_BUDGET_WINDOW_S", "60"))
+HEDGE_BUDGET_MIN = int(os.getenv("LLM_HEDGE_BUDGET_MIN", "1"))
+FALLBACK_TIMEOUT_S = float(os.getenv("LLM_FALLBACK_TIMEOUT_S", "15"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "32")), thread_name_prefix="llm-hedge"
+)
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    pass
+
+
+def route_deadline_s(route: str) -> float:
+    env = os.getenv(f"LLM_DEADLINE_{route.upper()}_S")
+    return float(env) if env else ROUTE_DEADLINES_S.get(route, DEFAULT_DEADLINE_S)
+
+
+@contextmanager
+def llm_deadline(route: str):
+    """All chat-model calls inside the block must finish within the route's deadline."""
+    token = _deadline.set(time.monotonic() + route_deadline_s(route))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per model, used to pick the hedge delay."""
+
+    def __init__(self, window: int = 200):
+        self._window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self._window)).append(seconds)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        if HEDGE_PERCENTILE <= 0:
+            return None
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_S
+        idx = min(len(samples) - 1, int(HEDGE_PERCENTILE / 100.0 * len(samples)))
+        return max(HEDGE_MIN_DELAY_S, samples[idx])
+
+
+latency_tracker = LatencyTracker()
+
+
+class HedgeBudget:
+    """Caps hedges at ``ratio`` of the calls started in the last ``window_s`` seconds (all models)."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, window_s: float = HEDGE_BUDGET_WINDOW_S,
+                 minimum: int = HEDGE_BUDGET_MIN):
+        self.ratio = ratio
+        self.window_s = window_s
+        self.minimum = minimum
+        self._calls: Deque[float] = deque()
+        self._hedges: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._calls.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the budget; False if the window has used it up."""
+        now = time.monotonic()
+        with self._lock:
+            for samples in (self._calls, self._hedges):
+                while samples and samples[0] <= now - self.window_s:
+                    samples.popleft()
+            if len(self._hedges) >= max(self.minimum, self.ratio * len(self._calls)):
+                return False
+            self._hedges.append(now)
+            return True
+
+
+hedge_budget = HedgeBudget()
+
+
+def _submit(fn: Callable[[], Any]) -> Future:
+    # 每次提交各拷一份 context，租户 / 优先级 / 日志字段跟着进工作线程
+    return _executor.submit(contextvars.copy_context().run, fn)
+
+
+def _model_label(model: Any) -> str:
+    return str(getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__)
+
+
+def _race(call: Callable[[], Any], model: str, deadline: float) -> Any:
+    """Primary + at most one hedge, until the first success or the deadline."""
+    hedge_at = None
+    delay = latency_tracker.hedge_delay(model)
+    start = time.monotonic()
+    if delay is not None:
+        hedge_at = start + delay
+    hedge_budget.record_call()
+    pending = {_submit(call): "primary"}
+    error: Optional[BaseException] = None
+
+    while pending:
+        now = time.monotonic()
+        wake = deadline if hedge_at is None else min(deadline, hedge_at)
+        done, _ = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            kind = pending.pop(future)
+            if future.exception() is None:
+                latency_tracker.observe(model, time.monotonic() - start)
+                metrics.LLM_CALL_OUTCOMES.labels(model=model, outcome=f"{kind}_won").inc()
+                return future.result()
+            error = future.exception()
+        if error is not None and not pending:
+            break
+        if time.monotonic() >= deadline:
+            metrics.LLM_CALL_OUTCOMES.labels(model=model, outcome="deadline_exceeded").inc()
+            error = error or LLMDeadlineExceeded(f"{model} did not answer before the deadline")
+            break
+        if hedge_at is not None and time.monotonic() >= hedge_at and error is None:
+            hedge_at = None
+            # hedge 也要排队拿 slot：调度器已经满了就不发，避免在容量最紧的时候把负载翻倍
+            if not llm_scheduler.has_free_slot():
+                metrics.LLM_CALL_OUTCOMES.labels(model=model, outcome="hedge_skipped_queue").inc()
+            elif not hedge_budget.try_spend():
+                metrics.LLM_CALL_OUTCOMES.labels(model=model, outcome="hedge_skipped_budget").inc()
+            else:
+                metrics.LLM_CALL_OUTCOMES.labels(model=model, outcome="hedged").inc()
+                pending[_submit(call)] = "hedge"
+    raise error
+
+
+def hedged_chat_model(model_cls):
+    """Subclass a LangChain chat model with deadlines, hedging and an optional ``fallback`` model."""
+
+    class Hedged(model_cls):
+        fallback: Any = None
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            model = _model_label(self)
+            deadline = _deadline.get() or time.monotonic() + DEFAULT_DEADLINE_S
+            generate = super()._generate
+            try:
+                return _race(lambda: generate(messages, stop=stop, **kwargs), model, deadline)
+            except Exception:
+                if self.fallback is None:
+                    metrics.record_error("llm_deadline")
+                    raise
+            fallback_model = _model_label(self.fallback)
+            future = _submit(lambda: self.fallback._generate(messages, stop=stop, **kwargs))
+            try:
+                result = future.result(timeout=FALLBACK_TIMEOUT_S)
+            except Exception as e:
+                metrics.LLM_CALL_OUTCOMES.labels(model=fallback_model, outcome="fallback_failed").inc()
+                metrics.record_error("llm_deadline")
+                if isinstance(e, FutureTimeoutError):
+                    raise LLMDeadlineExceeded(f"{model} and fallback {fallback_model} both timed out") from e
+                raise
+            metrics.LLM_CALL_OUTCOMES.labels(model=fallback_model, outcome="fallback_used").inc()
+            return result
+
+    Hedged.__name__ = Hedged.__qualname__ = f"Hedged{model_cls.__name__}"
+    return Hedged
@@ -0,0 +1,224 @@
+# backend/llm_scheduler.py
+"""
+Admission control and tenant-fair scheduling for OpenAI calls.
+
+Every chat completion and embedding request made by ``llm``, ``extraction_llm`` and
+``embeddings`` (see ``llm3_new.py``) first takes one of ``LLM_MAX_CONCURRENCY``
+slots. When all slots are busy, callers wait in per-tenant queues:
+
+- INTERACTIVE (``/chat``) is always served before BACKGROUND (upload ingestion),
+- within a priority, tenants are served round-robin, so one tenant with many
+  queued calls (a bulk upload) cannot starve the others.
+
+``admission()`` wraps a whole request at the API edge and fails fast: once more
+than ``LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE`` interactive requests (or
+``LLM_MAX_BACKGROUND_QUEUE`` background ones) are already admitted and unfinished,
+it raises ``LLMOverloaded`` with a Retry-After estimate, which ``api.py`` turns into
+a 503 before any work (history writes, parsing) is done.
+
+Which tenant / priority a call belongs to comes from ``scheduling_context()``,
+a contextvar, so it follows the request into the thread pool.
+"""
+from __future__ import annotations
+
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from backend import metrics
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)  # 先服务前面的
+
+DEFAULT_TENANT = "-"
+
+_scheduling: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar(
+    "llm_scheduling", default=(DEFAULT_TENANT, BACKGROUND)
+)
+_holding_slot: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_holding_slot", default=False)
+
+
+class LLMOverloaded(Exception):
+    def __init__(self, priority: str, pending: int, retry_after: int):
+        super().__init__(f"LLM queue is full ({pending} {priority} requests pending)")
+        self.priority = priority
+        self.pending = pending
+        self.retry_after = retry_after
+
+
+@contextmanager
+def scheduling_context(tenant_id: str, priority: str = INTERACTIVE):
+    """Attribute all LLM / embedding calls made inside the block to this tenant and priority."""
+    token = _scheduling.set((tenant_id or DEFAULT_TENANT, priority))
+    try:
+        yield
+    finally:
+        _scheduling.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("tenant", "priority", "event")
+
+    def __init__(self, tenant: str, priority: str):
+        self.tenant = tenant
+        self.priority = priority
+        self.event = threading.Event()
+
+
+class FairScheduler:
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 64, max_background_queue: int = 16):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_background_queue = max_background_queue
+        self._lock = threading.Lock()
+        self._active = 0
+        # priority -> tenant -> 等待中的 ticket；OrderedDict 的顺序即轮转顺序
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = {p: 0 for p in PRIORITIES}
+        # 已放行但还没结束的请求数（含正在排队 / 正在调用 LLM 的）
+        self._pending = {p: 0 for p in PRIORITIES}
+        # 单次调用占用 slot 的平均时长（EWMA），用于估算 Retry-After
+        self._avg_hold_s = 1.0
+
+    @classmethod
+    def from_env(cls) -> "FairScheduler":
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+            max_background_queue=int(os.getenv("LLM_MAX_BACKGROUND_QUEUE", "16")),
+        )
+
+    # === Admission ===
+    @contextmanager
+    def admission(self, priority: str = INTERACTIVE):
+        """Admit one request of this priority for the duration of the block, or raise ``LLMOverloaded``."""
+        limit = self.max_concurrency + self.max_queue if priority == INTERACTIVE else self.max_background_queue
+        with self._lock:
+            pending = self._pending[priority]
+            if pending >= limit:
+                retry_after = self._retry_after_locked(pending)
+            else:
+                self._pending[priority] += 1
+                retry_after = None
+        if retry_after is not None:
+            metrics.LLM_ADMISSION_REJECTED.labels(priority=priority).inc()
+            raise LLMOverloaded(priority, pending, retry_after)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending[priority] -= 1
+
+    def _retry_after_locked(self, pending: int) -> int:
+        return max(1, math.ceil((pending + 1) / max(1, self.max_concurrency) * self._avg_hold_s))
+
+    # === Slots ===
+    @contextmanager
+    def slot(self):
+        if _holding_slot.get():
+            # 嵌套调用（同一线程已持有 slot）不重复排队，避免自己等自己
+            yield
+            return
+        tenant, priority = _scheduling.get()
+        waited = self._acquire(tenant, priority)
+        metrics.CHAT_STAGE_LATENCY.labels(stage="llm_queue").observe(waited)
+        token = _holding_slot.set(True)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _holding_slot.reset(token)
+            self._release(time.perf_counter() - start)
+
+    def _acquire(self, tenant: str, priority: str) -> float:
+        start = time.perf_counter()
+        with self._lock:
+            if self._active < self.max_concurrency and not any(self._queued.values()):
+                self._active += 1
+                metrics.LLM_INFLIGHT.set(self._active)
+                return 0.0
+            ticket = _Ticket(tenant, priority)
+            self._queues[priority].setdefault(tenant, deque()).append(ticket)
+            self._queued[priority] += 1
+            metrics.LLM_QUEUE_DEPTH.labels(priority=priority).set(self._queued[priority])
+        ticket.event.wait()
+        return time.perf_counter() - start
+
+    def _release(self, held_s: float) -> None:
+        with self._lock:
+            self._avg_hold_s = 0.8 * self._avg_hold_s + 0.2 * held_s
+            ticket = self._next_ticket_locked()
+            if ticket is None:
+                self._active -= 1
+                metrics.LLM_INFLIGHT.set(self._active)
+            else:
+                # slot 直接交给下一个等待者，_active 不变
+                ticket.event.set()
+
+    def _next_ticket_locked(self) -> Optional[_Ticket]:
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            tenant, waiting = next(iter(tenants.items()))
+            ticket = waiting.popleft()
+            if waiting:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+            self._queued[priority] -= 1
+            metrics.LLM_QUEUE_DEPTH.labels(priority=priority).set(self._queued[priority])
+            return ticket
+        return None
+
+    def has_free_slot(self) -> bool:
+        """True if a call started now would run without queueing (used to skip hedges under load)."""
+        with self._lock:
+            return self._active < self.max_concurrency and not any(self._queued.values())
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "active": self._active,
+                **{f"queued_{p}": n for p, n in self._queued.items()},
+                **{f"pending_{p}": n for p, n in self._pending.items()},
+            }
+
+
+llm_scheduler = FairScheduler.from_env()
+
+
+def scheduled_chat_model(model_cls):
+    """Subclass a LangChain chat model so every completion goes through ``llm_scheduler``."""
+
+    class Scheduled(model_cls):
+        def _generate(self, *args, **kwargs):
+            with llm_scheduler.slot():
+                return super()._generate(*args, **kwargs)
+
+    Scheduled.__name__ = Scheduled.__qualname__ = f"Scheduled{model_cls.__name__}"
+    return Scheduled
+
+
+class ScheduledEmbeddings:
+    """Wrap an embeddings object so ``embed_documents`` / ``embed_query`` take a scheduler slot."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with llm_scheduler.slot():
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with llm_scheduler.slot():
+            return self.inner.embed_query(text)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
@@ -0,0 +1,141 @@
+# backend/local_embeddings.py
+"""
+Local CPU embeddings for ``EMBEDDINGS_BACKEND=LOCAL``.
+
+Runs an ONNX export of a sentence-transformer (default: all-MiniLM-L6-v2, quantized)
+with onnxruntime + the HuggingFace ``tokenizers`` library. No network access is needed
+once the model directory exists, and the model is loaded once per process.
+
+Model directory layout (as published in the sentence-transformers HF repos)::
+
+    <LOCAL_EMBEDDING_MODEL_DIR>/tokenizer.json
+    <LOCAL_EMBEDDING_MODEL_DIR>/onnx/model_quint8_avx2.onnx
+
+Fetch it once (on a machine with internet access):
+
+    python -m backend.local_embeddings --download
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+LOCAL_EMBEDDING_REPO = os.getenv("LOCAL_EMBEDDING_REPO", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR", "backend/models/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_ONNX_FILE = os.getenv("LOCAL_EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))  # 0 = onnxruntime 默认
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv("LOCAL_EMBEDDING_MAX_LENGTH", "256"))
+
+
+class LocalOnnxEmbeddings:
+    """Same interface as ``OpenAIEmbeddings`` (``embed_documents`` / ``embed_query``)."""
+
+    def __init__(
+        self,
+        model_dir: str = LOCAL_EMBEDDING_MODEL_DIR,
+        onnx_file: str = LOCAL_EMBEDDING_ONNX_FILE,
+        threads: int = LOCAL_EMBEDDING_THREADS,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+        max_length: int = LOCAL_EMBEDDING_MAX_LENGTH,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, onnx_file)
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        if not (os.path.exists(model_path) and os.path.exists(tokenizer_path)):
+            raise RuntimeError(
+                f"Local embedding model not found in {model_dir}. "
+                f"Run `python -m backend.local_embeddings --download` first."
+            )
+
+        self.batch_size = max(1, batch_size)
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        # onnxruntime 的 InferenceSession.run 是线程安全的，这里不加锁
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        width = max(len(e.ids) for e in encodings)
+        input_ids = np.zeros((len(texts), width), dtype=np.int64)
+        attention_mask = np.zeros((len(texts), width), dtype=np.int64)
+        for row, enc in enumerate(encodings):
+            n = len(enc.ids)
+            input_ids[row, :n] = enc.ids
+            attention_mask[row, :n] = 1
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]  # (batch, seq, dim)
+        # sentence-transformers 的 mean pooling + L2 归一化
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # 按长度排序后分批，减少 padding 带来的无效计算
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            vectors = self._encode_batch([texts[i] for i in idx])
+            for i, vec in zip(idx, vectors):
+                out[i] = vec.tolist()
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode_batch([text])[0].tolist()
+
+
+_instance: Optional[LocalOnnxEmbeddings] = None
+_instance_lock = threading.Lock()
+
+
+def get_local_embeddings() -> LocalOnnxEmbeddings:
+    """Process-wide singleton; the ONNX session is only loaded once."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = LocalOnnxEmbeddings()
+    return _instance
+
+
+def download_model(repo_id: str = LOCAL_EMBEDDING_REPO, model_dir: str = LOCAL_EMBEDDING_MODEL_DIR) -> str:
+    from huggingface_hub import hf_hub_download
+
+    for filename in ("tokenizer.json", LOCAL_EMBEDDING_ONNX_FILE):
+        hf_hub_download(repo_id=repo_id, filename=filename, local_dir=model_dir)
+    print(f"✅ Local embedding model saved to {model_dir}")
+    return model_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local ONNX embedding model helper")
+    parser.add_argument("--download", action="store_true", help="Fetch the model files from HuggingFace")
+    parser.add_argument("--repo", default=LOCAL_EMBEDDING_REPO)
+    parser.add_argument("--model-dir", default=LOCAL_EMBEDDING_MODEL_DIR)
+    args = parser.parse_args()
+    if args.download:
+        download_model(args.repo, args.model_dir)
+    else:
+        emb = LocalOnnxEmbeddings(model_dir=args.model_dir)
+        print(f"✅ Loaded; embedding dim = {len(emb.embed_query('hello'))}")
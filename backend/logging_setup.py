@@ -0,0 +1,182 @@
+# backend/logging_setup.py
+"""
+Structured, non-blocking logging for the backend.
+
+Records are handed to a ``QueueHandler`` on the request path (one ``put_nowait``),
+and a background ``QueueListener`` thread does the JSON formatting and the actual
+write to stdout. Each record carries the correlation fields bound with
+``log_context()`` (``request_id``, ``tenant_id`` ...) plus any ``extra={...}``.
+
+Environment:
+    LOG_LEVEL        DEBUG / INFO / WARNING / ERROR         (default INFO)
+    LOG_FORMAT       json / text                            (default json)
+    LOG_SAMPLE_RATE  fraction of DEBUG/INFO records kept    (default 1.0)
+    LOG_QUEUE_SIZE   max queued records, overflow dropped   (default 10000)
+
+WARNING and above are never sampled. A single call can override the rate with
+``extra={"sample_rate": 0.01}``.
+"""
+from __future__ import annotations
+
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+_log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+# LogRecord 自带的属性，格式化时不当作 extra 字段输出
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample_rate"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+# === Correlation context ===
+def bind_log_context(**fields: Any) -> contextvars.Token:
+    """Add fields to every record logged from the current context (request / task / thread)."""
+    return _log_context.set({**_log_context.get(), **fields})
+
+
+def reset_log_context(token: contextvars.Token) -> None:
+    _log_context.reset(token)
+
+
+@contextmanager
+def log_context(**fields: Any):
+    token = bind_log_context(**fields)
+    try:
+        yield
+    finally:
+        reset_log_context(token)
+
+
+def get_log_context() -> Dict[str, Any]:
+    return dict(_log_context.get())
+
+
+# === Handlers / formatters ===
+class _ContextSamplingFilter(logging.Filter):
+    """Runs in the caller's thread: drops sampled-out records and snapshots the context."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            rate = getattr(record, "sample_rate", self.sample_rate)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        # contextvars 不会跟着 record 进后台线程，这里先拷一份
+        record.context = _log_context.get()
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and defers all formatting to the listener thread."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 默认实现会在调用线程里 format 消息；同一进程内的队列不需要序列化，直接传 record
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != "context":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format for local development (``LOG_FORMAT=text``)."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {**(getattr(record, "context", None) or {})}
+        fields.update({k: v for k, v in record.__dict__.items() if k not in _RESERVED_ATTRS and k != "context"})
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    stream=None,
+) -> None:
+    """Install the queue handler on the ``backend`` logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    if sample_rate is None:
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    q: queue.Queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = _NonBlockingQueueHandler(q)
+    handler.addFilter(_ContextSamplingFilter(sample_rate))
+
+    root = logging.getLogger("backend")
+    root.setLevel(level)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(q, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        for handler in list(logging.getLogger("backend").handlers):
+            if isinstance(handler, _NonBlockingQueueHandler):
+                logging.getLogger("backend").removeHandler(handler)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the ``backend`` hierarchy; configures logging on first use."""
+    configure_logging()
+    if not name.startswith("backend"):
+        name = f"backend.{name}"
+    return logging.getLogger(name)
@@ -0,0 +1,170 @@
+# backend/metrics.py
+"""
+Prometheus metrics for the API (exposed at ``/metrics`` by ``backend/api.py``).
+
+- ``chat_route_latency_seconds{route}``: end-to-end ``TenantChatbot.process_query`` per route
+  (maintenance, status, rag, calc_agent, general_chat)
+- ``chat_stage_latency_seconds{stage}``: stages inside a request
+  (routing, history_load, retrieval, context_pack, llm_queue, llm_call, db_write)
+- ``http_request_latency_seconds{method,endpoint,status}``: every HTTP request
+- counters for DB connections, cache hits/misses, LLM tokens, RAG tokens saved and errors
+- LLM scheduler in-flight calls, queue depth and admission rejections
+- hedged-request / deadline / fallback outcomes per model
+- cross-worker tenant invalidations received
+- background chat-summary updates
+
+With several uvicorn/gunicorn workers, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty
+directory shared by the workers; ``/metrics`` then aggregates all of them.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# LLM 调用是秒级，DB / 检索是毫秒级，桶需要同时覆盖两者
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_latency_seconds",
+    "HTTP request latency by endpoint",
+    ["method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+CHAT_ROUTE_LATENCY = Histogram(
+    "chat_route_latency_seconds",
+    "TenantChatbot.process_query latency by route",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+CHAT_STAGE_LATENCY = Histogram(
+    "chat_stage_latency_seconds",
+    "Latency of individual stages inside a chat request",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_CONNECTIONS = Counter(
+    "db_connections_total",
+    "PostgreSQL connections opened",
+    ["caller"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache name and result",
+    ["cache", "result"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM tokens reported by the OpenAI API",
+    ["model", "kind"],
+)
+RAG_TOKENS_SAVED = Counter(
+    "rag_context_tokens_saved_total",
+    "Prompt tokens removed by the RAG context packer",
+)
+LLM_INFLIGHT = Gauge(
+    "llm_inflight_calls",
+    "OpenAI calls currently holding a scheduler slot",
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "llm_queue_depth",
+    "OpenAI calls waiting for a scheduler slot",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+LLM_ADMISSION_REJECTED = Counter(
+    "llm_admission_rejected_total",
+    "Requests rejected with 503 because the LLM queue was full",
+    ["priority"],
+)
+LLM_CALL_OUTCOMES = Counter(
+    "llm_call_outcomes_total",
+    "Chat-model call outcomes: primary_won, hedged, hedge_won, hedge_skipped_queue, hedge_skipped_budget, "
+    "deadline_exceeded, fallback_used, fallback_failed",
+    ["model", "outcome"],
+)
+TENANT_INVALIDATIONS = Counter(
+    "tenant_invalidations_total",
+    "Tenant invalidation events received by this worker",
+    ["kind"],
+)
+CHAT_SUMMARY_UPDATES = Counter(
+    "chat_summary_updates_total",
+    "Background rolling-summary updates by result (updated, skipped, failed)",
+    ["result"],
+)
+CONTRACT_FAQ_JOBS = Counter(
+    "contract_faq_jobs_total",
+    "Background contract FAQ generation jobs by result (generated, stale: contract replaced, failed)",
+    ["result"],
+)
+REMINDER_SENDS = Counter(
+    "reminder_sends_total",
+    "Rent reminder outcomes by result (sent, failed, skipped: already sent or claimed elsewhere)",
+    ["result"],
+)
+ERRORS = Counter(
+    "errors_total",
+    "Errors by component",
+    ["component"],
+)
+
+
+def render_latest() -> bytes:
+    """Exposition for ``/metrics``: this process, or every worker in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+@contextmanager
+def track_stage(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        CHAT_STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def track_route(route: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        CHAT_ROUTE_LATENCY.labels(route=route).observe(time.perf_counter() - start)
+
+
+def record_db_connection(caller: str) -> None:
+    DB_CONNECTIONS.labels(caller=caller).inc()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_error(component: str) -> None:
+    ERRORS.labels(component=component).inc()
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """LangChain callback that feeds ``llm_tokens_total`` from OpenAI ``token_usage``."""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        usage: Dict[str, Any] = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.labels(model=self.model, kind=kind.replace("_tokens", "")).inc(usage[kind])
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        record_error("llm")
@@ -0,0 +1,111 @@
+# backend/migrate_vector_stores.py
+"""
+Migrate per-tenant Chroma directories (VECTORSTORE_BACKEND=CHROMA) into the shared,
+sharded collection used by VECTORSTORE_BACKEND=CHROMA_SHARED.
+
+Embeddings are copied as-is, so no embedding API calls are made. The migration is
+idempotent: re-running it replaces each tenant's chunks in the shared store.
+
+    python -m backend.migrate_vector_stores --base-dir backend/vector_stores --shards 16
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import shutil
+import time
+
+from dotenv import load_dotenv
+
+from backend.vectorstore_backends import (
+    CHROMA_LEGACY_MARKER,
+    LEGACY_COLLECTION_NAME,
+    ChromaSharedBackend,
+    _open_client,
+    _reset_chroma_clients,
+    live_store_path,
+)
+
+TENANT_DIR_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+READ_PAGE_SIZE = 1000
+
+
+def _read_legacy_store(tenant_dir: str):
+    path = live_store_path(tenant_dir, CHROMA_LEGACY_MARKER)
+    if path is None:
+        raise FileNotFoundError(f"No Chroma store in {tenant_dir}")
+    client = _open_client(path)
+    collection = client.get_collection(LEGACY_COLLECTION_NAME)
+    embeddings, documents, metadatas = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=READ_PAGE_SIZE,
+            offset=offset,
+        )
+        if not page["ids"]:
+            break
+        embeddings.extend(list(e) for e in page["embeddings"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        offset += len(page["ids"])
+    return embeddings, documents, metadatas
+
+
+def migrate(base_dir: str, shards: int, delete_source: bool = False, dry_run: bool = False) -> dict:
+    tenant_dirs = sorted(
+        name for name in os.listdir(base_dir)
+        if TENANT_DIR_PATTERN.match(name) and os.path.isdir(os.path.join(base_dir, name))
+    )
+    print(f"🔎 Found {len(tenant_dirs)} per-tenant stores under {base_dir}")
+
+    # 共享库还没对外服务，被重跑替换掉的旧版本 chunk 不需要宽限期
+    shared = None if dry_run else ChromaSharedBackend(base_dir, embeddings=None, shards=shards, gc_grace_s=0.0)
+    report = {"tenants": len(tenant_dirs), "migrated": 0, "chunks": 0, "failed": 0}
+    started = time.perf_counter()
+
+    for i, key in enumerate(tenant_dirs, 1):
+        path = os.path.join(base_dir, key)
+        try:
+            embeddings, documents, metadatas = _read_legacy_store(path)
+            if not dry_run:
+                shared.add_raw(key, embeddings=embeddings, documents=documents, metadatas=metadatas)
+                shared.collect_retired()
+                if delete_source:
+                    shutil.rmtree(path)
+            report["migrated"] += 1
+            report["chunks"] += len(documents)
+        except Exception as e:
+            report["failed"] += 1
+            print(f"❌ Failed to migrate {key}: {e}")
+        finally:
+            # chromadb 按路径缓存 System，迁移上万个目录时要释放，否则内存持续增长；
+            # 共享库自己的 client 在缓存之外持有引用，不受影响
+            _reset_chroma_clients()
+        if i % 500 == 0:
+            print(f"… {i}/{len(tenant_dirs)} tenants processed")
+
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    print(
+        f"✅ Migration finished: {report['migrated']}/{report['tenants']} tenants, "
+        f"{report['chunks']} chunks, {report['failed']} failed in {report['seconds']}s"
+    )
+    return report
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-dir", default=os.getenv("VECTOR_STORE_DIR", "backend/vector_stores"))
+    parser.add_argument("--shards", type=int, default=int(os.getenv("VECTORSTORE_SHARDS", "1")))
+    parser.add_argument("--delete-source", action="store_true",
+                        help="Remove each per-tenant directory after it has been copied.")
+    parser.add_argument("--dry-run", action="store_true", help="Only read the source stores.")
+    args = parser.parse_args()
+    migrate(args.base_dir, args.shards, delete_source=args.delete_source, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
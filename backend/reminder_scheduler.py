@@ -0,0 +1,301 @@
+# backend/reminder_scheduler.py
+"""
+Idempotent, crash-safe rent reminder scheduler.
+
+Every reminder is recorded in ``reminder_log`` under its key
+``(tenant_id, due_period, reminder_day)``: the rent due date it is about and the day it
+is sent. Sending is done in three steps:
+
+1. **claim**: upsert the keys as ``sending`` in one statement. Keys already ``sent``
+   or claimed by another live run are not returned, so that run skips them.
+2. **send** the email.
+3. **mark** the key ``sent`` (or ``failed``), committed straight after each email.
+
+Re-running the same day therefore sends nothing twice, and a run that crashed resumes
+with the tenants it had not reached. Failed sends are retried up to
+``REMINDER_MAX_ATTEMPTS`` times. A run that fails or is interrupted puts its unsent claims
+back at once. Claims left ``sending`` by a killed process are taken over after
+``REMINDER_CLAIM_TIMEOUT_S``. Only an email sent right before a kill, and not yet
+marked, can be sent a second time.
+
+Tenants are split into ``REMINDER_SHARDS`` shards by a stable hash of ``tenant_id``.
+The shards run in parallel threads, and ``--shard K`` runs a single shard so several
+hosts can share the work.
+
+    python -m backend.reminder_scheduler run               # once (cron / GitHub Actions)
+    python -m backend.reminder_scheduler serve             # long-running, every REMINDER_INTERVAL_S
+    python -m backend.reminder_scheduler run --shards 8 --shard 3
+"""
+from __future__ import annotations
+
+import argparse
+import calendar
+import datetime
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from dotenv import load_dotenv
+
+from backend import metrics
+from backend.logging_setup import get_logger, log_context
+
+load_dotenv()
+logger = get_logger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+REMINDER_DAYS_BEFORE = int(os.getenv("REMINDER_DAYS_BEFORE", "5"))
+REMINDER_DAYS_AFTER = int(os.getenv("REMINDER_DAYS_AFTER", "2"))
+REMINDER_SHARDS = int(os.getenv("REMINDER_SHARDS", "4"))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", "3"))
+REMINDER_CLAIM_TIMEOUT_S = int(os.getenv("REMINDER_CLAIM_TIMEOUT_S", "600"))
+REMINDER_INTERVAL_S = int(os.getenv("REMINDER_INTERVAL_S", "3600"))
+# 每条 claim 语句最多包含的租户数；进程被杀掉时最多这么多提醒要等认领超时
+CLAIM_BATCH = 100
+
+REMINDER_LOG_DDL = """
+CREATE TABLE IF NOT EXISTS reminder_log (
+    tenant_id TEXT NOT NULL,
+    due_period DATE NOT NULL,
+    reminder_day DATE NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('sending','sent','failed')),
+    attempts INT NOT NULL DEFAULT 1,
+    claimed_by TEXT,
+    claimed_at TIMESTAMP,
+    sent_at TIMESTAMP,
+    last_error TEXT,
+    PRIMARY KEY (tenant_id, due_period, reminder_day)
+);
+"""
+
+# (tenant_id, user_name, rent_due_day, due_date)
+Candidate = Tuple[str, Optional[str], int, datetime.date]
+Sender = Callable[[str, str, str], bool]
+
+
+def shard_of(tenant_id: str, shards: int) -> int:
+    """Stable across processes and hosts (unlike ``hash()``)."""
+    return int(hashlib.sha256(tenant_id.encode("utf-8")).hexdigest()[:8], 16) % shards
+
+
+def due_date_for(today: datetime.date, rent_due_day: int) -> Optional[datetime.date]:
+    """The due date whose reminder window contains ``today``, or None.
+
+    A due day past the end of the month falls on the month's last day (31 -> 30 Apr),
+    and windows cross month boundaries (due on the 2nd -> reminders from the 28th).
+    """
+    for months_ahead in (-1, 0, 1):
+        month_index = today.year * 12 + today.month - 1 + months_ahead
+        year, month = divmod(month_index, 12)
+        month += 1
+        day = min(rent_due_day, calendar.monthrange(year, month)[1])
+        due = datetime.date(year, month, day)
+        if -REMINDER_DAYS_AFTER <= (due - today).days <= REMINDER_DAYS_BEFORE:
+            return due
+    return None
+
+
+class ReminderScheduler:
+    def __init__(self, db_url: str = DATABASE_URL, send: Optional[Sender] = None,
+                 shards: int = REMINDER_SHARDS, worker_id: Optional[str] = None):
+        if not db_url:
+            raise ValueError("❌ Missing DATABASE_URL")
+        if send is None:
+            from backend.send_rent_reminders import send_email
+            send = send_email
+        self.db_url = db_url
+        self.send = send
+        self.shards = max(1, shards)
+        self.worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def _connect(self):
+        metrics.record_db_connection("reminders")
+        return psycopg2.connect(self.db_url)
+
+    # === Run ===
+    def run_once(self, today: Optional[datetime.date] = None, only_shard: Optional[int] = None) -> Dict[str, int]:
+        today = today or datetime.date.today()
+        candidates = self._candidates(today)
+        by_shard: Dict[int, List[Candidate]] = {}
+        for row in candidates:
+            shard = shard_of(row[0], self.shards)
+            if only_shard is None or shard == only_shard:
+                by_shard.setdefault(shard, []).append(row)
+
+        report = {"candidates": len(candidates), "sent": 0, "failed": 0, "skipped": 0}
+        if by_shard:
+            with ThreadPoolExecutor(max_workers=len(by_shard), thread_name_prefix="reminder-shard") as pool:
+                for result in pool.map(lambda item: self._run_shard(item[0], item[1], today), by_shard.items()):
+                    for key, value in result.items():
+                        report[key] += value
+
+        logger.info("Reminder run finished", extra={
+            "date": today.isoformat(), "shards": self.shards, "only_shard": only_shard, **report,
+        })
+        return report
+
+    def serve(self, interval_s: int = REMINDER_INTERVAL_S, only_shard: Optional[int] = None) -> None:
+        """Run forever. Running more often than daily is safe: each reminder is sent once."""
+        logger.info("Reminder scheduler started", extra={"interval_s": interval_s, "worker_id": self.worker_id})
+        while True:
+            try:
+                self.run_once(only_shard=only_shard)
+            except Exception:
+                logger.exception("Reminder run failed")
+            time.sleep(interval_s)
+
+    # === Steps ===
+    def _candidates(self, today: datetime.date) -> List[Candidate]:
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REMINDER_LOG_DDL)
+                cur.execute(
+                    """
+                    SELECT tenant_id, user_name, rent_due_day FROM users
+                    WHERE rent_due_day IS NOT NULL
+                      AND (lease_end_date IS NULL OR lease_end_date >= %s);
+                    """,
+                    (today,),
+                )
+                rows = cur.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+
+        candidates = []
+        for tenant_id, user_name, rent_due_day in rows:
+            try:
+                rent_due_day = int(rent_due_day)
+            except (TypeError, ValueError):
+                logger.warning("Invalid rent_due_day", extra={"tenant_id": tenant_id, "rent_due_day": rent_due_day})
+                continue
+            due = due_date_for(today, rent_due_day)
+            if due is not None:
+                candidates.append((tenant_id, user_name, rent_due_day, due))
+        return candidates
+
+    def _run_shard(self, shard: int, rows: List[Candidate], today: datetime.date) -> Dict[str, int]:
+        from backend.send_rent_reminders import rent_reminder_email
+
+        result = {"sent": 0, "failed": 0, "skipped": 0}
+        unsent: set = set()
+        conn = self._connect()
+        try:
+            for start in range(0, len(rows), CLAIM_BATCH):
+                batch = rows[start:start + CLAIM_BATCH]
+                claimed = self._claim(conn, batch, today)
+                unsent = set(claimed)
+                result["skipped"] += len(batch) - len(claimed)
+                for tenant_id, user_name, rent_due_day, due in batch:
+                    if tenant_id not in claimed:
+                        continue
+                    with log_context(tenant_id=tenant_id):
+                        subject, body = rent_reminder_email(user_name, rent_due_day, due)
+                        try:
+                            ok = self.send(tenant_id, subject, body)
+                        except Exception:
+                            logger.exception("Reminder send raised")
+                            ok = False
+                        self._finish(conn, tenant_id, due, today, ok)
+                    unsent.discard(tenant_id)
+                    result["sent" if ok else "failed"] += 1
+        except BaseException:
+            # 中途出错 / Ctrl+C：把本 shard 认领了但还没发的提醒放回去，下次运行马上就能重试，
+            # 不用等 REMINDER_CLAIM_TIMEOUT_S（进程被直接杀掉时才需要等）
+            self._release(conn, unsent, today)
+            raise
+        finally:
+            conn.close()
+        for key, value in result.items():
+            metrics.REMINDER_SENDS.labels(result=key).inc(value)
+        logger.debug("Reminder shard finished", extra={"shard": shard, **result})
+        return result
+
+    def _claim(self, conn, batch: List[Candidate], today: datetime.date) -> set:
+        now = datetime.datetime.utcnow()
+        stale = now - datetime.timedelta(seconds=REMINDER_CLAIM_TIMEOUT_S)
+        values, params = [], []
+        for tenant_id, _, _, due in batch:
+            values.append("(%s, %s, %s, 'sending', 1, %s, %s)")
+            params.extend((tenant_id, due, today, self.worker_id, now))
+        # 已发送的、其他 run 刚认领的、失败次数用完的都不会被 RETURNING 返回
+        sql = f"""
+            INSERT INTO reminder_log (tenant_id, due_period, reminder_day, status, attempts, claimed_by, claimed_at)
+            VALUES {", ".join(values)}
+            ON CONFLICT (tenant_id, due_period, reminder_day) DO UPDATE
+            SET status = 'sending',
+                attempts = reminder_log.attempts + 1,
+                claimed_by = EXCLUDED.claimed_by,
+                claimed_at = EXCLUDED.claimed_at
+            WHERE (reminder_log.status = 'failed' AND reminder_log.attempts < %s)
+               OR (reminder_log.status = 'sending' AND reminder_log.claimed_at < %s)
+            RETURNING tenant_id;
+        """
+        with conn.cursor() as cur:
+            cur.execute(sql, (*params, REMINDER_MAX_ATTEMPTS, stale))
+            claimed = {row[0] for row in cur.fetchall()}
+        conn.commit()
+        return claimed
+
+    def _finish(self, conn, tenant_id: str, due: datetime.date, today: datetime.date, ok: bool) -> None:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE reminder_log
+                SET status = %s, sent_at = %s, last_error = %s
+                WHERE tenant_id = %s AND due_period = %s AND reminder_day = %s AND claimed_by = %s;
+                """,
+                (
+                    "sent" if ok else "failed",
+                    datetime.datetime.utcnow() if ok else None,
+                    None if ok else "send failed",
+                    tenant_id, due, today, self.worker_id,
+                ),
+            )
+        conn.commit()
+
+    def _release(self, conn, tenant_ids: set, today: datetime.date) -> None:
+        if not tenant_ids:
+            return
+        try:
+            conn.rollback()
+            placeholders = ", ".join(["%s"] * len(tenant_ids))
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    UPDATE reminder_log
+                    SET status = 'failed', attempts = attempts - 1, last_error = 'claim released'
+                    WHERE claimed_by = %s AND status = 'sending' AND reminder_day = %s
+                      AND tenant_id IN ({placeholders});
+                    """,
+                    (self.worker_id, today, *tenant_ids),
+                )
+            conn.commit()
+            logger.warning("Released unsent reminder claims", extra={"tenants": len(tenant_ids)})
+        except Exception as e:
+            logger.error("Failed to release reminder claims (they expire after %ss): %s", REMINDER_CLAIM_TIMEOUT_S, e)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "serve"])
+    parser.add_argument("--shards", type=int, default=REMINDER_SHARDS)
+    parser.add_argument("--shard", type=int, help="Only process this shard (0-based)")
+    parser.add_argument("--interval", type=int, default=REMINDER_INTERVAL_S, help="Seconds between runs (serve)")
+    args = parser.parse_args()
+
+    scheduler = ReminderScheduler(shards=args.shards)
+    if args.command == "serve":
+        scheduler.serve(args.interval, only_shard=args.shard)
+    else:
+        report = scheduler.run_once(only_shard=args.shard)
+        raise SystemExit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
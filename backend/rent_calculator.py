@@ -0,0 +1,218 @@
+# backend/rent_calculator.py
+"""
+Deterministic rent arithmetic for calculator-style chat messages.
+
+``parse_calc_request`` turns a message into an intent with its slots, or returns
+``None`` if it cannot be sure (the caller then falls back to the ReAct agent):
+
+- ``total``:    "How much is $2500 for 15 months" / "total rent for 2 years" (+ "plus 2 months deposit")
+- ``prorated``: "prorated rent for 10 days in a 31-day month" / "prorate my rent if I move in on 2025-03-10"
+- ``deposit``:  "how much is a 2 months' deposit on $3200/month"
+
+When the message names no amount but says "rent", ``monthly_rent`` is ``None`` and the
+caller fills in the tenant's stored ``users.monthly_rent``. ``answer_calc_request`` then
+formats the result; no LLM is involved.
+"""
+from __future__ import annotations
+
+import calendar
+import datetime
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# 必须出现其一才当作计算请求，避免把合同问题（"How much notice ..."）误判
+CALC_CUES = (
+    "how much", "calculate", "compute", "work out", "total", "cost", "estimate",
+    "prorat", "pro-rat", "pro rata",
+)
+PRORATE_CUES = ("prorat", "pro-rat", "pro rata", "partial month")
+# 这些是合同条款问题（滞纳金、通知期、提前解约要赔多少……），答案在合同里，不是算术
+NOT_CALC_WORDS = re.compile(
+    r"\b(?:late|fees?|penalt\w*|notice|overdue|unpaid|interest|refund\w*|increase\w*"
+    r"|break\w*|terminat\w*|owe\w*|early|liab\w*|compensat\w*|lease|contract)\b"
+)
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "half a": 0.5, "double": 2, "twice": 2,
+}
+_NUM = r"(\d+(?:\.\d+)?|half a|an|a|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve)"
+_AMOUNT = r"(\d[\d,]*(?:\.\d+)?)(k)?"
+# "/month"、" a month" 属于金额本身，不能再被当成租期
+_RATE = r"(?:\s?(?:/|per |a )\s?(?:month|mo)\b|\s?monthly\b)?"
+
+_MONEY_PATTERNS = (
+    re.compile(r"(?:s\$|\$|sgd\s?)\s?" + _AMOUNT + r"\b" + _RATE),
+    re.compile(r"\b" + _AMOUNT + r"\s?(?:dollars|sgd)\b" + _RATE),
+    re.compile(r"\b" + _AMOUNT + r"\s?(?:/|per |a )\s?(?:month|mo)\b"),
+    re.compile(r"\brent (?:is|of|at|=) " + _AMOUNT + r"\b" + _RATE),
+)
+_DURATION = re.compile(r"\b" + _NUM + r"[\s-]?(months?|mos?|mths?|years?|yrs?|weeks?|wks?|days?)\b")
+_DEPOSIT_AFTER = re.compile(r"^['’]?s?\s*(?:of\s+)?(?:rent\s+)?(?:as\s+)?(?:(?:a|the)\s+)?(?:security\s+)?deposit")
+_DEPOSIT_BEFORE = re.compile(r"deposit\s*(?:of|is|=|:|equal to|equals|worth)?\s*$")
+_DEPOSIT_TIMES = re.compile(r"\b" + _NUM + r"\s?(?:x|times)\s+(?:the\s+)?(?:monthly\s+)?(?:rent\s+)?(?:as\s+)?(?:(?:a|the)\s+)?(?:security\s+)?deposit")
+_MONTH_DAYS = re.compile(r"\b(28|29|30|31)[\s-]?day month\b")
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_DAY_OF_MONTH = re.compile(r"\b(?:on|from) the (\d{1,2})(?:st|nd|rd|th)?\b")
+_MONTH_NAMES = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTH_NAMES.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+_MONTH_NAME = re.compile(r"\b(" + "|".join(sorted(_MONTH_NAMES, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?")
+
+_UNIT_MONTHS = {"m": 1.0, "y": 12.0}
+
+
+def _number(token: str) -> float:
+    return _NUMBER_WORDS[token] if token in _NUMBER_WORDS else float(token)
+
+
+def _amount(value: str, thousands: Optional[str]) -> float:
+    amount = float(value.replace(",", ""))
+    return amount * 1000 if thousands else amount
+
+
+def _overlaps(span: Tuple[int, int], taken: List[Tuple[int, int]]) -> bool:
+    return any(span[0] < end and start < span[1] for start, end in taken)
+
+
+def _find_money(q: str, taken: List[Tuple[int, int]]) -> Optional[float]:
+    amounts = []
+    for pattern in _MONEY_PATTERNS:
+        for m in pattern.finditer(q):
+            if not _overlaps(m.span(), taken):
+                taken.append(m.span())
+                amounts.append(_amount(m.group(1), m.group(2)))
+    if len(set(amounts)) > 1:
+        raise ValueError("several amounts")
+    return amounts[0] if amounts else None
+
+
+def _month_length(q: str, today: datetime.date) -> Tuple[int, str]:
+    m = _MONTH_DAYS.search(q)
+    if m:
+        return int(m.group(1)), f"a {m.group(1)}-day month"
+    m = _MONTH_NAME.search(q)
+    if m and m.group(1) not in ("may",):  # "may" 多半是情态动词
+        year = int(m.group(2)) if m.group(2) else today.year
+        month = _MONTH_NAMES[m.group(1)]
+        return calendar.monthrange(year, month)[1], f"{calendar.month_name[month]} {year}"
+    return 30, "a 30-day month"
+
+
+def parse_calc_request(query: str, today: Optional[datetime.date] = None) -> Optional[Dict[str, Any]]:
+    """Intent + slots for a calculator-style message, or ``None`` if it is not one (or is ambiguous)."""
+    q = " ".join(query.lower().split())
+    if not any(cue in q for cue in CALC_CUES) or NOT_CALC_WORDS.search(q):
+        return None
+    today = today or datetime.date.today()
+
+    # 日期、"31-day month"、"february 2025" 里的数字都不是金额或租期
+    taken: List[Tuple[int, int]] = [
+        m.span() for pattern in (_ISO_DATE, _MONTH_DAYS, _MONTH_NAME, _DAY_OF_MONTH) for m in pattern.finditer(q)
+    ]
+    try:
+        rent = _find_money(q, taken)
+    except ValueError:
+        return None
+
+    deposit_months = None
+    m = _DEPOSIT_TIMES.search(q)
+    if m and not _overlaps(m.span(), taken):
+        deposit_months = _number(m.group(1))
+        taken.append(m.span())
+
+    months = days = None
+    lease_span = None
+    for m in _DURATION.finditer(q):
+        if _overlaps(m.span(), taken):
+            continue
+        value, unit = _number(m.group(1)), m.group(2)[0]
+        if unit == "w":
+            return None  # 周租怎么折算要看合同，按月租摊只是近似，交给 agent
+        if unit == "d":
+            if days is not None:
+                return None
+            days = value
+            continue
+        is_deposit = _DEPOSIT_AFTER.match(q[m.end():]) or _DEPOSIT_BEFORE.search(q[:m.start()])
+        if is_deposit and unit == "m":
+            if deposit_months is not None:
+                return None
+            deposit_months = value
+        elif months is None:
+            months, duration_label, lease_span = value * _UNIT_MONTHS[unit], m.group(0), m.span()
+        else:
+            return None
+
+    if "deposit" in q and deposit_months is None and months is not None:
+        # "my deposit if it's 2 months rent"：唯一的月数就是押金倍数；"for 12 months ... deposit" 说不清，交给 agent
+        if not duration_label.endswith(("month", "months")) or re.search(r"\b(?:for|over)\s+$", q[:lease_span[0]]):
+            return None
+        deposit_months, months = _number(duration_label.split()[0]), None
+
+    if rent is None:
+        # 只有一个裸数字（"how much is 2500 for 15 months"）时把它当月租
+        bare = [n for n in re.finditer(r"\b\d[\d,]*(?:\.\d+)?\b", q) if not _overlaps(n.span(), taken)]
+        bare = [n for n in bare if not _overlaps(n.span(), [d.span() for d in _DURATION.finditer(q)])]
+        if len(bare) == 1 and _amount(bare[0].group(0), None) >= 100:
+            rent = _amount(bare[0].group(0), None)
+        elif bare or "rent" not in q:
+            return None  # 数字对不上，或者根本没说是租金
+
+    request: Dict[str, Any] = {"monthly_rent": rent}
+    if any(cue in q for cue in PRORATE_CUES) or (days is not None and months is None):
+        month_days, month_label = _month_length(q, today)
+        if days is None:
+            start = _ISO_DATE.search(q)
+            if start:
+                year, month, day = (int(g) for g in start.groups())
+                month_days, month_label = calendar.monthrange(year, month)[1], f"{calendar.month_name[month]} {year}"
+            else:
+                on_day = _DAY_OF_MONTH.search(q)
+                day = int(on_day.group(1)) if on_day else None
+            if not day or day > month_days:
+                return None
+            days = month_days - day + 1
+        if months is not None or days > month_days:
+            return None
+        request.update(intent="prorated", days=days, month_days=month_days, month_label=month_label)
+        return request
+
+    if months is not None:
+        request.update(intent="total", months=months, duration=duration_label, deposit_months=deposit_months)
+        return request
+    if deposit_months is not None:
+        request.update(intent="deposit", deposit_months=deposit_months)
+        return request
+    return None
+
+
+def format_money(value: float) -> str:
+    value = round(value, 2)
+    return f"${value:,.0f}" if value == int(value) else f"${value:,.2f}"
+
+
+def answer_calc_request(request: Dict[str, Any], rent_source: str = "") -> str:
+    """Reply for a parsed request whose ``monthly_rent`` is filled in."""
+    rent = request["monthly_rent"]
+    note = f" ({rent_source})" if rent_source else ""
+    intent = request["intent"]
+    if intent == "prorated":
+        amount = rent * request["days"] / request["month_days"]
+        return (
+            f"💰 Prorated rent for {request['days']:g} of {request['month_days']} days "
+            f"({request['month_label']}) at {format_money(rent)}/mo{note}: **{format_money(amount)}**."
+        )
+    if intent == "deposit":
+        months = request["deposit_months"]
+        return f"💰 A {months:g}-month security deposit at {format_money(rent)}/mo{note} is **{format_money(rent * months)}**."
+
+    total = rent * request["months"]
+    reply = f"💰 Estimated total rent for {request['duration']} at {format_money(rent)}/mo{note}: **{format_money(total)}**."
+    if request.get("deposit_months"):
+        deposit = rent * request["deposit_months"]
+        reply += (
+            f"\nWith a {request['deposit_months']:g}-month deposit of {format_money(deposit)}, "
+            f"that is **{format_money(total + deposit)}** in total."
+        )
+    return reply
@@ -0,0 +1,69 @@
+# backend/singleflight.py
+"""
+Per-key serialization and in-flight request coalescing for the async API.
+
+- ``KeyedLocks``: one ``asyncio.Lock`` per key (tenant), created on demand and
+  dropped when nobody holds or waits for it, so the table does not grow with the
+  number of tenants ever seen. Different keys never wait on each other.
+- ``SingleFlight``: while a call for a key is running, identical calls await the
+  same task instead of starting their own (e.g. a double-clicked "Send").
+"""
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+
+class KeyedLocks:
+    def __init__(self):
+        # key -> [lock, 持有或等待该锁的协程数]
+        self._locks: Dict[Hashable, List[Any]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run ``fn()`` for ``key`` or join the call already in flight.
+
+        Returns ``(result, shared)``; ``shared`` is True for callers that joined.
+        The shared task is shielded, so one caller disconnecting does not cancel
+        the work the others are waiting for.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,203 @@
+# backend/summary_memory.py
+"""
+Rolling summary + recent-window memory for general chat.
+
+Instead of replaying the last 20 raw messages on every turn, the prompt gets:
+
+- ``chat_summaries.summary``: a running summary of everything up to ``last_message_id``
+- the last ``CHAT_SUMMARY_RECENT_MESSAGES`` messages after it, verbatim
+
+After each turn ``schedule_update`` folds the messages that fell out of the recent
+window into the summary on a background thread (one LLM call, background priority),
+so the user never waits for it. Until the update lands the prompt just omits those
+older messages; it never grows past the window.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Set, Tuple
+
+import psycopg2
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, get_buffer_string
+
+from backend import metrics
+from backend.chat_archive import memory_lookback_cutoff
+from backend.llm_hedging import llm_deadline
+from backend.llm_scheduler import BACKGROUND, scheduling_context
+from backend.logging_setup import get_logger, log_context
+
+logger = get_logger(__name__)
+
+RECENT_MESSAGES = int(os.getenv("CHAT_SUMMARY_RECENT_MESSAGES", "6"))
+# 至少攒够这么多条窗口外的消息才调用一次 LLM 做摘要
+MIN_FOLD_MESSAGES = int(os.getenv("CHAT_SUMMARY_MIN_FOLD", "4"))
+SUMMARY_WORKERS = int(os.getenv("CHAT_SUMMARY_WORKERS", "2"))
+
+SUMMARY_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    tenant_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL DEFAULT '',
+    last_message_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+"""
+
+_TO_MESSAGE = {"human": HumanMessage, "ai": AIMessage}
+
+
+class RollingSummaryMemory:
+    """Loads ``summary + recent messages`` for a tenant and refreshes the summary in the background."""
+
+    def __init__(self, db_url: str, llm, recent_messages: int = RECENT_MESSAGES,
+                 min_fold_messages: int = MIN_FOLD_MESSAGES, workers: int = SUMMARY_WORKERS):
+        self.db_url = db_url
+        self.llm = llm
+        self.recent_messages = recent_messages
+        self.min_fold_messages = min_fold_messages
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-summary")
+        self._pending: Set[str] = set()
+        self._inflight = 0
+        self._idle = threading.Condition()
+
+    # === Read path (every general-chat turn) ===
+    def load(self, tenant_id: str) -> Tuple[str, List[BaseMessage]]:
+        conn = None
+        try:
+            with metrics.track_stage("history_load"):
+                metrics.record_db_connection("chat_summary")
+                conn = psycopg2.connect(self.db_url)
+                with conn.cursor() as cur:
+                    summary, last_id = self._read_summary(cur, tenant_id)
+                    cur.execute(
+                        """
+                        SELECT id, message_type, message_content FROM chat_history
+                        WHERE tenant_id = %s AND id > %s AND created_at >= %s
+                        ORDER BY id DESC LIMIT %s;
+                        """,
+                        (tenant_id, last_id, memory_lookback_cutoff(), self.recent_messages),
+                    )
+                    rows = cur.fetchall()
+            return summary, _to_messages(reversed(rows))
+        except Exception as e:
+            metrics.record_error("db")
+            logger.error("Chat summary (read) failed: %s", e)
+            return "", []
+        finally:
+            if conn:
+                conn.close()
+
+    def render(self, tenant_id: str) -> str:
+        """``history`` for the conversation prompt."""
+        summary, recent = self.load(tenant_id)
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation: {summary}")
+        if recent:
+            parts.append(get_buffer_string(recent))
+        return "\n".join(parts)
+
+    # === Background update ===
+    def schedule_update(self, tenant_id: str) -> None:
+        # 同一租户已有排队中的更新时不再重复提交，那一次会读到最新的消息
+        with self._idle:
+            if tenant_id in self._pending:
+                return
+            self._pending.add(tenant_id)
+            self._inflight += 1
+        self._executor.submit(self._run_update, tenant_id)
+
+    def _run_update(self, tenant_id: str) -> None:
+        with self._idle:
+            self._pending.discard(tenant_id)
+        try:
+            with log_context(tenant_id=tenant_id):
+                result = self.update(tenant_id)
+            metrics.CHAT_SUMMARY_UPDATES.labels(result=result).inc()
+        except Exception:
+            metrics.CHAT_SUMMARY_UPDATES.labels(result="failed").inc()
+            logger.exception("Chat summary update failed", extra={"tenant_id": tenant_id})
+        finally:
+            with self._idle:
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    def update(self, tenant_id: str) -> str:
+        """Fold messages older than the recent window into the summary. Returns ``updated`` or ``skipped``."""
+        summary, last_id, rows = self._unsummarized(tenant_id)
+        fold = rows[:-self.recent_messages] if self.recent_messages else rows
+        if len(fold) < self.min_fold_messages:
+            return "skipped"
+
+        prompt = SUMMARY_PROMPT.format(summary=summary, new_lines=get_buffer_string(_to_messages(fold)))
+        with scheduling_context(tenant_id, BACKGROUND), llm_deadline("summary"):
+            new_summary = self.llm.invoke(prompt).content.strip()
+        self._save(tenant_id, new_summary, fold[-1][0])
+        logger.debug("Chat summary updated", extra={"folded_messages": len(fold), "summary_chars": len(new_summary)})
+        return "updated"
+
+    def wait_idle(self) -> None:
+        """Block until queued updates have run (benchmarks / shutdown)."""
+        with self._idle:
+            self._idle.wait_for(lambda: self._inflight == 0)
+
+    # === SQL ===
+    @staticmethod
+    def _read_summary(cur, tenant_id: str) -> Tuple[str, int]:
+        cur.execute("SELECT summary, last_message_id FROM chat_summaries WHERE tenant_id = %s;", (tenant_id,))
+        row = cur.fetchone()
+        return (row[0] or "", row[1] or 0) if row else ("", 0)
+
+    def _unsummarized(self, tenant_id: str) -> Tuple[str, int, List[Tuple[Any, ...]]]:
+        conn = None
+        try:
+            metrics.record_db_connection("chat_summary")
+            conn = psycopg2.connect(self.db_url)
+            with conn.cursor() as cur:
+                summary, last_id = self._read_summary(cur, tenant_id)
+                cur.execute(
+                    """
+                    SELECT id, message_type, message_content FROM chat_history
+                    WHERE tenant_id = %s AND id > %s AND created_at >= %s
+                    ORDER BY id ASC;
+                    """,
+                    (tenant_id, last_id, memory_lookback_cutoff()),
+                )
+                return summary, last_id, cur.fetchall()
+        finally:
+            if conn:
+                conn.close()
+
+    def _save(self, tenant_id: str, summary: str, last_message_id: int) -> None:
+        conn = None
+        try:
+            metrics.record_db_connection("chat_summary")
+            conn = psycopg2.connect(self.db_url)
+            with conn.cursor() as cur:
+                # 多个 worker 可能同时摘要同一租户：只接受更新的 last_message_id
+                cur.execute(
+                    """
+                    INSERT INTO chat_summaries (tenant_id, summary, last_message_id, updated_at)
+                    VALUES (%s, %s, %s, NOW())
+                    ON CONFLICT (tenant_id) DO UPDATE
+                    SET summary = EXCLUDED.summary,
+                        last_message_id = EXCLUDED.last_message_id,
+                        updated_at = NOW()
+                    WHERE chat_summaries.last_message_id < EXCLUDED.last_message_id;
+                    """,
+                    (tenant_id, summary, last_message_id),
+                )
+            conn.commit()
+        except Exception:
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+
+def _to_messages(rows) -> List[BaseMessage]:
+    return [_TO_MESSAGE[t](content=c) for _, t, c in rows if t in _TO_MESSAGE]
@@ -0,0 +1,68 @@
+# backend/tenant_cache.py
+"""
+Per-tenant read-through cache with a TTL and explicit invalidation.
+
+Used for state that is read on (almost) every request but changes only on
+register / upload / summary save: tenant profiles, lease facts, FAQ answers.
+``invalidate`` is wired to the invalidation bus, so a change made by any worker
+drops the entry everywhere; the TTL only bounds staleness if a notification is lost.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+from backend import metrics
+
+T = TypeVar("T")
+
+
+class TenantCache(Generic[T]):
+    """``get`` loads through ``loader`` on a miss; a loader returning None (lookup failed) is not cached."""
+
+    def __init__(self, name: str, loader: Callable[[str], Optional[T]], ttl_s: float):
+        self.name = name
+        self._loader = loader
+        self._ttl_s = ttl_s
+        self._entries: Dict[str, Tuple[float, T]] = {}
+        # 加载期间被 invalidate 的结果不能写回缓存（读到的可能是变更前的旧数据）。
+        # 只为正在加载的租户记账，加载结束即删除，不会随租户数无限增长
+        self._clock = 0
+        self._loading: Dict[str, int] = {}
+        self._invalidated_at: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: str) -> Optional[T]:
+        entry = self._entries.get(tenant_id)
+        hit = entry is not None and entry[0] > time.monotonic()
+        metrics.record_cache(self.name, hit)
+        if hit:
+            return entry[1]
+        with self._lock:
+            if entry is not None and self._entries.get(tenant_id) is entry:
+                del self._entries[tenant_id]  # 过期的直接清掉
+            self._loading[tenant_id] = self._loading.get(tenant_id, 0) + 1
+            started = self._clock
+        value = None
+        try:
+            value = self._loader(tenant_id)
+        finally:
+            with self._lock:
+                fresh = self._invalidated_at.get(tenant_id, started) <= started
+                if self._loading[tenant_id] > 1:
+                    self._loading[tenant_id] -= 1
+                else:
+                    del self._loading[tenant_id]
+                    self._invalidated_at.pop(tenant_id, None)
+                # 查询失败（None）不缓存，下次再试
+                if value is not None and fresh:
+                    self._entries[tenant_id] = (time.monotonic() + self._ttl_s, value)
+        return value
+
+    def invalidate(self, tenant_id: str) -> None:
+        with self._lock:
+            self._entries.pop(tenant_id, None)
+            self._clock += 1
+            if tenant_id in self._loading:
+                self._invalidated_at[tenant_id] = self._clock
@@ -0,0 +1,710 @@
+# backend/vectorstore_backends.py
+"""
+Vector-store backends selected by ``VECTORSTORE_BACKEND``.
+
+- ``CHROMA``:        one Chroma persist directory per tenant (sha256-named, original layout).
+- ``CHROMA_SHARED``: every tenant in one persist directory, split over a fixed number of
+                     collections ("shards"); tenants are isolated by a ``tenant_key``
+                     metadata filter that every read and write goes through.
+- ``NUMPY``:         brute-force flat index per tenant: a memory-mapped float16 / int8
+                     matrix plus a JSONL chunk file. A contract is only tens to hundreds
+                     of chunks, so a vectorized dot product beats opening an HNSW index.
+
+All backends expose the same small interface used by ``llm3_new``:
+``exists / build / search / delete / invalidate``. ``invalidate`` drops whatever this
+process cached for a tenant after another worker rebuilt it (see ``backend/invalidation.py``).
+
+Re-ingestion never modifies the store a query may be reading. ``build`` writes a complete
+new *version* next to the live one and then switches a per-tenant pointer file
+(``CURRENT``) with one atomic ``os.replace``. A search resolves the pointer once and reads
+that version to the end. The replaced version is removed once no query in this process
+holds it and ``VECTORSTORE_GC_GRACE_S`` has passed; the grace period covers queries in
+other workers that resolved the old pointer just before the swap.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import chromadb
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings
+from chromadb.telemetry.product import ProductTelemetryClient
+from langchain_core.documents import Document
+from overrides import override  # chromadb 的依赖；它的组件基类要求覆盖方法带 @override
+
+from backend.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+TENANT_KEY_FIELD = "tenant_key"
+STORE_VERSION_FIELD = "store_version"
+LEGACY_COLLECTION_NAME = "langchain"  # langchain_community.Chroma 的默认 collection 名
+SHARED_STORE_DIRNAME = "_shared"
+SHARD_CONFIG_FILENAME = "shards.json"
+FLAT_STORE_DIRNAME = "_flat"
+SHARED_POINTERS_DIRNAME = "versions"
+POINTER_FILENAME = "CURRENT"
+# 版本化之前的布局：数据文件直接放在租户目录里，见到这些文件就按旧布局读取
+CHROMA_LEGACY_MARKER = "chroma.sqlite3"
+FLAT_LEGACY_MARKER = "vectors.npy"
+VERSION_PATTERN = re.compile(r"^v\d+-[0-9a-f]{6}$")
+ADD_BATCH_SIZE = 500
+# 丢弃进程内 Chroma client 依赖 clear_system_cache 的语义（只清空缓存、不 stop 旧的 System，
+# 正在进行的查询继续用旧对象）。只在这些版本上验证过，升级 chromadb 时要重新确认
+CHROMADB_VERIFIED_VERSIONS = ("0.5.",)
+
+
+def tenant_key(tenant_id: str) -> str:
+    """Stable, non-reversible tenant key (same sha256 used for the per-tenant directories)."""
+    return hashlib.sha256(tenant_id.encode("utf-8")).hexdigest()
+
+
+class _NoTelemetry(ProductTelemetryClient):
+    """Telemetry is off anyway; chromadb's Posthog client still batches events in an unlocked
+    dict and can raise ``KeyError`` from a query that runs concurrently with another."""
+
+    @override
+    def capture(self, event) -> None:
+        pass
+
+
+_NO_TELEMETRY_IMPL = f"{__name__}._NoTelemetry"
+
+
+def _client_settings() -> Settings:
+    return Settings(
+        anonymized_telemetry=False,
+        allow_reset=True,
+        chroma_product_telemetry_impl=_NO_TELEMETRY_IMPL,
+        chroma_telemetry_impl=_NO_TELEMETRY_IMPL,
+    )
+
+
+# 打开 client 和清空缓存互斥：chromadb 建 System 时先写缓存再读回，中间被清空会 KeyError
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _check_chromadb_version() -> None:
+    if not chromadb.__version__.startswith(CHROMADB_VERIFIED_VERSIONS):
+        raise RuntimeError(
+            f"chromadb {chromadb.__version__} is not a verified version for the Chroma vector-store backends "
+            f"(verified: {', '.join(v + 'x' for v in CHROMADB_VERIFIED_VERSIONS)}); "
+            "re-check _reset_chroma_clients before upgrading"
+        )
+
+
+def _open_client(path: str):
+    with _CLIENTS_LOCK:
+        return chromadb.PersistentClient(path=path, settings=_client_settings())
+
+
+def _reset_chroma_clients() -> None:
+    """
+    Drop every Chroma client this process has cached, so the next open reloads from disk.
+
+    chromadb caches one System (sqlite connection + loaded HNSW segments) per directory
+    and has no public way to drop a single one, so this clears them all; the rebuild
+    costs one reload per store on its next query. Old Systems are not stopped: queries
+    still running on them finish, and GC reclaims them afterwards.
+    """
+    _check_chromadb_version()
+    with _CLIENTS_LOCK:
+        SharedSystemClient.clear_system_cache()
+
+
+def _to_documents(result: Dict[str, Any]) -> List[Document]:
+    docs: List[Document] = []
+    documents = (result.get("documents") or [[]])[0]
+    metadatas = (result.get("metadatas") or [[]])[0]
+    for text, meta in zip(documents, metadatas):
+        meta = dict(meta or {})
+        meta.pop(TENANT_KEY_FIELD, None)
+        meta.pop(STORE_VERSION_FIELD, None)
+        docs.append(Document(page_content=text or "", metadata=meta))
+    return docs
+
+
+def _add_in_batches(collection, ids, embeddings, documents, metadatas) -> None:
+    for i in range(0, len(ids), ADD_BATCH_SIZE):
+        collection.add(
+            ids=list(ids[i:i + ADD_BATCH_SIZE]),
+            embeddings=list(embeddings[i:i + ADD_BATCH_SIZE]),
+            documents=list(documents[i:i + ADD_BATCH_SIZE]),
+            metadatas=list(metadatas[i:i + ADD_BATCH_SIZE]),
+        )
+
+
+# === Versions ===
+def _new_version() -> str:
+    return f"v{time.time_ns()}-{uuid.uuid4().hex[:6]}"
+
+
+def _read_pointer(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(path: str, version: str) -> None:
+    """Point ``path`` at ``version`` atomically: readers see the old name or the new one, never a partial file."""
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def live_store_path(tenant_dir: str, legacy_marker: str) -> Optional[str]:
+    """Directory of the tenant's live store (``<tenant_dir>/<version>`` or a pre-versioning ``<tenant_dir>``), or None."""
+    version = _read_pointer(os.path.join(tenant_dir, POINTER_FILENAME))
+    if version:
+        return os.path.join(tenant_dir, version)
+    if os.path.exists(os.path.join(tenant_dir, legacy_marker)):
+        return tenant_dir
+    return None
+
+
+class VersionLeases:
+    """
+    Reader counts per store version in this process, and the retired versions waiting
+    to be removed: one goes once nobody here reads it and its grace period is over.
+    Removal runs on a timer thread, never on a query's thread (a Chroma delete can take
+    hundreds of milliseconds while searches are running).
+    """
+
+    def __init__(self, grace_s: float):
+        self.grace_s = grace_s
+        self._readers: Dict[str, int] = {}
+        self._retired: Dict[str, Tuple[float, Callable[[], None]]] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, version_key: str) -> Iterator[None]:
+        with self._lock:
+            self._readers[version_key] = self._readers.get(version_key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                remaining = self._readers.pop(version_key) - 1
+                if remaining:
+                    self._readers[version_key] = remaining
+
+    def is_retired(self, version_key: str) -> bool:
+        return version_key in self._retired
+
+    def retire(self, version_key: str, remove: Callable[[], None]) -> None:
+        with self._lock:
+            self._retired[version_key] = (time.monotonic() + self.grace_s, remove)
+            self._schedule(self.grace_s)
+
+    def _schedule(self, delay_s: float) -> None:
+        # 调用方持有 self._lock；同一时间只挂一个定时器
+        if self._timer is None:
+            self._timer = threading.Timer(delay_s + 0.05, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.collect()
+
+    def collect(self) -> int:
+        """Remove retired versions that are past their grace period and unread; returns how many."""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                (key, remove) for key, (deadline, remove) in self._retired.items()
+                if deadline <= now and key not in self._readers
+            ]
+            for key, _ in due:
+                del self._retired[key]
+        for key, remove in due:
+            try:
+                remove()
+                logger.debug("Removed retired vector store version", extra={"version": key})
+            except Exception as e:
+                logger.warning("Failed to remove retired vector store version %s: %s", key, e)
+        with self._lock:
+            if self._retired:
+                # 还有没到期、或者仍在被读的版本：到最早的期限再看（至少等 1 秒）
+                next_deadline = min(deadline for deadline, _ in self._retired.values())
+                self._schedule(max(next_deadline - time.monotonic(), 1.0))
+        return len(due)
+
+
+class _VersionedDirs:
+    """
+    Per-tenant directory layout used by CHROMA and NUMPY:
+
+        <tenant_dir>/CURRENT            name of the live version
+        <tenant_dir>/v<ns>-<random>/    one complete store per version
+
+    Stores written before versioning keep their files directly in ``<tenant_dir>`` and
+    are read from there until the next build replaces them.
+    """
+
+    def __init__(self, legacy_marker: str, grace_s: float, on_remove: Optional[Callable[[str], None]] = None):
+        self.legacy_marker = legacy_marker
+        self.leases = VersionLeases(grace_s)
+        self._on_remove = on_remove
+        self._lock = threading.Lock()
+
+    def live(self, tenant_dir: str) -> Optional[str]:
+        return live_store_path(tenant_dir, self.legacy_marker)
+
+    @contextmanager
+    def reading(self, tenant_dir: str) -> Iterator[str]:
+        """The live version's path, kept on disk until the block exits."""
+        path = self.live(tenant_dir)
+        if path is None:
+            raise FileNotFoundError(f"No vector store in {tenant_dir}")
+        with self.leases.hold(path):
+            yield path
+
+    def staging(self, tenant_dir: str) -> str:
+        os.makedirs(tenant_dir, exist_ok=True)
+        return os.path.join(tenant_dir, _new_version())
+
+    def publish(self, tenant_dir: str, version_path: str) -> None:
+        """Make a fully written ``version_path`` live; the previous version is retired."""
+        with self._lock:
+            previous = self.live(tenant_dir)
+            _write_pointer(os.path.join(tenant_dir, POINTER_FILENAME), os.path.basename(version_path))
+        if previous == tenant_dir:
+            self.leases.retire(previous, lambda: self._remove_legacy(tenant_dir))
+        elif previous and previous != version_path:
+            self.leases.retire(previous, lambda: self._remove(previous))
+        self._sweep(tenant_dir, os.path.basename(version_path))
+
+    def discard(self, version_path: str) -> None:
+        """Drop a version whose build failed (it was never live)."""
+        self._remove(version_path)
+
+    def delete(self, tenant_dir: str) -> None:
+        with self._lock:
+            shutil.rmtree(tenant_dir, ignore_errors=True)
+
+    def _remove(self, path: str) -> None:
+        if self._on_remove:
+            self._on_remove(path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _remove_legacy(self, tenant_dir: str) -> None:
+        if self._on_remove:
+            self._on_remove(tenant_dir)
+        for name in os.listdir(tenant_dir):
+            if name == POINTER_FILENAME or name.startswith(POINTER_FILENAME + ".tmp") or VERSION_PATTERN.match(name):
+                continue
+            path = os.path.join(tenant_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def _sweep(self, tenant_dir: str, live_version: str) -> None:
+        # 崩溃留下的半成品版本：比宽限期还旧、又不是当前版本的目录一并回收
+        cutoff = time.time() - self.leases.grace_s
+        for name in os.listdir(tenant_dir):
+            path = os.path.join(tenant_dir, name)
+            if name == live_version or not VERSION_PATTERN.match(name) or self.leases.is_retired(path):
+                continue
+            try:
+                stale = os.path.getmtime(path) < cutoff
+            except FileNotFoundError:
+                continue  # 回收定时器刚好删掉了它
+            if stale:
+                self.leases.retire(path, lambda path=path: self._remove(path))
+
+
+class ChromaDirBackend:
+    """Original layout: ``<base_dir>/<sha256(tenant_id)>/`` holds the tenant's Chroma store versions."""
+
+    name = "CHROMA"
+
+    def __init__(self, base_dir: str, embeddings, gc_grace_s: float = 60.0):
+        self.base_dir = base_dir
+        self.embeddings = embeddings
+        _check_chromadb_version()
+        self._versions = _VersionedDirs(CHROMA_LEGACY_MARKER, gc_grace_s, on_remove=lambda path: _reset_chroma_clients())
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def path_for(self, tenant_id: str) -> str:
+        return os.path.join(self.base_dir, tenant_key(tenant_id))
+
+    def _client(self, path: str):
+        return _open_client(path)
+
+    def exists(self, tenant_id: str) -> bool:
+        return self._versions.live(self.path_for(tenant_id)) is not None
+
+    def build(
+        self,
+        tenant_id: str,
+        documents: Sequence[Document],
+        vectors: Optional[Sequence[Sequence[float]]] = None,
+    ) -> None:
+        texts = [d.page_content for d in documents]
+        if vectors is None:
+            vectors = self.embeddings.embed_documents(texts) if texts else []
+        # 写进新的版本目录，写完再切换 CURRENT：查询看到的要么是完整的旧版本，要么是完整的新版本
+        tenant_dir = self.path_for(tenant_id)
+        target = self._versions.staging(tenant_dir)
+        try:
+            collection = self._client(target).get_or_create_collection(LEGACY_COLLECTION_NAME)
+            ids = [f"{tenant_key(tenant_id)[:16]}-{i}" for i in range(len(texts))]
+            _add_in_batches(collection, ids, vectors, texts, [dict(d.metadata) for d in documents])
+        except Exception:
+            self._versions.discard(target)
+            raise
+        self._versions.publish(tenant_dir, target)
+
+    def search(self, tenant_id: str, query: str, k: int) -> List[Document]:
+        query_vector = self.embeddings.embed_query(query)
+        with self._versions.reading(self.path_for(tenant_id)) as path:
+            collection = self._client(path).get_collection(LEGACY_COLLECTION_NAME)
+            result = collection.query(
+                query_embeddings=[query_vector],
+                n_results=k,
+                include=["documents", "metadatas"],
+            )
+        return _to_documents(result)
+
+    def delete(self, tenant_id: str) -> None:
+        _reset_chroma_clients()
+        self._versions.delete(self.path_for(tenant_id))
+
+    def invalidate(self, tenant_id: str) -> None:
+        # 另一个 worker 切换了版本：本进程里旧版本的 client 不会再被用到
+        _reset_chroma_clients()
+
+
+class ChromaSharedBackend:
+    """
+    All tenants in ``<base_dir>/_shared/``, hashed over ``shards`` collections.
+
+    Isolation is enforced here, not by callers: every query, existence check and delete
+    carries a ``where={"tenant_key": ...}`` filter, and every chunk is written with it.
+
+    Each build writes its chunks with a new ``store_version``; ``_shared/versions/<tenant_key>``
+    names the live one and every query also filters on it. Chunks written before versioning
+    have no ``store_version`` and are read while the tenant has no pointer file.
+    """
+
+    name = "CHROMA_SHARED"
+
+    def __init__(self, base_dir: str, embeddings, shards: int = 1, gc_grace_s: float = 60.0):
+        self.base_dir = base_dir
+        self.embeddings = embeddings
+        self.path = os.path.join(base_dir, SHARED_STORE_DIRNAME)
+        self.pointers_path = os.path.join(self.path, SHARED_POINTERS_DIRNAME)
+        os.makedirs(self.pointers_path, exist_ok=True)
+        self.shards = self._load_shard_count(shards)
+        _check_chromadb_version()
+        self._client = _open_client(self.path)
+        self._collections: Dict[int, Any] = {}
+        self._leases = VersionLeases(gc_grace_s)
+        # 本进程最近写入的版本：自己的 vectorstore 通知不需要重新打开 client
+        self._written: Dict[str, str] = {}
+        # 所有写入 / 删除 / 重新打开 client 都串行：旧 client 换下来时不会还有写入在进行
+        self._lock = threading.RLock()
+
+    def _load_shard_count(self, requested: int) -> int:
+        # 分片数一旦确定就固定下来，否则改环境变量会把租户映射到错误的 collection
+        config_path = os.path.join(self.path, SHARD_CONFIG_FILENAME)
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                stored = int(json.load(f)["shards"])
+            if stored != requested:
+                logger.warning("VECTORSTORE_SHARDS=%s ignored; shared store was created with %s shards", requested, stored)
+            return stored
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"shards": requested}, f)
+        return requested
+
+    def _collection_for_key(self, key: str):
+        shard = int(key[:8], 16) % self.shards
+        collection = self._collections.get(shard)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.get(shard)
+                if collection is None:
+                    collection = self._client.get_or_create_collection(f"tenants_{shard:03d}")
+                    self._collections[shard] = collection
+        return collection
+
+    def exists(self, tenant_id: str) -> bool:
+        return self.exists_key(tenant_key(tenant_id))
+
+    def _live_version(self, key: str) -> Optional[str]:
+        return _read_pointer(os.path.join(self.pointers_path, key))
+
+    def _where(self, key: str, version: Optional[str]) -> Dict[str, Any]:
+        if version is None:
+            return {TENANT_KEY_FIELD: key}  # 版本化之前写入的 chunk
+        return {"$and": [{TENANT_KEY_FIELD: key}, {STORE_VERSION_FIELD: version}]}
+
+    def exists_key(self, key: str) -> bool:
+        if self._live_version(key):
+            return True
+        found = self._collection_for_key(key).get(where={TENANT_KEY_FIELD: key}, limit=1, include=[])
+        return bool(found.get("ids"))
+
+    def build(
+        self,
+        tenant_id: str,
+        documents: Sequence[Document],
+        vectors: Optional[Sequence[Sequence[float]]] = None,
+    ) -> None:
+        texts = [d.page_content for d in documents]
+        if vectors is None:
+            vectors = self.embeddings.embed_documents(texts) if texts else []
+        self.add_raw(
+            tenant_key(tenant_id),
+            embeddings=vectors,
+            documents=texts,
+            metadatas=[dict(d.metadata) for d in documents],
+        )
+
+    def add_raw(self, key: str, embeddings, documents, metadatas) -> None:
+        """Replace a tenant's chunks with pre-computed embeddings (used by build and migration)."""
+        version = _new_version()
+        metadatas = [{**(m or {}), TENANT_KEY_FIELD: key, STORE_VERSION_FIELD: version} for m in metadatas]
+        ids = [f"{key}-{version}-{i}" for i in range(len(documents))]
+        collection = self._collection_for_key(key)
+        with self._lock:
+            try:
+                _add_in_batches(collection, ids, embeddings, documents, metadatas)
+            except Exception:
+                self._remove_version(collection, key, version)
+                raise
+            previous = self._live_version(key)
+            # 新版本写完才切换指针；旧版本的 chunk 等没人读了再删
+            _write_pointer(os.path.join(self.pointers_path, key), version)
+            self._written[key] = version
+        if previous:
+            self._leases.retire(f"{key}/{previous}", lambda: self._remove_version(collection, key, previous))
+        else:
+            self._leases.retire(f"{key}/", lambda: self._remove_unversioned(collection, key))
+
+    def collect_retired(self) -> int:
+        """Remove replaced versions whose grace period is over now instead of on the next timer / query."""
+        return self._leases.collect()
+
+    def _remove_version(self, collection, key: str, version: str) -> None:
+        with self._lock:
+            collection.delete(where=self._where(key, version))
+
+    def _remove_unversioned(self, collection, key: str) -> None:
+        found = collection.get(where={TENANT_KEY_FIELD: key}, include=["metadatas"])
+        ids = [i for i, meta in zip(found["ids"], found["metadatas"]) if STORE_VERSION_FIELD not in (meta or {})]
+        if ids:
+            with self._lock:
+                collection.delete(ids=ids)
+
+    def search(self, tenant_id: str, query: str, k: int) -> List[Document]:
+        key = tenant_key(tenant_id)
+        query_vector = self.embeddings.embed_query(query)
+        version = self._live_version(key)
+        client = self._client
+        collection = self._collection_for_key(key)
+        where = self._where(key, version)
+        with self._leases.hold(f"{key}/{version or ''}"):
+            try:
+                result = collection.query(
+                    query_embeddings=[query_vector], n_results=k, where=where, include=["documents", "metadatas"]
+                )
+                if (result.get("ids") or [[]])[0]:
+                    return _to_documents(result)
+            except RuntimeError:
+                pass  # hnswlib: "Cannot return the results in a contigious 2D array"
+            # 旧版本的 chunk 被删掉之后，带过滤的 HNSW 查询可能找不到这个租户的邻居（返回空或报错），
+            # 一份合同只有几十到几百个 chunk，直接精确计算
+            docs = self._exact_search(collection, where, query_vector, k)
+            if docs is None:
+                # 另一个 worker 刚写入、通知还没到：先自己重新打开 client
+                self._reopen(client)
+                docs = self._exact_search(self._collection_for_key(key), where, query_vector, k)
+            return docs or []
+
+    @staticmethod
+    def _exact_search(collection, where: Dict[str, Any], query_vector: Sequence[float], k: int) -> Optional[List[Document]]:
+        """Exact l2 ranking of the filtered chunks; None if this process has no vectors for some of them."""
+        found = collection.get(where=where, include=["embeddings", "documents", "metadatas"])
+        if not found["ids"]:
+            return []
+        if len(found["embeddings"] if found["embeddings"] is not None else []) != len(found["ids"]):
+            return None
+        # 与 collection 默认的 l2 距离一致
+        distances = np.linalg.norm(np.asarray(found["embeddings"], dtype=np.float32) - np.asarray(query_vector, dtype=np.float32), axis=1)
+        top = np.argsort(distances)[:k]
+        return _to_documents({
+            "documents": [[found["documents"][i] for i in top]],
+            "metadatas": [[found["metadatas"][i] for i in top]],
+        })
+
+    def delete(self, tenant_id: str) -> None:
+        key = tenant_key(tenant_id)
+        with self._lock:
+            try:
+                os.remove(os.path.join(self.pointers_path, key))
+            except FileNotFoundError:
+                pass
+            self._collection_for_key(key).delete(where={TENANT_KEY_FIELD: key})
+            self._written.pop(key, None)
+
+    def invalidate(self, tenant_id: str) -> None:
+        # 版本指针每次查询都重新读，没有要丢的缓存。本进程自己写的版本不用管；
+        # 其他 worker 写入的向量本进程已加载的 HNSW 段看不到，换一个新 client，
+        # 各分片在下次查询时从磁盘重新加载（正在进行的查询继续用旧 client）
+        key = tenant_key(tenant_id)
+        if self._live_version(key) != self._written.get(key):
+            self._reopen(self._client)
+
+    def _reopen(self, seen_client) -> None:
+        """Swap in a fresh client unless another thread already replaced ``seen_client``."""
+        with self._lock:
+            if self._client is not seen_client:
+                return
+            _reset_chroma_clients()
+            self._client = _open_client(self.path)
+            self._collections = {}
+
+
+class NumpyFlatBackend:
+    """
+    ``<base_dir>/_flat/<tenant_key>/<version>/`` (see ``_VersionedDirs``) holds:
+
+    - ``vectors.npy``: L2-normalised embeddings, float16 or int8 (opened with ``mmap_mode="r"``)
+    - ``scales.npy``:  per-row dequantisation scales (int8 only)
+    - ``chunks.jsonl`` + ``offsets.npy``: one JSON record per chunk and its byte offset,
+      so only the top-k records are read from disk.
+
+    Opening a store is a couple of ``mmap`` calls; nothing is cached between queries.
+    """
+
+    name = "NUMPY"
+
+    def __init__(self, base_dir: str, embeddings, quantization: str = "float16", gc_grace_s: float = 60.0):
+        quantization = quantization.lower()
+        if quantization not in ("float16", "int8"):
+            raise ValueError(f"Unsupported VECTORSTORE_QUANTIZATION: {quantization}")
+        self.base_dir = base_dir
+        self.embeddings = embeddings
+        self.quantization = quantization
+        self.path = os.path.join(base_dir, FLAT_STORE_DIRNAME)
+        os.makedirs(self.path, exist_ok=True)
+        self._versions = _VersionedDirs(FLAT_LEGACY_MARKER, gc_grace_s)
+
+    def path_for(self, tenant_id: str) -> str:
+        return os.path.join(self.path, tenant_key(tenant_id))
+
+    def exists(self, tenant_id: str) -> bool:
+        return self._versions.live(self.path_for(tenant_id)) is not None
+
+    def _write(self, target: str, vectors: np.ndarray, documents, metadatas) -> None:
+        os.makedirs(target, exist_ok=True)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            np.save(os.path.join(target, "vectors.npy"), np.round(vectors / scales[:, None]).astype(np.int8))
+            np.save(os.path.join(target, "scales.npy"), scales.astype(np.float32))
+        else:
+            np.save(os.path.join(target, "vectors.npy"), vectors.astype(np.float16))
+
+        offsets = []
+        with open(os.path.join(target, "chunks.jsonl"), "wb") as f:
+            for text, meta in zip(documents, metadatas):
+                offsets.append(f.tell())
+                f.write(json.dumps({"t": text, "m": meta or {}}, ensure_ascii=False).encode("utf-8") + b"\n")
+        np.save(os.path.join(target, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+    def build(
+        self,
+        tenant_id: str,
+        documents: Sequence[Document],
+        vectors: Optional[Sequence[Sequence[float]]] = None,
+    ) -> None:
+        texts = [d.page_content for d in documents]
+        if vectors is None:
+            vectors = self.embeddings.embed_documents(texts) if texts else []
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.size == 0:
+            matrix = matrix.reshape(0, 1)
+        tenant_dir = self.path_for(tenant_id)
+        target = self._versions.staging(tenant_dir)
+        try:
+            self._write(target, matrix, texts, [dict(d.metadata) for d in documents])
+        except Exception:
+            self._versions.discard(target)
+            raise
+        # 先写好整个版本再切换 CURRENT，读者不会看到写了一半的文件
+        self._versions.publish(tenant_dir, target)
+
+    def search(self, tenant_id: str, query: str, k: int) -> List[Document]:
+        q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        # 整个查询读同一个版本（向量、偏移和 chunk 文件必须配套）
+        with self._versions.reading(self.path_for(tenant_id)) as path:
+            return self._search_version(path, q, k)
+
+    def _search_version(self, path: str, q: np.ndarray, k: int) -> List[Document]:
+        matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        if matrix.shape[0] == 0:
+            return []
+        # numpy 没有 float16 BLAS，先把（很小的）矩阵升到 float32 再做点积
+        scores = np.asarray(matrix, dtype=np.float32) @ q
+        if matrix.dtype == np.int8:
+            scores *= np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        docs: List[Document] = []
+        with open(os.path.join(path, "chunks.jsonl"), "rb") as f:
+            for idx in top:
+                f.seek(int(offsets[idx]))
+                record = json.loads(f.readline())
+                docs.append(Document(page_content=record["t"], metadata=record["m"]))
+        return docs
+
+    def delete(self, tenant_id: str) -> None:
+        self._versions.delete(self.path_for(tenant_id))
+
+    def invalidate(self, tenant_id: str) -> None:
+        # 每次查询都重新读 CURRENT 并 mmap，没有需要丢弃的状态
+        pass
+
+
+def get_vectorstore_backend(name: str, embeddings, base_dir: str):
+    """Build the backend selected by ``VECTORSTORE_BACKEND``."""
+    name = (name or "CHROMA").upper()
+    # 被替换的版本至少保留这么久，其他 worker 里正在进行的查询还能读完
+    gc_grace_s = float(os.getenv("VECTORSTORE_GC_GRACE_S", "60"))
+    if name == "CHROMA":
+        return ChromaDirBackend(base_dir, embeddings, gc_grace_s=gc_grace_s)
+    if name == "CHROMA_SHARED":
+        shards = int(os.getenv("VECTORSTORE_SHARDS", "1"))
+        return ChromaSharedBackend(base_dir, embeddings, shards=shards, gc_grace_s=gc_grace_s)
+    if name == "NUMPY":
+        quantization = os.getenv("VECTORSTORE_QUANTIZATION", "float16")
+        return NumpyFlatBackend(base_dir, embeddings, quantization=quantization, gc_grace_s=gc_grace_s)
+    raise NotImplementedError(f"Unsupported VECTORSTORE_BACKEND: {name}")
@@ -0,0 +1,93 @@
+# benchmarks/bench_bulk_ingest.py
+"""
+Bulk onboarding throughput: one ``create_user_vectorstore`` per tenant (the /upload path,
+serial) vs ``backend.bulk_ingest`` (process-pool parsing, shared embedding batches,
+concurrent indexing), on the offline fakes.
+
+Also checks resume: a second bulk run over the same manifest must skip every tenant,
+and a corrupt PDF must be reported as failed without stopping the run.
+
+    python -m benchmarks.bench_bulk_ingest --tenants 40 --embed-latency 0.2 --chat-latency 0.3
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.fakes import install_fakes
+from benchmarks.load_test import CONTRACT_PDF
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=40)
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="Seconds per embedding call")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="Seconds per extraction call")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--embed-batch", type=int, default=512)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_bulk_")
+    services = install_fakes(chat_latency_s=args.chat_latency, embed_latency_s=args.embed_latency, workdir=workdir)
+    try:
+        from backend import llm3_new
+        from backend.bulk_ingest import BulkIngest, Checkpoint, jobs_from_manifest
+
+        pdf_dir = os.path.join(workdir, "contracts")
+        os.makedirs(pdf_dir)
+        manifest = os.path.join(workdir, "manifest.csv")
+        with open(manifest, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["tenant_id", "pdf_path"])
+            for i in range(args.tenants):
+                shutil.copy(CONTRACT_PDF, os.path.join(pdf_dir, f"t{i}.pdf"))
+                writer.writerow([f"tenant{i}@bulk.local", f"contracts/t{i}.pdf"])
+            with open(os.path.join(pdf_dir, "broken.pdf"), "wb") as broken:
+                broken.write(b"%PDF-1.4 not really a pdf")
+            writer.writerow(["broken@bulk.local", "contracts/broken.pdf"])
+        jobs = jobs_from_manifest(manifest)
+        good_jobs = [job for job in jobs if not job[0].startswith("broken")]
+
+        embedder = llm3_new.embeddings.inner
+        print(f"{args.tenants} contracts, embed {args.embed_latency}s/call, extraction {args.chat_latency}s/call\n")
+
+        embedder.calls = 0
+        started = time.perf_counter()
+        for tenant_id, path in good_jobs:
+            llm3_new.create_user_vectorstore(f"serial-{tenant_id}", path)
+        serial_s = time.perf_counter() - started
+        # /upload 不等 FAQ；排空后台任务，免得算进下面批量导入的 FAQ 等待时间
+        llm3_new.contract_faq.wait_idle()
+        print(f"serial /upload path: {serial_s:.2f}s ({len(good_jobs) / serial_s:.2f} contracts/s, "
+              f"{embedder.calls} embedding calls)")
+
+        checkpoint_path = os.path.join(workdir, "checkpoint.jsonl")
+        embedder.calls = 0
+        bulk = BulkIngest(Checkpoint(checkpoint_path), args.workers, args.embed_batch, args.llm_concurrency)
+        report = bulk.run(jobs)
+        # 比较的是建库 + 摘要；FAQ 生成两条路径一样（同一个后台线程池），单独报告
+        index_s = report["seconds"] - report["faq_seconds"]
+        print(f"speed-up (excluding FAQ generation): {serial_s / index_s:.1f}x; "
+              f"FAQ answers took another {report['faq_seconds']}s\n")
+        assert report["ingested"] == len(good_jobs) and report["failed"] == 1, report
+
+        resumed = BulkIngest(Checkpoint(checkpoint_path), args.workers, args.embed_batch, args.llm_concurrency)
+        report = resumed.run(jobs)
+        assert report["skipped"] == len(good_jobs) and report["ingested"] == 0, report
+        assert all(llm3_new.get_contract_document(t)["summary"] for t, _ in good_jobs)
+        # 批量导入同样预生成 FAQ 答案，run() 返回前已经等完
+        if llm3_new.contract_faq.enabled:
+            assert all(llm3_new.contract_faq.answer(t, "pets") for t, _ in good_jobs)
+        print("\n✅ Resume skipped every ingested tenant; the corrupt PDF was retried and reported.")
+    finally:
+        services.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
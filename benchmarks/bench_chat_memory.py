@@ -0,0 +1,90 @@
+# benchmarks/bench_chat_memory.py
+"""
+Prompt size of general chat: 10-message window (before) vs rolling summary + recent window.
+
+Plays ``--turns`` long general-chat turns per tenant through ``TenantChatbot`` on the
+offline fakes and, before each turn, measures the conversation prompt both ways:
+
+- ``window``: ``ConversationBufferWindowMemory(k=10, return_messages=True)`` as it was
+  formatted into the prompt before (the message list's repr)
+- ``window_text``: the same 20 messages rendered as plain ``Human: / AI:`` lines
+- ``summary``: what is sent now (``chat_summaries`` summary + last recent messages)
+
+    python -m benchmarks.bench_chat_memory --tenants 5 --turns 30 --words 80
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+
+from benchmarks.fakes import install_fakes
+
+VOCABULARY = (
+    "weekend neighbours noisy corridor lift parking visitors weather lunch office commute "
+    "plans family holiday cooking market groceries cinema music gym evening morning friends "
+    "birthday project deadline meeting train station coffee bakery garden plants window light"
+).split()
+
+
+def _message(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)) + "?"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--words", type=int, default=80, help="Words per user message")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    services = install_fakes()
+    try:
+        from langchain.chains.conversation.prompt import PROMPT
+        from langchain_core.messages import get_buffer_string
+
+        from backend.context_packer import count_tokens
+        from langchain.memory import ConversationBufferWindowMemory
+
+        from backend.llm3_new import (
+            DATABASE_URL, Psycopg2ChatHistory, TenantChatbot, chat_summary_memory, initialize_database_tables, llm,
+        )
+
+        initialize_database_tables()
+        rng = random.Random(args.seed)
+        sizes = {"window": [], "window_text": [], "summary": []}
+        for t in range(args.tenants):
+            tenant = f"chatty{t}@bench.local"
+            bot = TenantChatbot(llm, tenant)
+            for _ in range(args.turns):
+                query = _message(rng, args.words)
+                window = ConversationBufferWindowMemory(
+                    chat_memory=Psycopg2ChatHistory(tenant, DATABASE_URL), k=10, return_messages=True
+                ).load_memory_variables({})["history"]
+                sizes["window"].append(count_tokens(PROMPT.format(history=window, input=query)))
+                sizes["window_text"].append(count_tokens(PROMPT.format(history=get_buffer_string(window), input=query)))
+                sizes["summary"].append(count_tokens(PROMPT.format(history=chat_summary_memory.render(tenant), input=query)))
+
+                bot._handle("general_chat", query, tenant)
+                chat_summary_memory.wait_idle()  # 两轮之间后台摘要有足够时间完成
+    finally:
+        services.stop()
+
+    from backend import metrics
+
+    print(f"tenants x turns    : {args.tenants} x {args.turns}, {args.words} words per message")
+    for name, values in sizes.items():
+        # 只看窗口已填满之后的稳态
+        steady = [v for i, v in enumerate(values) if i % args.turns >= 10]
+        print(f"{name:<12} mean prompt tokens (turn 11+): {statistics.mean(steady):7.0f}   "
+              f"max: {max(values):6d}   total: {sum(values)}")
+    base = sum(sizes["window"])
+    print(f"reduction vs window      : {1 - sum(sizes['summary']) / base:.1%}")
+    print(f"reduction vs window_text : {1 - sum(sizes['summary']) / sum(sizes['window_text']):.1%}")
+    print(f"summary updates          : {metrics.CHAT_SUMMARY_UPDATES.labels(result='updated')._value.get():.0f} "
+          f"({metrics.CHAT_SUMMARY_UPDATES.labels(result='failed')._value.get():.0f} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# benchmarks/bench_chatbot_construction.py
+"""
+Cost of creating ``TenantChatbot`` instances: construction time and retained memory per tenant.
+
+    python -m benchmarks.bench_chatbot_construction --tenants 500
+
+Uses the offline fakes, so no OpenAI key or database is needed.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+
+from benchmarks.bench_vectorstore import _percentile
+from benchmarks.fakes import install_fakes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=500)
+    args = parser.parse_args()
+
+    services = install_fakes()
+    try:
+        from backend.llm3_new import TenantChatbot, llm
+
+        TenantChatbot(llm, "warmup@bench.local")  # 进程级的一次性初始化不算在内
+
+        gc.collect()
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        bots, timings = [], []
+        for i in range(args.tenants):
+            start = time.perf_counter()
+            bots.append(TenantChatbot(llm, f"tenant{i}@bench.local"))
+            timings.append(time.perf_counter() - start)
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        services.stop()
+
+    print(f"tenants            : {args.tenants}")
+    print(f"construct p50      : {statistics.median(timings) * 1e6:.0f} µs")
+    print(f"construct p95      : {_percentile(timings, 95) * 1e6:.0f} µs")
+    print(f"construct total    : {sum(timings) * 1000:.1f} ms")
+    print(f"memory per tenant  : {(after - before) / args.tenants / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/bench_embeddings.py
+"""
+Query-embedding latency and ingestion throughput: OpenAI vs local ONNX embeddings.
+
+    python -m benchmarks.bench_embeddings --backends LOCAL,OPENAI --queries 50 --chunks 500
+
+OPENAI needs OPENAI_API_KEY (and costs a little); LOCAL needs the model directory
+(see ``python -m backend.local_embeddings --download``).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from benchmarks.bench_vectorstore import VOCAB, _percentile
+
+QUESTIONS = [
+    "When does my lease end?",
+    "Can I keep a cat in the apartment?",
+    "Who pays for aircon servicing?",
+    "How much notice do I need to give for early termination?",
+    "Is my security deposit refundable?",
+    "Can I sublet the second bedroom?",
+]
+
+
+def _make_embeddings(name: str, threads: int, batch_size: int):
+    if name == "OPENAI":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            model=os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"),
+        )
+    if name == "LOCAL":
+        from backend.local_embeddings import LocalOnnxEmbeddings
+        return LocalOnnxEmbeddings(threads=threads, batch_size=batch_size)
+    raise ValueError(f"Unknown backend {name}")
+
+
+def run(name: str, n_queries: int, n_chunks: int, threads: int, batch_size: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    emb = _make_embeddings(name, threads, batch_size)
+    emb.embed_query("warm up")
+    load_s = time.perf_counter() - t0
+
+    latencies = []
+    for i in range(n_queries):
+        q = QUESTIONS[i % len(QUESTIONS)]
+        t0 = time.perf_counter()
+        emb.embed_query(q)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    # ~1000 字符的合同片段，和 create_user_vectorstore 的 chunk_size 一致
+    chunks = [" ".join(rng.choice(VOCAB) for _ in range(140)) for _ in range(n_chunks)]
+    t0 = time.perf_counter()
+    emb.embed_documents(chunks)
+    ingest_s = time.perf_counter() - t0
+
+    return {
+        "backend": name,
+        "load_s": round(load_s, 2),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(_percentile(latencies, 95), 2),
+        "ingest_chunks_per_s": round(n_chunks / ingest_s, 1) if ingest_s else 0.0,
+    }
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="LOCAL,OPENAI")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("LOCAL_EMBEDDING_THREADS", "0")))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32")))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = []
+    for name in [b.strip().upper() for b in args.backends.split(",") if b.strip()]:
+        try:
+            rows.append(run(name, args.queries, args.chunks, args.threads, args.batch_size, args.seed))
+        except Exception as e:
+            print(f"⚠️ Skipping {name}: {e}")
+
+    if rows:
+        columns = list(rows[0].keys())
+        print(" | ".join(columns))
+        for row in rows:
+            print(" | ".join(str(row[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_hedging.py
+"""
+Tail latency of chat completions with and without hedging / deadlines / fallback.
+
+Runs the real ``ChatOpenAI`` client against ``benchmarks/fake_openai_server.py``,
+which answers in ``--latency`` seconds but stalls for ``--tail-latency`` seconds on
+a ``--tail-prob`` fraction of requests. The fallback model is never slowed.
+
+    python -m benchmarks.bench_hedging --calls 300 --concurrency 8 --tail-prob 0.05 --tail-latency 8
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.bench_vectorstore import _percentile
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+PRIMARY_MODEL = "gpt-4o-mini"
+FALLBACK_MODEL = "fallback-fast"
+
+
+def _run(label: str, model: Any, calls: int, concurrency: int, route: str) -> Dict[str, Any]:
+    from backend.llm_hedging import llm_deadline
+
+    latencies: List[float] = []
+    failures = 0
+
+    def one(i: int) -> None:
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            with llm_deadline(route):
+                model.invoke(f"Question {i}: how long is the notice period?")
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(calls)))
+    wall = time.perf_counter() - started
+    return {
+        "mode": label,
+        "calls": calls,
+        "failures": failures,
+        "throughput_rps": round(calls / wall, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else 0.0,
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tail-prob", type=float, default=0.05)
+    parser.add_argument("--tail-latency", type=float, default=8.0)
+    parser.add_argument("--fallback-latency", type=float, default=0.3)
+    parser.add_argument("--deadline", type=float, default=3.0, help="Route deadline (s) for the hedged run")
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # 模块常量在 import 时读取环境变量，所以先设好
+    os.environ["LLM_DEADLINE_BENCH_S"] = str(args.deadline)
+    os.environ.setdefault("LLM_HEDGE_MIN_SAMPLES", "10")
+
+    from langchain_openai import ChatOpenAI
+
+    from backend import llm_hedging
+    from backend.llm_hedging import hedged_chat_model
+
+    server = FakeOpenAIServer(
+        latency_s=args.latency,
+        tail_prob=args.tail_prob,
+        tail_latency_s=args.tail_latency,
+        model_latency={FALLBACK_MODEL: args.fallback_latency},
+        seed=args.seed,
+    ).start()
+    common = dict(api_key="sk-bench", base_url=server.base_url, timeout=args.request_timeout, max_retries=0)
+    try:
+        plain = ChatOpenAI(model=PRIMARY_MODEL, **common)
+        fallback = ChatOpenAI(model=FALLBACK_MODEL, **common)
+        hedged = hedged_chat_model(ChatOpenAI)(model=PRIMARY_MODEL, fallback=fallback, **common)
+
+        rows = [_run("plain", plain, args.calls, args.concurrency, "bench")]
+        sent_before = len(server.requests)
+        rows.append(_run("hedged+fallback", hedged, args.calls, args.concurrency, "bench"))
+        extra_requests = len(server.requests) - sent_before - args.calls
+    finally:
+        server.stop()
+        llm_hedging._executor.shutdown(wait=False, cancel_futures=True)
+
+    columns = list(rows[0])
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join(str(row[c]) for c in columns))
+    print(f"\nExtra upstream requests from hedges/fallbacks: {extra_requests} "
+          f"({extra_requests / args.calls:.1%} of calls)")
+
+
+if __name__ == "__main__":
+    main()
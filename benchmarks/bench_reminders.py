@@ -0,0 +1,119 @@
+# benchmarks/bench_reminders.py
+"""
+Reminder scheduler on the offline fakes with the local SMTP sink:
+
+- throughput with 1 shard vs ``--shards`` shards (tenants split by hash, shards in parallel)
+- exactly-once: a second run the same day sends nothing
+- crash safety: a run that dies halfway is resumed by the next run, and every
+  tenant ends up with exactly one email
+- killed process: claims left ``sending`` are taken over once they expire
+
+    python -m benchmarks.bench_reminders --tenants 400 --shards 8 --mail-latency 0.02
+"""
+from __future__ import annotations
+
+import argparse
+import collections
+import datetime
+import os
+import time
+
+from benchmarks.fakes import install_fakes
+
+
+class _Crash(BaseException):  # like KeyboardInterrupt: not a send failure
+    pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=400)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--mail-latency", type=float, default=0.02, help="Seconds per email in the SMTP sink")
+    args = parser.parse_args()
+
+    services = install_fakes(mail_latency_s=args.mail_latency)
+    try:
+        import psycopg2
+
+        from backend import reminder_scheduler, send_rent_reminders
+        from backend.llm3_new import initialize_database_tables
+        from backend.reminder_scheduler import ReminderScheduler
+
+        initialize_database_tables()
+        today = datetime.date.today()
+        due_day = (today + datetime.timedelta(days=3)).day
+        conn = psycopg2.connect(os.environ["DATABASE_URL"])
+        with conn.cursor() as cur:
+            for i in range(args.tenants):
+                cur.execute(
+                    "INSERT INTO users (tenant_id, user_name, rent_due_day) VALUES (%s, %s, %s)",
+                    (f"tenant{i}@remind.local", f"Tenant {i}", due_day),
+                )
+        conn.commit()
+
+        def reset_log() -> None:
+            c = psycopg2.connect(os.environ["DATABASE_URL"])
+            with c.cursor() as cur:
+                cur.execute("DELETE FROM reminder_log")
+            c.commit()
+            c.close()
+
+        sink = services.smtp_sink
+        send = send_rent_reminders.send_email
+
+        for shards in (1, args.shards):
+            reset_log()
+            sink.messages.clear()
+            started = time.perf_counter()
+            report = ReminderScheduler(os.environ["DATABASE_URL"], send=send, shards=shards).run_once()
+            wall = time.perf_counter() - started
+            print(f"{shards:>2} shard(s): {report['sent']} emails in {wall:.2f}s ({report['sent'] / wall:.0f}/s)")
+            assert report["sent"] == args.tenants, report
+
+        report = ReminderScheduler(os.environ["DATABASE_URL"], send=send, shards=args.shards).run_once()
+        print(f"re-run same day: {report['sent']} sent, {report['skipped']} skipped")
+        assert report["sent"] == 0
+
+        # 中途崩溃：发到一半抛异常，下一次运行补发剩下的
+        reset_log()
+        sink.messages.clear()
+        sent_before_crash = []
+
+        def crashing_send(to_email, subject, body):
+            if len(sent_before_crash) >= args.tenants // 3:
+                raise _Crash("simulated crash")
+            sent_before_crash.append(to_email)
+            return send(to_email, subject, body)
+
+        try:
+            ReminderScheduler(os.environ["DATABASE_URL"], send=crashing_send, shards=args.shards).run_once()
+        except _Crash:
+            pass
+        report = ReminderScheduler(os.environ["DATABASE_URL"], send=send, shards=args.shards).run_once()
+        counts = collections.Counter(to for m in sink.messages for to in m["to"])
+        print(f"crash after {len(sent_before_crash)} emails, resumed run sent {report['sent']}: "
+              f"{len(counts)} tenants emailed, max {max(counts.values())} email(s) each")
+        assert len(counts) == args.tenants and max(counts.values()) == 1
+
+        # 进程被杀：claim 留在 sending，超时后由下一次运行接手
+        reset_log()
+        sink.messages.clear()
+        killed = ReminderScheduler(os.environ["DATABASE_URL"], send=lambda *a: True, shards=1)
+        rows = killed._candidates(today)[:10]
+        c = psycopg2.connect(os.environ["DATABASE_URL"])
+        killed._claim(c, rows, today)
+        c.close()
+        report = ReminderScheduler(os.environ["DATABASE_URL"], send=send, shards=args.shards).run_once()
+        waiting = report["skipped"]
+        reminder_scheduler.REMINDER_CLAIM_TIMEOUT_S = 0
+        report = ReminderScheduler(os.environ["DATABASE_URL"], send=send, shards=args.shards).run_once()
+        print(f"killed run: {waiting} claims waited for the timeout, then {report['sent']} were taken over")
+        assert waiting == len(rows) and report["sent"] == len(rows)
+        print("\n✅ Every tenant got exactly one reminder in every scenario.")
+    finally:
+        services.stop()
+
+
+if __name__ == "__main__":
+    main()
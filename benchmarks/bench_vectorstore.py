@@ -0,0 +1,148 @@
+# benchmarks/bench_vectorstore.py
+"""
+Open / query latency of the vector-store backends at many tenants.
+
+Each backend runs in its own subprocess (so RSS numbers are not shared) against a
+synthetic corpus embedded with ``FakeEmbeddings``; nothing touches OpenAI.
+
+    python -m benchmarks.bench_vectorstore --tenants 10000 --chunks 30 --backends CHROMA,CHROMA_SHARED,NUMPY
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from langchain_core.documents import Document
+
+from backend.vectorstore_backends import get_vectorstore_backend
+from benchmarks.fakes import FakeEmbeddings
+
+VOCAB = [
+    "rent", "deposit", "tenant", "landlord", "clause", "repair", "aircon", "notice", "termination",
+    "renewal", "utilities", "pets", "sublet", "payment", "late", "fee", "agreement", "premises",
+    "inventory", "keys", "servicing", "diplomatic", "option", "stamp", "duty", "furniture",
+]
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _tenant_docs(rng: random.Random, n_chunks: int):
+    return [
+        Document(
+            page_content=" ".join(rng.choice(VOCAB) for _ in range(150)),
+            metadata={"source": "contract.pdf", "page": i // 3, "start_index": i * 800},
+        )
+        for i in range(n_chunks)
+    ]
+
+
+def _dir_stats(path: str):
+    files, size = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_one(backend_name: str, base_dir: str, tenants: int, chunks: int, samples: int, k: int, seed: int):
+    rng = random.Random(seed)
+    embeddings = FakeEmbeddings()
+    tenant_ids = [f"tenant{i}@example.com" for i in range(tenants)]
+
+    backend = get_vectorstore_backend(backend_name, embeddings, base_dir)
+    t0 = time.perf_counter()
+    for tenant_id in tenant_ids:
+        backend.build(tenant_id, _tenant_docs(rng, chunks))
+    ingest_s = time.perf_counter() - t0
+    del backend
+
+    # 新建 backend 实例模拟冷启动：进程内没有已打开的 client / collection
+    t0 = time.perf_counter()
+    backend = get_vectorstore_backend(backend_name, embeddings, base_dir)
+    init_ms = (time.perf_counter() - t0) * 1000
+
+    sample = rng.sample(tenant_ids, min(samples, len(tenant_ids)))
+    cold, warm = [], []
+    for tenant_id in sample:
+        query = " ".join(rng.choice(VOCAB) for _ in range(8))
+        t0 = time.perf_counter()
+        backend.exists(tenant_id)
+        backend.search(tenant_id, query, k)
+        cold.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        backend.search(tenant_id, query, k)
+        warm.append((time.perf_counter() - t0) * 1000)
+
+    files, size = _dir_stats(base_dir)
+    return {
+        "backend": backend_name,
+        "tenants": tenants,
+        "chunks_per_tenant": chunks,
+        "ingest_s": round(ingest_s, 2),
+        "init_ms": round(init_ms, 2),
+        "first_query_p50_ms": round(statistics.median(cold), 2),
+        "first_query_p95_ms": round(_percentile(cold, 95), 2),
+        "warm_query_p50_ms": round(statistics.median(warm), 2),
+        "warm_query_p95_ms": round(_percentile(warm, 95), 2),
+        "files_on_disk": files,
+        "disk_mb": round(size / 1e6, 1),
+        "max_rss_mb": round(_rss_mb(), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="CHROMA,CHROMA_SHARED,NUMPY")
+    parser.add_argument("--tenants", type=int, default=10000)
+    parser.add_argument("--chunks", type=int, default=30)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--base-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        result = run_one(args.run_one, args.base_dir, args.tenants, args.chunks, args.samples, args.k, args.seed)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for name in [b.strip().upper() for b in args.backends.split(",") if b.strip()]:
+        with tempfile.TemporaryDirectory(prefix=f"bench_{name.lower()}_") as base_dir:
+            print(f"⏱️ {name}: {args.tenants} tenants × {args.chunks} chunks ...", flush=True)
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_vectorstore", "--run-one", name,
+                 "--base-dir", base_dir, "--tenants", str(args.tenants), "--chunks", str(args.chunks),
+                 "--samples", str(args.samples), "--k", str(args.k), "--seed", str(args.seed)],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    columns = list(results[0].keys()) if results else []
+    print("\n" + " | ".join(columns))
+    for row in results:
+        print(" | ".join(str(row[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
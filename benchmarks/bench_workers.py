@@ -0,0 +1,166 @@
+# benchmarks/bench_workers.py
+"""
+/chat throughput of the real uvicorn server with 1 worker vs N workers.
+
+Each run starts ``uvicorn benchmarks.fake_app:app --workers N`` on a fresh shared
+workdir (sqlite "Postgres" + vector-store directory), with ``INVALIDATION_BUS=redis``
+pointed at ``benchmarks/fake_redis.py`` and Prometheus multiprocess mode on. It uploads
+a contract for every tenant, drives /chat over HTTP, then re-uploads one tenant and
+checks from ``/metrics`` that every worker received the invalidation.
+
+    python -m benchmarks.bench_workers --workers 1,4 --requests 400 --concurrency 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_redis import FakeRedis
+from benchmarks.load_test import CHAT_MESSAGES, CONTRACT_PDF, REPO_ROOT, _drive, _percentile
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(workers: int, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "uvicorn", "benchmarks.fake_app:app",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+    ]
+    # 服务端 JSON 日志写 stdout，这里不需要
+    return subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+
+
+async def _wait_ready(client, proc: subprocess.Popen, timeout_s: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {proc.returncode}")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError("server did not become ready")
+
+
+def _invalidations_seen(metrics_text: str) -> float:
+    match = re.search(r'^tenant_invalidations_total\{kind="vectorstore"\} (\S+)$', metrics_text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+async def _run(workers: int, args, broker: FakeRedis) -> Dict[str, Any]:
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix=f"bench_workers{workers}_")
+    prom_dir = os.path.join(workdir, "prometheus")
+    os.makedirs(prom_dir)
+    port = _free_port()
+    env = dict(
+        os.environ,
+        BENCH_WORKDIR=workdir,
+        BENCH_CHAT_LATENCY_S=str(args.chat_latency),
+        INVALIDATION_BUS="redis",
+        INVALIDATION_URL=broker.url,
+        PROMETHEUS_MULTIPROC_DIR=prom_dir,
+        LLM_MAX_CONCURRENCY=str(args.llm_concurrency),
+        LOG_LEVEL="ERROR",
+        PYTHONPATH=REPO_ROOT,
+    )
+    tenants = [f"tenant{i}@bench.local" for i in range(args.tenants)]
+    with open(CONTRACT_PDF, "rb") as f:
+        pdf_bytes = f.read()
+    rng = random.Random(args.seed)
+
+    proc = _start_server(workers, port, env)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            await _wait_ready(client, proc)
+
+            async def upload(tenant: str):
+                return await client.post(
+                    "/upload",
+                    files={"file": ("contract.pdf", pdf_bytes, "application/pdf")},
+                    data={"tenant_id": tenant},
+                )
+
+            for tenant in tenants:
+                await client.post("/register", data={"tenant_id": tenant, "user_name": tenant.split("@")[0]})
+                await upload(tenant)
+
+            async def chat(i: int):
+                return await client.post("/chat", data={
+                    "tenant_id": rng.choice(tenants),
+                    "message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)],
+                })
+
+            await _drive(client, args.concurrency * 2, args.concurrency, chat)  # warm-up
+            latencies, errors, wall = await _drive(client, args.requests, args.concurrency, chat)
+
+            # 重新上传一个租户：每个 worker 都应收到一次失效通知
+            before = _invalidations_seen((await client.get("/metrics")).text)
+            await upload(tenants[0])
+            await asyncio.sleep(1.0)
+            delivered = _invalidations_seen((await client.get("/metrics")).text) - before
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    n = len(latencies) + errors
+    return {
+        "workers": workers,
+        "requests": n,
+        "errors": errors,
+        "throughput_rps": round(n / wall, 2),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "invalidations_per_upload": int(delivered),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default=f"1,{min(4, os.cpu_count() or 1) or 1}",
+                        help="Comma-separated worker counts to compare")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--chat-latency", type=float, default=0.05)
+    parser.add_argument("--llm-concurrency", type=int, default=64,
+                        help="LLM_MAX_CONCURRENCY per worker; high so the scheduler is not the bottleneck")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    broker = FakeRedis().start()
+    try:
+        rows: List[Dict[str, Any]] = []
+        for workers in sorted({int(w) for w in args.workers.split(",")}):
+            rows.append(asyncio.run(_run(workers, args, broker)))
+    finally:
+        broker.stop()
+
+    print(f"cpu_count: {os.cpu_count()}")
+    columns = list(rows[0])
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join(str(row[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# benchmarks/eval_rag.py
+"""
+RAG evaluation: answer quality vs latency for chunking, retriever k, embeddings and
+vector-store backend.
+
+Each dataset in ``benchmarks/rag_eval/*.json`` names a contract (a PDF, or a ``.txt``
+that is rendered to a PDF first) and its labelled questions:
+
+    {"question": "...", "evidence": ["exact contract text"], "clauses": ["7.2"], "answers": ["three months"]}
+
+For every configuration in the grid, each contract is ingested with
+``create_user_vectorstore`` and each question goes through ``TenantChatbot.process_query``,
+the same path as /upload and /chat. Reported per configuration:
+
+- ``recall@k``:  share of the evidence strings found in the retrieved chunks
+- ``citation``:  answers citing one of the expected clause numbers
+- ``answer``:    answers containing one of the expected answer strings
+- ``prompt_tok``: prompt tokens per question (``llm_tokens_total``)
+- ingest time per contract, query p50 / p95 and the mean of each ``chat_stage_latency_seconds`` stage
+
+By default the fake models from ``benchmarks/fakes.py`` are used (no network): hashed
+bag-of-words embeddings and an extractive reader that quotes the best-matching context
+sentence and the clause it sits under. ``--embeddings LOCAL`` uses the ONNX model
+(``python -m backend.local_embeddings --download``); ``--models openai`` uses the real
+OpenAI models and costs a little.
+
+Pre-generated FAQ answers (``backend/contract_faq.py``) would bypass retrieval for the
+common questions, so they are switched off unless ``--faq`` is given; with ``--faq`` the
+answers are generated after ingest and ``answer`` / ``citation`` score what /chat serves
+(``recall@k`` then only counts the questions that still went through RAG).
+
+    python -m benchmarks.eval_rag
+    python -m benchmarks.eval_rag --chunk-sizes 500,1000 --overlaps 0,200 --k 3,6 --backends CHROMA,NUMPY
+    python -m benchmarks.eval_rag --models openai --embeddings OPENAI,OPENAI:text-embedding-3-large --k 6
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import textwrap
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fakes import FakeEmbeddings, install_fakes
+from benchmarks.load_test import _percentile
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_eval")
+STAGES = ("retrieval", "context_pack", "llm_call")
+_CITED_CLAUSE = re.compile(r"clause\s+(\d+(?:\.\d+)*)", re.I)
+
+
+# === Fixtures ===
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(text: str, path: str, width: int = 95, lines_per_page: int = 60) -> None:
+    """Minimal one-font PDF, enough for ``PyPDFLoader`` to read the text back line by line."""
+    lines: List[str] = []
+    for paragraph in text.splitlines():
+        lines.extend(textwrap.wrap(paragraph, width) or [""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # 1 catalog, 2 page tree, 3 font, then (page, content stream) per page
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        body = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in page) + " ET"
+        stream = body.encode("latin-1", "replace")
+        page_no = len(objects) + 1
+        kids.append(f"{page_no} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {page_no + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def load_datasets(paths: List[str], workdir: str) -> List[Dict[str, Any]]:
+    datasets = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        document = os.path.normpath(os.path.join(os.path.dirname(path), data["document"]))
+        if document.lower().endswith(".txt"):
+            pdf = os.path.join(workdir, os.path.basename(document)[:-4] + ".pdf")
+            with open(document, encoding="utf-8") as f:
+                write_text_pdf(f.read(), pdf)
+            document = pdf
+        name = os.path.splitext(os.path.basename(path))[0]
+        datasets.append({"name": name, "pdf": document, "questions": data["questions"]})
+    return datasets
+
+
+# === Scoring ===
+def _normalise(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def evidence_recall(evidence: List[str], chunks: List[str]) -> float:
+    if not evidence:
+        return 1.0
+    retrieved = [_normalise(c) for c in chunks]
+    return sum(any(_normalise(e) in c for c in retrieved) for e in evidence) / len(evidence)
+
+
+def cites_clause(answer: str, clauses: List[str]) -> bool:
+    return bool(set(_CITED_CLAUSE.findall(answer)) & set(clauses))
+
+
+def contains_answer(answer: str, answers: List[str]) -> bool:
+    return any(_normalise(a) in _normalise(answer) for a in answers)
+
+
+class _RecordingBackend:
+    """Wraps the vector backend to keep what the last ``search`` returned."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.last: Optional[List[str]] = None
+
+    def search(self, tenant_id: str, query: str, k: int):
+        docs = self.inner.search(tenant_id, query, k=k)
+        self.last = [d.page_content for d in docs]
+        return docs
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+# === Grid ===
+def make_embeddings(spec: str, models: str, embed_latency: float):
+    """``FAKE`` | ``LOCAL`` | ``OPENAI`` | ``OPENAI:<model>``."""
+    name, _, model = spec.partition(":")
+    name = name.upper()
+    if name == "FAKE":
+        return FakeEmbeddings(latency_s=embed_latency)
+    if name == "LOCAL":
+        from backend.local_embeddings import get_local_embeddings
+        return get_local_embeddings()
+    if name == "OPENAI":
+        if models != "openai":
+            raise SystemExit("OPENAI embeddings need --models openai (the fake models replace OpenAIEmbeddings)")
+        from langchain_openai import OpenAIEmbeddings
+
+        from backend import llm3_new
+        from backend.llm_scheduler import ScheduledEmbeddings
+        return ScheduledEmbeddings(OpenAIEmbeddings(
+            api_key=llm3_new.OPENAI_API_KEY, model=model or llm3_new.EMBEDDING_MODEL,
+            base_url=llm3_new.OPENAI_BASE_URL,
+        ))
+    raise SystemExit(f"Unknown embeddings {spec!r}")
+
+
+def _sample(name: str, labels: Dict[str, str]) -> float:
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def evaluate(datasets, embeddings_spec: str, backend_name: str, chunk_size: int, overlap: int,
+             ks: List[int], args, workdir: str, show_misses: bool) -> List[Dict[str, Any]]:
+    """Ingest every contract once for this chunking / embeddings / backend, then score each k."""
+    from backend import contract_chunking, llm3_new
+    from backend.vectorstore_backends import get_vectorstore_backend
+
+    contract_chunking.CHUNK_SIZE = chunk_size
+    contract_chunking.CHUNK_OVERLAP = overlap
+    embeddings = make_embeddings(embeddings_spec, args.models, args.embed_latency)
+    store_dir = tempfile.mkdtemp(prefix="store_", dir=workdir)
+    backend = _RecordingBackend(get_vectorstore_backend(backend_name, embeddings, store_dir))
+    llm3_new.vector_backend = backend
+    llm3_new.contract_faq.enabled = args.faq
+
+    # 第一次打开 backend / 加载模型的开销不算进 ingest 时间
+    llm3_new.create_user_vectorstore(f"warmup-{os.path.basename(store_dir)}@rag.local", datasets[0]["pdf"])
+    ingest_ms = []
+    for i, dataset in enumerate(datasets):
+        dataset["tenant_id"] = f"eval{i}-{os.path.basename(store_dir)}@rag.local"
+        started = time.perf_counter()
+        llm3_new.create_user_vectorstore(dataset["tenant_id"], dataset["pdf"])
+        ingest_ms.append((time.perf_counter() - started) * 1000)
+    llm3_new.contract_faq.wait_idle()  # FAQ 答案在后台生成，不算进 ingest 时间
+
+    chatbot = llm3_new.TenantChatbot(llm3_new.llm, "eval@rag.local")
+    token_labels = {"model": llm3_new.CHAT_MODEL, "kind": "prompt"}
+    rows = []
+    for k in ks:
+        llm3_new.RAG_RETRIEVER_K = k
+        scores = {"recall": [], "citation": [], "answer": [], "prompt_tokens": [], "latency": []}
+        stage_s = {stage: 0.0 for stage in STAGES}
+        misses = []
+        for dataset in datasets:
+            for item in dataset["questions"]:
+                backend.last = None
+                before = {stage: _sample("chat_stage_latency_seconds_sum", {"stage": stage}) for stage in STAGES}
+                tokens_before = _sample("llm_tokens_total", token_labels)
+                started = time.perf_counter()
+                answer = chatbot.process_query(item["question"], dataset["tenant_id"])
+                scores["latency"].append((time.perf_counter() - started) * 1000)
+                scores["prompt_tokens"].append(_sample("llm_tokens_total", token_labels) - tokens_before)
+                for stage in STAGES:
+                    stage_s[stage] += _sample("chat_stage_latency_seconds_sum", {"stage": stage}) - before[stage]
+
+                # 没走到检索（路由到别处）按 0 召回计
+                recall = evidence_recall(item.get("evidence", []), backend.last or [])
+                scores["recall"].append(recall)
+                if item.get("clauses"):
+                    scores["citation"].append(cites_clause(answer, item["clauses"]))
+                if item.get("answers"):
+                    scores["answer"].append(contains_answer(answer, item["answers"]))
+                if recall < 1.0 or (item.get("clauses") and not scores["citation"][-1]):
+                    misses.append((dataset["name"], item["question"], recall, answer.splitlines()[-1][:100]))
+
+        n = len(scores["latency"])
+        row = {
+            "config": f"{embeddings_spec}/{backend_name} chunk={chunk_size} overlap={overlap} k={k}",
+            "recall@k": round(sum(scores["recall"]) / n, 3),
+            "citation": round(sum(scores["citation"]) / len(scores["citation"]), 3) if scores["citation"] else None,
+            "answer": round(sum(scores["answer"]) / len(scores["answer"]), 3) if scores["answer"] else None,
+            "prompt_tok": round(sum(scores["prompt_tokens"]) / n, 1),
+            "ingest_ms": round(sum(ingest_ms) / len(ingest_ms), 1),
+            "p50_ms": round(_percentile(scores["latency"], 50), 1),
+            "p95_ms": round(_percentile(scores["latency"], 95), 1),
+        }
+        row.update({f"{stage}_ms": round(stage_s[stage] * 1000 / n, 2) for stage in STAGES})
+        rows.append(row)
+        if show_misses:
+            for name, question, recall, tail in misses:
+                print(f"  miss [{row['config']}] {name}: {question!r} recall={recall:.2f} -> {tail}")
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--datasets", default=os.path.join(DATASET_DIR, "*.json"), help="Glob of dataset files")
+    parser.add_argument("--chunk-sizes", default="300,500,1000")
+    parser.add_argument("--overlaps", default="0,200")
+    parser.add_argument("--k", default="3,6")
+    parser.add_argument("--embeddings", help="Comma-separated FAKE, LOCAL, OPENAI, OPENAI:<model> "
+                                             "(default: FAKE, or OPENAI with --models openai)")
+    parser.add_argument("--backends", default="CHROMA,NUMPY")
+    parser.add_argument("--models", choices=("fake", "openai"), default="fake")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="Fake LLM latency (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Fake embeddings latency (s)")
+    parser.add_argument("--faq", action="store_true", help="Serve pre-generated FAQ answers (off: RAG only)")
+    parser.add_argument("--show-misses", action="store_true", help="Print every question that missed")
+    parser.add_argument("--json-out")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="eval_rag_")
+    services = install_fakes(chat_latency_s=args.chat_latency, embed_latency_s=args.embed_latency,
+                             workdir=workdir, fake_models=args.models == "fake")
+    try:
+        from backend.llm3_new import initialize_database_tables
+        initialize_database_tables()
+
+        datasets = load_datasets(sorted(glob.glob(args.datasets)), workdir)
+        n_questions = sum(len(d["questions"]) for d in datasets)
+        print(f"{len(datasets)} contract(s), {n_questions} questions, models: {args.models}")
+
+        embeddings = (args.embeddings or ("FAKE" if args.models == "fake" else "OPENAI")).split(",")
+        ks = [int(k) for k in args.k.split(",")]
+        grid = itertools.product(
+            embeddings, args.backends.split(","),
+            [int(v) for v in args.chunk_sizes.split(",")], [int(v) for v in args.overlaps.split(",")],
+        )
+        results = []
+        for embeddings_spec, backend_name, chunk_size, overlap in grid:
+            if overlap >= chunk_size:
+                continue
+            results.extend(evaluate(datasets, embeddings_spec, backend_name.upper(), chunk_size, overlap,
+                                    ks, args, workdir, args.show_misses))
+
+        columns = ["config", "recall@k", "citation", "answer", "prompt_tok", "ingest_ms", "p50_ms", "p95_ms"] + \
+            [f"{stage}_ms" for stage in STAGES]
+        print("\n" + " | ".join(columns))
+        for row in results:
+            print(" | ".join(str(row.get(c, "")) for c in columns))
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        services.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
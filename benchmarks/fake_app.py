@@ -0,0 +1,26 @@
+# benchmarks/fake_app.py
+"""
+ASGI entry point that serves ``backend.api:app`` on the offline fakes, so the real
+server (``uvicorn --workers N``) can be benchmarked without OpenAI or Postgres:
+
+    BENCH_WORKDIR=/tmp/bench BENCH_CHAT_LATENCY_S=0.3 uvicorn benchmarks.fake_app:app --workers 4
+
+Every worker installs its own fakes but they share ``BENCH_WORKDIR``: one sqlite file
+stands in for Postgres and one vector-store directory for the shared volume.
+"""
+from __future__ import annotations
+
+import os
+
+from benchmarks.fakes import install_fakes
+
+services = install_fakes(
+    chat_latency_s=float(os.getenv("BENCH_CHAT_LATENCY_S", "0")),
+    embed_latency_s=float(os.getenv("BENCH_EMBED_LATENCY_S", "0")),
+    db_latency_s=float(os.getenv("BENCH_DB_LATENCY_S", "0")),
+    workdir=os.environ["BENCH_WORKDIR"],
+)
+
+from backend.api import app  # noqa: E402  (after install_fakes)
+
+__all__ = ["app"]
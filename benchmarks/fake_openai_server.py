@@ -0,0 +1,197 @@
+# benchmarks/fake_openai_server.py
+"""
+Local OpenAI-compatible HTTP server with latency injection.
+
+Serves ``POST /v1/chat/completions`` and ``POST /v1/embeddings`` using the same
+deterministic answers as ``FakeChatModel`` / ``FakeEmbeddings``, so the real
+``ChatOpenAI`` client (timeouts, retries, hedging) can be exercised offline by
+pointing ``OPENAI_BASE_URL`` at it:
+
+    python -m benchmarks.fake_openai_server --port 8400 --latency 0.3 --tail-prob 0.05 --tail-latency 20
+    OPENAI_BASE_URL=http://127.0.0.1:8400/v1 uvicorn backend.api:app
+
+Each request sleeps ``latency`` (plus ``tail-latency`` with probability ``tail-prob``)
+and fails with a 500 with probability ``error-prob``. ``model_latency`` overrides the
+latency for a given model name (e.g. a fast fallback model) and is never slowed by tails.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+_ROLE_TO_MESSAGE = {"system": SystemMessage, "assistant": AIMessage}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        server: FakeOpenAIServer = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model = body.get("model", "")
+
+        server.record(self.path, model)
+        server.sleep(model)
+        if server.rng_uniform() < server.error_prob:
+            return self._send(500, {"error": {"message": "injected failure", "type": "server_error"}})
+
+        if self.path.endswith("/chat/completions"):
+            return self._send(200, server.chat_completion(body))
+        if self.path.endswith("/embeddings"):
+            return self._send(200, server.embeddings(body))
+        self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        out = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已放弃（超时 / hedge 的另一路先返回）
+            pass
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeOpenAIServer:
+    def __init__(
+        self,
+        latency_s: float = 0.0,
+        tail_prob: float = 0.0,
+        tail_latency_s: float = 0.0,
+        error_prob: float = 0.0,
+        model_latency: Optional[Dict[str, float]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency_s = latency_s
+        self.tail_prob = tail_prob
+        self.tail_latency_s = tail_latency_s
+        self.error_prob = error_prob
+        self.model_latency = model_latency or {}
+        self.requests: List[Dict[str, Any]] = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._chat = FakeChatModel()
+        self._embeddings = FakeEmbeddings()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # === Latency / bookkeeping ===
+    def rng_uniform(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def record(self, path: str, model: str) -> None:
+        with self._lock:
+            self.requests.append({"path": path, "model": model, "at": time.time()})
+
+    def sleep(self, model: str) -> None:
+        if model in self.model_latency:
+            delay = self.model_latency[model]
+        else:
+            delay = self.latency_s
+            if self.tail_prob and self.rng_uniform() < self.tail_prob:
+                delay += self.tail_latency_s
+        if delay > 0:
+            time.sleep(delay)
+
+    # === OpenAI payloads ===
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        messages = [
+            _ROLE_TO_MESSAGE.get(m.get("role"), HumanMessage)(content=m.get("content") or "")
+            for m in body.get("messages", [])
+        ]
+        functions = body.get("functions") or [t["function"] for t in body.get("tools") or [] if "function" in t]
+        reply = self._chat._respond(messages, functions=functions or None)
+        message: Dict[str, Any] = {"role": "assistant", "content": reply.content or None}
+        function_call = reply.additional_kwargs.get("function_call")
+        if function_call and body.get("tools"):
+            message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function", "function": function_call}]
+        elif function_call:
+            message["function_call"] = function_call
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = max(1, len(str(reply.content)) // 4)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def embeddings(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input")
+        texts = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        # 客户端可能发 token id 列表，这里只需要稳定的向量
+        texts = [t if isinstance(t, str) else " ".join(map(str, t)) for t in texts]
+        vectors = self._embeddings.embed_documents(texts)
+        return {
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    # === Lifecycle ===
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeOpenAIServer":
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        server.fake = self
+        self._server = server
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tail-prob", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=0.0)
+    parser.add_argument("--error-prob", type=float, default=0.0)
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS")
+    args = parser.parse_args()
+
+    model_latency = {k: float(v) for k, v in (item.split("=", 1) for item in args.model_latency)}
+    server = FakeOpenAIServer(args.latency, args.tail_prob, args.tail_latency, args.error_prob, model_latency)
+    server.start(args.host, args.port)
+    print(f"Fake OpenAI server on {server.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
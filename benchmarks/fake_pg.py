@@ -0,0 +1,233 @@
+# benchmarks/fake_pg.py
+"""
+Local PostgreSQL stand-in for offline benchmarks.
+
+``connect()`` mimics the subset of psycopg2 the backend uses (``%s`` parameters,
+``with conn.cursor() as cur``, ``RETURNING``, ``ON CONFLICT``) on top of a sqlite file,
+translating the few Postgres-only DDL bits (partitioned tables become plain tables).
+Statements autocommit, so ``rollback()`` is best-effort: this is a load-test stand-in,
+not a correctness oracle.
+
+Every connect and every ``execute`` is counted as a database round trip, and an
+optional per-round-trip latency simulates the network distance to Supabase.
+
+To count round trips against a *real* Postgres instead, use ``CountingPsycopg2``.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+_TRANSLATIONS = [
+    (re.compile(r"\bSERIAL\s+PRIMARY\s+KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\bBIGSERIAL\b", re.I), "INTEGER"),
+    (re.compile(r"\bNOW\(\)", re.I), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bJSONB\b", re.I), "TEXT"),
+    (re.compile(r"\bTIMESTAMPTZ\b", re.I), "TIMESTAMP"),
+    (re.compile(r"::\w+"), ""),
+]
+
+
+# 分区表：sqlite 没有分区，父表当普通表用，分区 DDL 变成空语句
+_PARTITION_BY = re.compile(r"\)\s*PARTITION\s+BY\s+RANGE\s*\([^)]*\)", re.I)
+_PARTITION_OF = re.compile(r"^\s*CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS\s+\w+\s+PARTITION\s+OF\b", re.I)
+# 分区表的主键必须包含分区键 (id, created_at)；sqlite 里换回自增 id 主键
+_SERIAL_COLUMN = re.compile(r"\b(\w+)\s+SERIAL\s*,", re.I)
+_COMPOSITE_PK = re.compile(r",\s*PRIMARY\s+KEY\s*\([^)]*\)", re.I)
+
+
+def _translate(sql: str) -> str:
+    if _PARTITION_OF.match(sql):
+        return "SELECT 1"
+    if _PARTITION_BY.search(sql):
+        sql = _PARTITION_BY.sub(")", sql)
+        if _SERIAL_COLUMN.search(sql):
+            sql = _COMPOSITE_PK.sub("", _SERIAL_COLUMN.sub(r"\1 INTEGER PRIMARY KEY AUTOINCREMENT,", sql))
+    for pattern, repl in _TRANSLATIONS:
+        sql = pattern.sub(repl, sql)
+    return sql.replace("%%", "\x00").replace("%s", "?").replace("\x00", "%")
+
+
+class RoundTripCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.queries = 0
+
+    def add(self, connects: int = 0, queries: int = 0) -> None:
+        with self._lock:
+            self.connects += connects
+            self.queries += queries
+
+    @property
+    def round_trips(self) -> int:
+        return self.connects + self.queries
+
+    def reset(self) -> None:
+        with self._lock:
+            self.connects = 0
+            self.queries = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"connects": self.connects, "queries": self.queries, "round_trips": self.round_trips}
+
+
+counter = RoundTripCounter()
+
+
+class _Cursor:
+    def __init__(self, conn: "FakePgConnection"):
+        self._conn = conn
+        self._cur = conn._sqlite.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def execute(self, sql: str, params: Optional[tuple] = None):
+        self._conn._round_trip()
+        self._cur.execute(_translate(sql), tuple(params or ()))
+        return self
+
+    def executemany(self, sql: str, seq):
+        self._conn._round_trip()
+        self._cur.executemany(_translate(sql), [tuple(p) for p in seq])
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size: int = 1):
+        return self._cur.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self) -> None:
+        self._cur.close()
+
+
+class FakePgConnection:
+    def __init__(self, path: str, latency_s: float):
+        self._latency_s = latency_s
+        self._sqlite = sqlite3.connect(
+            path,
+            timeout=30,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # 每条语句自动提交：Postgres 里一个泄漏的连接不会锁住整张表，sqlite 会，
+            # 所以这里不保留跨语句的写事务（commit / rollback 变成空操作）
+            isolation_level=None,
+        )
+        self._sqlite.execute("PRAGMA journal_mode=WAL")
+        self.closed = 0
+        self._round_trip(connect=True)
+
+    def _round_trip(self, connect: bool = False) -> None:
+        counter.add(connects=1 if connect else 0, queries=0 if connect else 1)
+        if self._latency_s:
+            time.sleep(self._latency_s)
+
+    def cursor(self, *args, **kwargs) -> _Cursor:
+        return _Cursor(self)
+
+    def commit(self) -> None:
+        self._sqlite.commit()
+
+    def rollback(self) -> None:
+        self._sqlite.rollback()
+
+    def close(self) -> None:
+        if not self.closed:
+            self._sqlite.close()
+            self.closed = 1
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+class FakePostgres:
+    """Factory installed in place of ``psycopg2.connect``."""
+
+    def __init__(self, path: str, latency_s: float = 0.0):
+        self.path = path
+        self.latency_s = latency_s
+
+    def connect(self, *args: Any, **kwargs: Any) -> FakePgConnection:
+        return FakePgConnection(self.path, self.latency_s)
+
+
+class CountingPsycopg2:
+    """Wrap the real ``psycopg2.connect`` so round trips to a real Postgres are counted too."""
+
+    def __init__(self, real_connect):
+        self._real_connect = real_connect
+
+    def connect(self, *args: Any, **kwargs: Any):
+        conn = self._real_connect(*args, **kwargs)
+        counter.add(connects=1)
+        real_cursor = conn.cursor
+
+        class _CountingCursor:
+            def __init__(self, cur):
+                self._cur = cur
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self._cur.close()
+                return False
+
+            def execute(self, *a, **kw):
+                counter.add(queries=1)
+                return self._cur.execute(*a, **kw)
+
+            def __getattr__(self, name):
+                return getattr(self._cur, name)
+
+        class _ConnProxy:
+            def cursor(self, *a, **kw):
+                return _CountingCursor(real_cursor(*a, **kw))
+
+            def __getattr__(self, name):
+                return getattr(conn, name)
+
+            def __enter__(self):
+                conn.__enter__()
+                return self
+
+            def __exit__(self, *exc):
+                return conn.__exit__(*exc)
+
+        return _ConnProxy()
@@ -0,0 +1,139 @@
+# benchmarks/fake_redis.py
+"""
+Tiny Redis-compatible pub/sub broker (PING, AUTH, SELECT, PUBLISH, SUBSCRIBE) for
+exercising ``INVALIDATION_BUS=redis`` across workers without installing Redis.
+
+    python -m benchmarks.fake_redis --port 6399
+    INVALIDATION_BUS=redis INVALIDATION_URL=redis://127.0.0.1:6399 uvicorn backend.api:app --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import socketserver
+import threading
+import time
+from typing import Dict, List, Set
+
+
+def _bulk(s: str) -> bytes:
+    data = s.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def _array(*items: bytes) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self) -> List[str]:
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError
+        if not line.startswith(b"*"):
+            return line.decode().split()  # inline command
+        parts = []
+        for _ in range(int(line[1:-2])):
+            n = int(self.rfile.readline()[1:-2])
+            parts.append(self.rfile.read(n + 2)[:-2].decode("utf-8"))
+        return parts
+
+    def send(self, data: bytes) -> None:
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def handle(self) -> None:
+        broker: FakeRedis = self.server.broker
+        self.write_lock = threading.Lock()
+        try:
+            while True:
+                cmd = self._read_command()
+                if not cmd:
+                    continue
+                name = cmd[0].upper()
+                if name == "PING":
+                    self.send(b"+PONG\r\n")
+                elif name in ("AUTH", "SELECT", "CLIENT"):
+                    self.send(b"+OK\r\n")
+                elif name == "PUBLISH":
+                    self.send(b":%d\r\n" % broker.publish(cmd[1], cmd[2]))
+                elif name == "SUBSCRIBE":
+                    for i, channel in enumerate(cmd[1:], 1):
+                        broker.subscribe(channel, self)
+                        self.send(_array(_bulk("subscribe"), _bulk(channel), b":%d\r\n" % i))
+                else:
+                    self.send(f"-ERR unknown command '{cmd[0]}'\r\n".encode())
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            broker.unsubscribe_all(self)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeRedis:
+    def __init__(self):
+        self._subscribers: Dict[str, Set[_Handler]] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.published = 0
+
+    def subscribe(self, channel: str, handler: _Handler) -> None:
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(handler)
+
+    def unsubscribe_all(self, handler: _Handler) -> None:
+        with self._lock:
+            for handlers in self._subscribers.values():
+                handlers.discard(handler)
+
+    def publish(self, channel: str, message: str) -> int:
+        with self._lock:
+            handlers = list(self._subscribers.get(channel, ()))
+            self.published += 1
+        frame = _array(_bulk("message"), _bulk(channel), _bulk(message))
+        delivered = 0
+        for handler in handlers:
+            try:
+                handler.send(frame)
+                delivered += 1
+            except OSError:
+                self.unsubscribe_all(handler)
+        return delivered
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeRedis":
+        self._server = _Server((host, port), _Handler)
+        self._server.broker = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}"
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+    broker = FakeRedis().start(args.host, args.port)
+    print(f"Fake Redis pub/sub on {broker.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# benchmarks/fakes.py
+"""
+Deterministic, offline stand-ins for the OpenAI models used by the backend.
+
+``FakeEmbeddings`` hashes words into a fixed-size bag-of-words vector, so texts that
+share words are close together and retrieval results are meaningful without any
+network access. ``FakeChatModel`` answers chat, the extraction chain (OpenAI
+function calling) and the structured-chat agent, and answers RAG prompts extractively
+(best-matching sentence of the context plus the clause it sits under). Both can
+inject latency.
+
+``install_fakes()`` wires them (plus the sqlite Postgres stand-in and the local mail
+sinks) in place of the real services; call it *before* importing ``backend``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, ClassVar, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# 行首的条款编号（"7.2 The Tenant shall ..."）
+_CLAUSE_MARK = re.compile(r"^\s*(\d+\.\d+)\s", re.M)
+_SENTENCE = re.compile(r"\S.*?(?:(?<=[.!?])(?=\s)|\Z)", re.S)
+_READER_STOPWORDS = frozenset(
+    "a an the of to in on at for by and or is are am be do does did can could may my me i "
+    "what who whom how much many when where which why if under with any this that it have has "
+    "must shall should will would there their they our we you your".split()
+)
+
+
+class FakeEmbeddings:
+    """Drop-in replacement for ``OpenAIEmbeddings`` (``embed_documents`` / ``embed_query``)."""
+
+    def __init__(self, dim: int = 384, latency_s: float = 0.0, per_text_latency_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+        self.per_text_latency_s = per_text_latency_s
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "big")
+            vec[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def _sleep(self, n_texts: int) -> None:
+        delay = self.latency_s + self.per_text_latency_s * n_texts
+        if delay > 0:
+            time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        self._sleep(len(texts))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        self.texts_embedded += 1
+        self._sleep(1)
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Drop-in replacement for ``ChatOpenAI`` with deterministic answers."""
+
+    model: str = "fake-chat"
+    temperature: float = 0.0
+    api_key: Any = None
+    latency_s: float = 0.0
+    max_summary_chars: int = 600
+
+    calls: ClassVar[int] = 0
+    _calls_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @classmethod
+    def reset_calls(cls) -> None:
+        with cls._calls_lock:
+            cls.calls = 0
+
+    @staticmethod
+    def _extract(prompt: str) -> Dict[str, Any]:
+        info: Dict[str, Any] = {}
+        rent = re.search(r"rent[^\d$]{0,20}\$?\s*([\d,]+(?:\.\d+)?)", prompt, re.I)
+        if rent:
+            info["monthly_rent"] = float(rent.group(1).replace(",", ""))
+        deposit = re.search(r"deposit[^\d$]{0,20}\$?\s*([\d,]+(?:\.\d+)?)", prompt, re.I)
+        if deposit:
+            info["security_deposit"] = float(deposit.group(1).replace(",", ""))
+        dates = re.findall(r"\d{4}-\d{2}-\d{2}", prompt)
+        if dates:
+            info["lease_start_date"] = dates[0]
+        if len(dates) > 1:
+            info["lease_end_date"] = dates[1]
+        for field, label in (("landlord_name", "Landlord"), ("tenant_name", "Tenant")):
+            m = re.search(label + r":\s*([A-Z][\w .'-]+)", prompt)
+            if m:
+                info[field] = m.group(1).strip()
+        return info
+
+    @staticmethod
+    def _stems(text: str) -> set:
+        words = re.findall(r"\w+", text.lower())
+        return {w[:4] for w in words if w not in _READER_STOPWORDS}
+
+    @classmethod
+    def _answer_from_contract(cls, prompt: str) -> str:
+        """CONTRACT_PROMPT: quote the context sentence sharing most words with the question."""
+        context, _, rest = prompt.split("Contract Text:\n", 1)[1].partition("\n\nQuestion:\n")
+        wanted = cls._stems(rest.split("\n\nAnswer Format", 1)[0])
+        best_score, best_sentence, best_clause = 0, "", None
+        # 片段之间用 context_packer 的分隔符隔开；条款号只在片段内有效，被切掉就引用不到
+        for segment in context.split("\n\n---\n\n"):
+            marks = [(m.start(1), m.group(1)) for m in _CLAUSE_MARK.finditer(segment)]
+            for m in _SENTENCE.finditer(segment):
+                score = len(wanted & cls._stems(m.group(0)))
+                if score > best_score:
+                    clause = None
+                    for pos, number in marks:
+                        if pos < m.end():
+                            clause = number
+                    best_score, best_sentence, best_clause = score, " ".join(m.group(0).split()), clause
+        if not best_sentence:
+            return "The contract text provided does not answer this question."
+        reference = f"Clause {best_clause}" if best_clause else "No clause number in the provided text"
+        return f"1) {best_sentence}\n2) {reference}\n3) \"{best_sentence}\""
+
+    def _respond(self, messages: List[BaseMessage], **kwargs: Any) -> AIMessage:
+        prompt = "\n".join(str(m.content) for m in messages)
+        functions = kwargs.get("functions")
+        if functions:
+            # create_extraction_chain → OpenAI function calling
+            name = functions[0]["name"]
+            args = json.dumps({"info": [self._extract(prompt)]})
+            return AIMessage(content="", additional_kwargs={"function_call": {"name": name, "arguments": args}})
+
+        if 'Valid "action" values' in prompt:
+            # structured-chat ReAct agent: call the tool once, then give the final answer
+            last = str(messages[-1].content)
+            observation = re.findall(r"Observation:\s*(.*)", last)
+            if observation:
+                blob = {"action": "Final Answer", "action_input": observation[-1].strip()}
+            else:
+                tool = "calculate_rent" if "calculate_rent" in prompt else "Final Answer"
+                blob = {"action": tool, "action_input": last.split("\n", 1)[0]}
+            return AIMessage(content="Action:\n```\n" + json.dumps(blob) + "\n```")
+
+        if "Contract Text:\n" in prompt and "\n\nQuestion:\n" in prompt:
+            return AIMessage(content=self._answer_from_contract(prompt))
+
+        if "Progressively summarize" in prompt:
+            # langchain SUMMARY_PROMPT：旧摘要 + 每行新对话的前几个词，长度封顶（像真实模型一样简短）
+            tail = prompt.rsplit("Current summary:\n", 1)[-1]
+            previous, _, rest = tail.partition("\n\nNew lines of conversation:\n")
+            new_lines = rest.split("\n\nNew summary:", 1)[0].splitlines()
+            notes = [" ".join(line.split()[:8]) for line in new_lines if line.strip()]
+            summary = " ".join([previous.strip()] + notes).strip()
+            return AIMessage(content=summary[-self.max_summary_chars:])
+
+        question = str(messages[-1].content).strip().splitlines()
+        tail = question[-1] if question else ""
+        return AIMessage(content=f"(fake answer) {tail[:200]}")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        with FakeChatModel._calls_lock:
+            FakeChatModel.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        message = self._respond(messages, **kwargs)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = max(1, len(str(message.content)) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": usage, "model_name": self.model},
+        )
+
+
+class FakeServices:
+    """Handles returned by ``install_fakes`` (sinks, counters, temp dirs)."""
+
+    def __init__(self, workdir: str, db, smtp_sink, http_sink, embeddings_cls):
+        self.workdir = workdir
+        self.db = db
+        self.smtp_sink = smtp_sink
+        self.http_sink = http_sink
+        self.embeddings_cls = embeddings_cls
+
+    def stop(self) -> None:
+        self.smtp_sink.stop()
+        self.http_sink.stop()
+
+
+def install_fakes(
+    chat_latency_s: float = 0.0,
+    embed_latency_s: float = 0.0,
+    db_latency_s: float = 0.0,
+    mail_latency_s: float = 0.0,
+    workdir: Optional[str] = None,
+    database_url: Optional[str] = None,
+    fake_models: bool = True,
+) -> FakeServices:
+    """
+    Replace OpenAI, Postgres, SMTP and Resend with local fakes.
+
+    Must run before ``backend.llm3_new`` is imported. With ``database_url`` set, a real
+    Postgres is used (round trips are still counted) instead of the sqlite stand-in.
+    With ``fake_models=False`` the real OpenAI models are kept (``OPENAI_API_KEY`` must
+    be set) and only the database and mail services are replaced.
+    """
+    import langchain_openai
+    import psycopg2
+
+    from benchmarks.fake_pg import CountingPsycopg2, FakePostgres
+    from benchmarks.mail_sink import HttpSink, SmtpSink
+
+    workdir = workdir or tempfile.mkdtemp(prefix="bench_")
+    smtp_sink = SmtpSink(latency_s=mail_latency_s).start()
+    http_sink = HttpSink(latency_s=mail_latency_s).start()
+
+    if database_url:
+        db = CountingPsycopg2(psycopg2.connect)
+    else:
+        db = FakePostgres(os.path.join(workdir, "bench.sqlite3"), latency_s=db_latency_s)
+        database_url = "postgresql://bench@localhost/bench"
+    psycopg2.connect = db.connect
+
+    class _Chat(FakeChatModel):
+        latency_s: float = chat_latency_s
+
+    class _Embeddings(FakeEmbeddings):
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__(latency_s=embed_latency_s)
+
+    if fake_models:
+        langchain_openai.ChatOpenAI = _Chat
+        langchain_openai.OpenAIEmbeddings = _Embeddings
+        os.environ["OPENAI_API_KEY"] = "sk-bench"
+
+    os.environ.update({
+        "DATABASE_URL": database_url,
+        "EMBEDDINGS_BACKEND": "OPENAI",
+        "VECTOR_STORE_DIR": os.path.join(workdir, "vector_stores"),
+        "RESEND_API_KEY": "re_bench",
+        "RESEND_API_URL": http_sink.url,
+        "EMAIL_RECEIVER": "agent@bench.local",
+        "EMAIL_SENDER": "bot@bench.local",
+        "EMAIL_PASSWORD": "bench",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_sink.port),
+        "SMTP_STARTTLS": "false",
+    })
+    return FakeServices(workdir, db, smtp_sink, http_sink, _Embeddings)
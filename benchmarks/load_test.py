@@ -0,0 +1,285 @@
+# benchmarks/load_test.py
+"""
+Offline load test for the FastAPI app: /chat, /upload, /maintenance and the reminder jobs.
+
+OpenAI, Postgres, SMTP and Resend are replaced by local fakes (see ``benchmarks/fakes.py``),
+so a run costs nothing and is reproducible. For each scenario it reports throughput,
+p50/p95/p99 latency, DB round trips per request and LLM calls per request.
+
+    python -m benchmarks.load_test --concurrency 16 --requests 400 --chat-latency 0.3
+    python -m benchmarks.load_test --json-out bench.json --baseline benchmarks/baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.fakes import FakeChatModel, install_fakes
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTRACT_PDF = os.path.join(REPO_ROOT, "test_contract.pdf")
+
+CHAT_MESSAGES = [
+    "What does the contract say about the deposit refund?",   # faq (pre-generated at upload)
+    "Can I terminate the lease early?",                        # faq (pre-generated at upload)
+    "How much is $2500 for 15 months?",                        # calc (no LLM call)
+    "Hello, how are you today?",                               # general_chat
+    "What is my repair status?",                               # status
+    "My kitchen sink is broken",                               # maintenance
+    "Thanks for your help!",                                   # general_chat
+]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _summarise(name: str, latencies: List[float], errors: int, wall_s: float,
+               round_trips: int, llm_calls: int, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    n = len(latencies) + errors
+    row = {
+        "scenario": name,
+        "requests": n,
+        "errors": errors,
+        "throughput_rps": round(n / wall_s, 2) if wall_s else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else 0.0,
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "db_round_trips_per_request": round(round_trips / n, 2) if n else 0.0,
+        "llm_calls_per_request": round(llm_calls / n, 2) if n else 0.0,
+    }
+    row.update(extra or {})
+    return row
+
+
+async def _drive(client, n_requests: int, concurrency: int,
+                 make_request: Callable[[int], Any]) -> tuple:
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(n_requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                resp = await make_request(i)
+                if resp.status_code >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_scenarios(args, services) -> List[Dict[str, Any]]:
+    import httpx
+
+    from backend.api import app
+    from benchmarks.fake_pg import counter
+
+    rng = random.Random(args.seed)
+    tenants = [f"tenant{i}@bench.local" for i in range(args.tenants)]
+    with open(CONTRACT_PDF, "rb") as f:
+        pdf_bytes = f.read()
+
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for tenant in tenants:
+            await client.post("/register", data={"tenant_id": tenant, "user_name": tenant.split("@")[0]})
+
+        def measure(name: str):
+            counter.reset()
+            FakeChatModel.reset_calls()
+            return name
+
+        scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+
+        if "upload" in scenarios:
+            measure("upload")
+
+            async def upload(i: int):
+                return await client.post(
+                    "/upload",
+                    files={"file": ("contract.pdf", pdf_bytes, "application/pdf")},
+                    data={"tenant_id": tenants[i % len(tenants)]},
+                )
+
+            lat, err, wall = await _drive(client, max(args.tenants, args.requests // 10), args.concurrency, upload)
+            # FAQ 答案在后台生成：等它跑完再统计，DB / LLM 次数按上传计入，延迟只算请求本身
+            from backend.llm3_new import contract_faq
+            await asyncio.to_thread(contract_faq.wait_idle)
+            results.append(_summarise("upload", lat, err, wall, counter.round_trips, FakeChatModel.calls))
+
+        if "chat" in scenarios:
+            measure("chat")
+
+            async def chat(i: int):
+                return await client.post("/chat", data={
+                    "tenant_id": rng.choice(tenants),
+                    "message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)],
+                })
+
+            lat, err, wall = await _drive(client, args.requests, args.concurrency, chat)
+            results.append(_summarise("chat", lat, err, wall, counter.round_trips, FakeChatModel.calls))
+
+        if "maintenance" in scenarios:
+            measure("maintenance")
+
+            async def maintenance(i: int):
+                return await client.post("/maintenance", data={
+                    "tenant_id": rng.choice(tenants),
+                    "location": "Kitchen",
+                    "description": f"Leaking tap #{i}",
+                })
+
+            lat, err, wall = await _drive(client, args.requests, args.concurrency, maintenance)
+            results.append(_summarise("maintenance", lat, err, wall, counter.round_trips, FakeChatModel.calls))
+
+    if "reminders" in scenarios:
+        results.extend(run_reminder_jobs(tenants, services))
+    return results
+
+
+def run_reminder_jobs(tenants: List[str], services) -> List[Dict[str, Any]]:
+    import datetime
+
+    import psycopg2
+
+    from backend import llm3_new, send_rent_reminders
+    from benchmarks.fake_pg import counter
+
+    # 让所有租户今天都落在提醒窗口里
+    today = datetime.date.today()
+    target = today + datetime.timedelta(days=5)
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    with conn.cursor() as cur:
+        for tenant in tenants:
+            cur.execute(
+                "UPDATE users SET rent_due_day = %s, monthly_rent = %s WHERE tenant_id = %s",
+                (target.day, 2500, tenant),
+            )
+    conn.commit()
+    conn.close()
+
+    rows = []
+    for name, job, sink in (
+        ("reminders_smtp", send_rent_reminders.run_rent_reminders, services.smtp_sink),
+        # 同一天再跑一次：reminder_log 里都已是 sent，不应再发邮件
+        ("reminders_smtp_rerun", send_rent_reminders.run_rent_reminders, services.smtp_sink),
+        ("reminders_resend", lambda: llm3_new.run_proactive_reminders(days_in_advance=5), services.http_sink),
+    ):
+        counter.reset()
+        before = len(sink.messages)
+        start = time.perf_counter()
+        job()
+        wall = time.perf_counter() - start
+        sent = len(sink.messages) - before
+        rows.append(_summarise(
+            name, [wall], 0, wall, counter.round_trips, 0,
+            extra={"emails_sent": sent, "db_round_trips_per_email": round(counter.round_trips / sent, 2) if sent else 0.0},
+        ))
+    return rows
+
+
+# 与机器无关的指标，CI 上默认只用它们做门禁；延迟类指标需要 --gate-latency
+STRUCTURAL_KEYS = (("db_round_trips_per_request", True), ("llm_calls_per_request", True))
+LATENCY_KEYS = (("p95_ms", True), ("throughput_rps", False))
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline_path: str, max_regression: float,
+                        gate_latency: bool = False) -> List[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {row["scenario"]: row for row in json.load(f)}
+    keys = STRUCTURAL_KEYS + (LATENCY_KEYS if gate_latency else ())
+    failures = []
+    for row in results:
+        base = baseline.get(row["scenario"])
+        if not base:
+            continue
+        for key, higher_is_worse in keys:
+            old, new = base.get(key), row.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if higher_is_worse else (old - new) / old
+            if change > max_regression:
+                failures.append(f"{row['scenario']}.{key}: {old} → {new} ({change:+.0%})")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="upload,chat,maintenance,reminders")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="Fake LLM latency (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Fake embeddings latency (s)")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Per-round-trip DB latency (s)")
+    parser.add_argument("--mail-latency", type=float, default=0.0)
+    parser.add_argument("--database-url", help="Use a real Postgres instead of the sqlite stand-in")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json-out")
+    parser.add_argument("--baseline", help="Previous --json-out to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--gate-latency", action="store_true",
+                        help="Also fail on p95 / throughput regressions (same machine only)")
+    args = parser.parse_args()
+
+    services = install_fakes(
+        chat_latency_s=args.chat_latency,
+        embed_latency_s=args.embed_latency,
+        db_latency_s=args.db_latency,
+        mail_latency_s=args.mail_latency,
+        database_url=args.database_url,
+    )
+    try:
+        results = asyncio.run(run_scenarios(args, services))
+    finally:
+        services.stop()
+
+    columns: List[str] = []
+    for row in results:
+        columns.extend(c for c in row if c not in columns)
+    print("\n" + " | ".join(columns))
+    for row in results:
+        print(" | ".join(str(row.get(c, "")) for c in columns))
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        failures = compare_to_baseline(results, args.baseline, args.max_regression, args.gate_latency)
+        if failures:
+            print("\n❌ Performance regression against baseline:")
+            for line in failures:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\n✅ No regression against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# benchmarks/mail_sink.py
+"""
+Local mail sinks so reminder / feedback emails never leave the machine.
+
+- ``SmtpSink``: minimal SMTP server (EHLO, AUTH, MAIL, RCPT, DATA, QUIT) for
+  ``send_rent_reminders.py`` (point ``SMTP_SERVER`` / ``SMTP_PORT`` at it and set
+  ``SMTP_STARTTLS=false``).
+- ``HttpSink``: accepts the Resend API ``POST /emails`` calls made by ``llm3_new``
+  (point ``RESEND_API_URL`` at it).
+
+Both record what they received in ``.messages`` and can inject latency.
+"""
+from __future__ import annotations
+
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+
+    def handle(self) -> None:
+        sink: SmtpSink = self.server.sink
+        self._reply("220 bench-smtp ready")
+        mail_from, rcpt_to = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250-bench-smtp")
+                self._reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                self._reply("235 Authentication successful")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = line[10:].strip(" <>"), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(line[8:].strip(" <>"))
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    body.append(data_line.decode("utf-8", "replace"))
+                if sink.latency_s:
+                    time.sleep(sink.latency_s)
+                sink.record({"from": mail_from, "to": rcpt_to, "data": "".join(body)})
+                self._reply("250 OK: queued")
+            elif verb == "RSET":
+                mail_from, rcpt_to = None, []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _Sink:
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.messages: List[dict] = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def record(self, message: dict) -> None:
+        with self._lock:
+            self.messages.append(message)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def _serve(self, server) -> "_Sink":
+        server.sink = self
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class SmtpSink(_Sink):
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "SmtpSink":
+        return self._serve(_ThreadingTCPServer((host, port), _SmtpHandler))
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        sink: HttpSink = self.server.sink
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", "replace")
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = {"raw": body}
+        if sink.latency_s:
+            time.sleep(sink.latency_s)
+        sink.record({"path": self.path, "payload": payload})
+        out = json.dumps({"id": f"bench-{len(sink.messages)}"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class HttpSink(_Sink):
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "HttpSink":
+        server = ThreadingHTTPServer((host, port), _HttpHandler)
+        server.daemon_threads = True
+        return self._serve(server)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/emails"
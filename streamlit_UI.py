@@ -1,5 +1,9 @@
+import os
+import uuid
+
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 
 # ========== Streamlit page config ==========
 st.set_page_config(
@@ -9,12 +13,37 @@ st.set_page_config(
 )
 
 # ========== Backend API endpoints ==========
-API_BASE = "https://group14-1.onrender.com"
+API_BASE = os.getenv("API_BASE", "https://group14-1.onrender.com")
 API_CHAT_URL = f"{API_BASE}/chat"
 API_USER_URL = f"{API_BASE}/user"
 API_REGISTER_URL = f"{API_BASE}/register"
 API_UPLOAD_URL = f"{API_BASE}/upload"
 API_MAINTENANCE_URL = f"{API_BASE}/maintenance"
+CHAT_HISTORY_URL = f"{API_BASE}/chat_history"
+
+# Messages rendered at first, and added per "Load older messages" click
+HISTORY_PAGE_SIZE = 20
+
+
+# ========== HTTP session ==========
+@st.cache_resource
+def get_http_adapter():
+    """Connection pool shared by all users: keep-alive connections survive reruns, no new TCP/TLS handshake per request."""
+    return HTTPAdapter(pool_connections=4, pool_maxsize=16)
+
+
+def get_http_session():
+    """One ``requests.Session`` per browser session (cookies / headers are not shared between users), on the shared pool."""
+    if "http_session" not in st.session_state:
+        session = requests.Session()
+        adapter = get_http_adapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        st.session_state.http_session = session
+    return st.session_state.http_session
+
+
+http = get_http_session()
 
 # ========== Initialize session_state ==========
 if "messages" not in st.session_state:
@@ -41,6 +70,17 @@ if "pdf_uploaded" not in st.session_state:
 if "last_uploaded_filename" not in st.session_state:
     st.session_state.last_uploaded_filename = None
 
+# Cursor for the next older history page (None = nothing older on the server)
+if "history_before" not in st.session_state:
+    st.session_state.history_before = None
+
+if "visible_messages" not in st.session_state:
+    st.session_state.visible_messages = HISTORY_PAGE_SIZE
+
+# The one assistant message whose feedback form is open
+if "feedback_for" not in st.session_state:
+    st.session_state.feedback_for = None
+
 
 # ========== Login / Register page ==========
 def show_login_page():
@@ -58,7 +98,7 @@ def show_login_page():
         if st.button("Login"):
             if email:
                 try:
-                    resp = requests.get(API_USER_URL, params={"email": email})
+                    resp = http.get(API_USER_URL, params={"email": email})
                     if resp.status_code == 200 and "user_id" in resp.json():
                         st.session_state.user_info = resp.json()
                         st.session_state.logged_in = True
@@ -75,7 +115,7 @@ def show_login_page():
             if name and email:
                 payload = {"tenant_id": email, "user_name": name}
                 try:
-                    r = requests.post(API_REGISTER_URL, data=payload)
+                    r = http.post(API_REGISTER_URL, data=payload)
                     if r.status_code == 200:
                         st.session_state.logged_in = True
                         st.session_state.user_info = {"user_id": email, "name": name}
@@ -92,18 +132,27 @@ if not st.session_state.logged_in:
     show_login_page()
     st.stop()
 
-# ========== After login: load chat history once (Correct S3) ==========
-CHAT_HISTORY_URL = f"{API_BASE}/chat_history"
+# ========== After login: load the latest history page once (Correct S3) ==========
+def fetch_history_page(user_id, before=None):
+    """Latest HISTORY_PAGE_SIZE messages older than ``before``: (messages, next cursor)."""
+    params = {"limit": HISTORY_PAGE_SIZE}
+    if before:
+        params["before"] = before
+    res = http.get(f"{CHAT_HISTORY_URL}/{user_id}", params=params)
+    if res.status_code != 200:
+        return [], before
+    data = res.json()
+    history = data.get("history", [])
+    return (history if isinstance(history, list) else []), data.get("next_before")
+
 
 if not st.session_state.history_loaded:
     user_id = st.session_state.user_info.get("user_id")
     if user_id:
         try:
-            res = requests.get(f"{CHAT_HISTORY_URL}/{user_id}")
-            if res.status_code == 200:
-                history = res.json().get("history", [])
-                if isinstance(history, list):
-                    st.session_state.messages = history
+            history, st.session_state.history_before = fetch_history_page(user_id)
+            st.session_state.messages = history
+            st.session_state.visible_messages = HISTORY_PAGE_SIZE
         except Exception as e:
             print("⚠️ Failed to load chat history:", e)
 
@@ -140,7 +189,7 @@ with st.sidebar:
             }
             data = {"tenant_id": st.session_state.user_info.get("user_id")}
             try:
-                r = requests.post(API_UPLOAD_URL, files=files, data=data)
+                r = http.post(API_UPLOAD_URL, files=files, data=data)
                 if r.status_code == 200 and r.json().get("success"):
                     st.session_state.summary_data = r.json().get("summary")
                     st.session_state.pdf_uploaded = True
@@ -154,6 +203,8 @@ with st.sidebar:
     st.markdown("---")
     if st.button("Clear chat"):
         st.session_state.messages = []
+        st.session_state.history_before = None
+        st.session_state.visible_messages = HISTORY_PAGE_SIZE
         st.session_state.awaiting_maintenance_form = False
         st.rerun()
 
@@ -162,68 +213,92 @@ if st.session_state.summary_data:
     with st.expander("📄 Contract Summary"):
         st.json(st.session_state.summary_data)
 
-# ========== Chat history display ==========
-import uuid
-
 # ========== Chat history display ==========
 st.markdown("### 💬 Chat History")
 
-for msg in st.session_state.messages:
+messages = st.session_state.messages
+hidden = len(messages) - st.session_state.visible_messages
 
-    role = msg.get("role", "assistant")
-    content = msg.get("content", "")
+# Only the latest messages are rendered; older ones come from memory first, then the history API
+if hidden > 0 or st.session_state.history_before:
+    if st.button("⬆️ Load older messages"):
+        if hidden < HISTORY_PAGE_SIZE and st.session_state.history_before:
+            try:
+                older, st.session_state.history_before = fetch_history_page(
+                    st.session_state.user_info.get("user_id"), st.session_state.history_before
+                )
+                st.session_state.messages = older + messages
+            except Exception as e:
+                st.error(f"Failed to load older messages: {e}")
+        st.session_state.visible_messages += HISTORY_PAGE_SIZE
+        st.rerun()
 
-    # 每条消息生成一个真正唯一的 key（uuid）
-    uid = msg.get("uid") or str(uuid.uuid4())
-    msg["uid"] = uid   # 保存回 session_state 防止再次生成不同 uuid
 
-    label = "👤 User" if role == "user" else "🤖 Assistant"
-    st.markdown(f"**{label}:** {content}")
+def render_feedback_form(msg, uid, content):
+    """Rating widgets for one reply, created only after the user opens them."""
+    with st.container(border=True):
+        rating = st.radio(
+            "Rate this reply:",
+            ["👍 Good", "👎 Bad"],
+            key=f"rating_{uid}",  # 不会重复
+            horizontal=True,
+        )
+
+        comment = ""
+        if rating == "👎 Bad":
+            comment = st.text_area(
+                "Tell us what went wrong:",
+                key=f"comment_{uid}",  # 不会重复
+            )
 
-    # === Feedback only for assistant messages ===
-    if role == "assistant":
+        if st.button("Submit Feedback", key=f"feedback_btn_{uid}"):
 
-        with st.expander(f"Feedback for this reply"):
+            # 找上一条 user 消息作为 query
+            # 因为你不能再依赖 idx，这里用消息顺序查找
+            user_query = ""
+            messages = st.session_state.messages
+            pos = messages.index(msg)
+            if pos > 0 and messages[pos - 1]["role"] == "user":
+                user_query = messages[pos - 1]["content"]
 
-            rating = st.radio(
-                "Rate this reply:",
-                ["👍 Good", "👎 Bad"],
-                key=f"rating_{uid}",  # 不会重复
-            )
+            payload = {
+                "tenant_id": st.session_state.user_info.get("user_id"),
+                "query": user_query,
+                "response": content,
+                "rating": -1 if rating == "👎 Bad" else 1,
+                "comment": comment,
+            }
 
-            comment = ""
-            if rating == "👎 Bad":
-                comment = st.text_area(
-                    "Tell us what went wrong:",
-                    key=f"comment_{uid}",  # 不会重复
-                )
+            try:
+                r = http.post(API_BASE + "/feedback", data=payload)
+                if r.status_code == 200:
+                    st.success("Feedback submitted!")
+                    st.session_state.feedback_for = None
+                else:
+                    st.error(f"Failed to submit feedback. Code: {r.status_code}")
+            except Exception as e:
+                st.error(f"Error submitting feedback: {e}")
 
-            if st.button("Submit Feedback", key=f"feedback_btn_{uid}"):
 
-                # 找上一条 user 消息作为 query
-                # 因为你不能再依赖 idx，这里用消息顺序查找
-                user_query = ""
-                messages = st.session_state.messages
-                pos = messages.index(msg)
-                if pos > 0 and messages[pos - 1]["role"] == "user":
-                    user_query = messages[pos - 1]["content"]
+for msg in messages[-st.session_state.visible_messages:]:
 
-                payload = {
-                    "tenant_id": st.session_state.user_info.get("user_id"),
-                    "query": user_query,
-                    "response": content,
-                    "rating": -1 if rating == "👎 Bad" else 1,
-                    "comment": comment,
-                }
+    role = msg.get("role", "assistant")
+    content = msg.get("content", "")
 
-                try:
-                    r = requests.post(API_BASE + "/feedback", data=payload)
-                    if r.status_code == 200:
-                        st.success("Feedback submitted!")
-                    else:
-                        st.error(f"Failed to submit feedback. Code: {r.status_code}")
-                except Exception as e:
-                    st.error(f"Error submitting feedback: {e}")
+    # 每条消息一个稳定唯一的 key：服务器消息用 id，本地新消息用 uuid
+    uid = msg.get("uid") or (f"db{msg['id']}" if msg.get("id") is not None else str(uuid.uuid4()))
+    msg["uid"] = uid   # 保存回 session_state 防止再次生成不同 uuid
+
+    label = "👤 User" if role == "user" else "🤖 Assistant"
+    st.markdown(f"**{label}:** {content}")
+
+    # === Feedback only for assistant messages: one small button, the form opens on click ===
+    if role == "assistant" and content != "Thinking...":
+        if st.session_state.feedback_for == uid:
+            render_feedback_form(msg, uid, content)
+        elif st.button("Rate this reply", key=f"feedback_open_{uid}", type="tertiary"):
+            st.session_state.feedback_for = uid
+            st.rerun()
 
 
 # ========== User input ==========
@@ -245,7 +320,7 @@ if st.session_state.messages and st.session_state.messages[-1]["content"] == "Th
     }
 
     try:
-        res = requests.post(API_CHAT_URL, data=payload)
+        res = http.post(API_CHAT_URL, data=payload)
         if res.status_code == 200:
             data = res.json()
             ai_reply = data.get("reply", "No reply from backend.")
@@ -278,7 +353,7 @@ if st.session_state.awaiting_maintenance_form:
                 "description": description,
             }
             try:
-                r = requests.post(API_MAINTENANCE_URL, data=data)
+                r = http.post(API_MAINTENANCE_URL, data=data)
                 if r.status_code == 200:
                     st.success("Maintenance request submitted!")
                     st.session_state.awaiting_maintenance_form = False